@@ -1,20 +1,51 @@
+from services.startup import StartupReport
+
+# Time every import and initializer below; reported at /api/startup/stats
+startup = StartupReport()
+startup.track_imports()
+
 import os
 import json
-import base64
+import hashlib
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, File, UploadFile, Form, Request
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi import FastAPI, WebSocket, HTTPException, File, UploadFile, Form, Request, Response, Header
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import httpx
+from starlette.background import BackgroundTask
 import asyncio
 import uuid
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 import logging
 from dotenv import load_dotenv
-from openai import AzureOpenAI
 from models.profile_model import ProfileModel
+from services.profile_registry import ProfileRegistry, ProfileNotFound
+from services.upstream_client import UpstreamClient
+from services.resilience import RetryPolicy, CircuitOpenError, RateLimitExceeded
+from services.endpoint_pool import Endpoint, EndpointPool, NoEndpointAvailable, load_endpoints_file
+from services.tokenizer import count_tokens, load_encoding, IMAGE_TOKENS_ESTIMATE
+from services.chat_stream import iter_chat_deltas, format_sse
+from services.image_generation import ImageGenerator, ImageGenerationQueueFull
+from services.image_jobs import ImageJobQueue, ImageJobQueueFull
+from services.image_store import ImageStore, ImageFetchError
+from services.static_assets import StaticAssets
+from services.page_cache import PageCache
+from services.vision_batch import VisionTask, group_tasks, pack_tasks, build_packed_content, parse_packed_reply, run_calls
+from services.session_store import SessionManager
+from services.session_backends import SQLiteSessionBackend, JournalSessionBackend
+from services.history_window import HistoryWindow
+from services.response_cache import ResponseCache
+from services.single_flight import SingleFlight
+from services.admission import AdmissionController, AdmissionRejected
+from services.websocket_chat import WebSocketChatSession
+from services.connection_manager import ConnectionManager
+from services.metrics import MetricsRegistry, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from services.image_upload import (
+    UploadSizeLimitMiddleware, UploadTooLarge, UnsupportedImageFormat,
+    read_upload, prepare_image, build_data_url
+)
+
+startup.stop_tracking_imports()
 
 # Load environment variables
 load_dotenv()
@@ -26,9 +57,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def warmup_steps():
+    """Startup work done before the app reports ready, so first requests don't pay for it"""
+    async def render_prompt():
+        # Load the tokenizer off the event loop before the default profile's prompt is counted
+        await asyncio.to_thread(load_encoding)
+        await profiles.start()
+
+    steps = {
+        "static_assets": static_assets.start,
+        "templates": lambda: asyncio.to_thread(lambda: get_templates().get_template("index.html")),
+        "prompt": render_prompt,
+    }
+    if UPSTREAM_PREWARM:
+        steps["upstream_connections"] = lambda: upstream_client.warm_up(timeout=UPSTREAM_CONNECT_TIMEOUT)
+    if image_store:
+        steps["image_store"] = image_store.start
+    if image_generator:
+        steps["image_clients"] = lambda: asyncio.to_thread(image_generator.create_clients)
+    return steps
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop app-lifetime resources"""
+    # Warm up in the background: /health answers at once, /ready once this is done
+    warmup = asyncio.ensure_future(startup.warm_up(warmup_steps()))
+    yield
+    warmup.cancel()
+    await profiles.close()
+    await image_jobs.close()
+    if image_store:
+        await image_store.close()
+    await upstream_client.close()
+    if image_generator:
+        await image_generator.close()
+    session_manager.close()
+
 # Initialize FastAPI app
 app_title = os.getenv("APP_TITLE", "Multimodal AI Assistant")
-app = FastAPI(title=app_title)
+app = FastAPI(title=app_title, lifespan=lifespan)
 
 # CORS settings
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "*").split(",") if os.getenv("ALLOWED_ORIGINS") else ["*"]
@@ -42,14 +109,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Mount static files; fingerprinted, precompressed variants are built on startup
+static_assets = StaticAssets("static", optimize=os.getenv("STATIC_OPTIMIZE", "true").lower() == "true")
+app.mount("/static", static_assets, name="static")
+
+# Jinja2 templates, loaded on first use
+templates = None
 
-# Setup Jinja2 templates
-templates = Jinja2Templates(directory="templates")
+def get_templates():
+    """Get the Jinja2 templates, importing Jinja2 on first use"""
+    global templates
+    if templates is None:
+        from fastapi.templating import Jinja2Templates
 
-# Load profile model
-profile_model = ProfileModel("models/default_profile.json")
+        templates = Jinja2Templates(directory="templates")
+        templates.env.globals["asset_url"] = static_assets.url
+    return templates
 
 # Load configuration from environment variables
 API_KEY = os.getenv("LLM_API_KEY")
@@ -59,6 +134,17 @@ TEXT_MODEL = os.getenv("TEXT_MODEL", "gpt-4o")
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "500"))
 REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "30.0"))
 VISION_REQUEST_TIMEOUT = float(os.getenv("VISION_REQUEST_TIMEOUT", "60.0"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+VISION_IMAGE_MAX_SIDE = int(os.getenv("VISION_IMAGE_MAX_SIDE", "2048"))
+VISION_IMAGE_SHORT_SIDE = int(os.getenv("VISION_IMAGE_SHORT_SIDE", "768"))
+
+# Batch image analysis
+VISION_BATCH_MAX_FILES = int(os.getenv("VISION_BATCH_MAX_FILES", "20"))
+VISION_BATCH_MAX_ITEMS = int(os.getenv("VISION_BATCH_MAX_ITEMS", "60"))  # Files x prompts
+VISION_BATCH_MAX_BYTES = int(os.getenv("VISION_BATCH_MAX_BYTES", str(100 * 1024 * 1024)))
+VISION_BATCH_IMAGES_PER_CALL = int(os.getenv("VISION_BATCH_IMAGES_PER_CALL", "4"))
+VISION_BATCH_TASKS_PER_CALL = int(os.getenv("VISION_BATCH_TASKS_PER_CALL", "8"))
+VISION_BATCH_CONCURRENCY = int(os.getenv("VISION_BATCH_CONCURRENCY", "4"))
 SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
 SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
 DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
@@ -68,85 +154,340 @@ DALLE_ENDPOINT = os.getenv("DALLE_ENDPOINT")
 DALLE_API_VERSION = os.getenv("DALLE_API_VERSION", "2024-04-01-preview")
 DALLE_DEPLOYMENT = os.getenv("DALLE_DEPLOYMENT", "dall-e-3")
 DALLE_API_KEY = os.getenv("DALLE_API_KEY", API_KEY)  # Use same key if not specified
+DALLE_MAX_CONCURRENCY = int(os.getenv("DALLE_MAX_CONCURRENCY", "4"))
+DALLE_MAX_QUEUE = int(os.getenv("DALLE_MAX_QUEUE", "16"))
+DALLE_REQUEST_TIMEOUT = float(os.getenv("DALLE_REQUEST_TIMEOUT", "90.0"))
+
+# Background image generation jobs
+IMAGE_JOB_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", str(DALLE_MAX_CONCURRENCY)))
+IMAGE_JOB_MAX_QUEUED = int(os.getenv("IMAGE_JOB_MAX_QUEUED", "256"))
+IMAGE_JOB_MAX_QUEUED_PER_SESSION = int(os.getenv("IMAGE_JOB_MAX_QUEUED_PER_SESSION", "16"))
+IMAGE_JOB_RESULT_TTL = float(os.getenv("IMAGE_JOB_RESULT_TTL", "600"))
+IMAGE_JOB_MAX_WAIT = float(os.getenv("IMAGE_JOB_MAX_WAIT", "30.0"))  # Longest long-poll on the status endpoint
+
+# Local store of generated images
+IMAGE_STORE_ENABLED = os.getenv("IMAGE_STORE_ENABLED", "true").lower() == "true"
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "data/images")
+IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_STORE_THUMBNAIL_WIDTHS = [int(w) for w in os.getenv("IMAGE_STORE_THUMBNAIL_WIDTHS", "256,512").split(",") if w.strip()]
+IMAGE_STORE_FETCH_TIMEOUT = float(os.getenv("IMAGE_STORE_FETCH_TIMEOUT", "30.0"))
+
+# Assistant profiles
+PROFILES_DIR = os.getenv("PROFILES_DIR", "models")
+DEFAULT_PROFILE = os.getenv("DEFAULT_PROFILE", "default_profile")
+PROFILE_RELOAD_INTERVAL = float(os.getenv("PROFILE_RELOAD_INTERVAL", "2.0"))  # 0 = no hot reload
+
+# Session store configuration
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "20"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()  # "memory", "sqlite" or "journal"
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "data/sessions.db")
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "0.05"))
+SESSION_FLUSH_BATCH = int(os.getenv("SESSION_FLUSH_BATCH", "256"))
+SESSION_JOURNAL_DIR = os.getenv("SESSION_JOURNAL_DIR", "data/journal")
+SESSION_JOURNAL_SEGMENT_BYTES = int(os.getenv("SESSION_JOURNAL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+SESSION_JOURNAL_SNAPSHOT_INTERVAL = float(os.getenv("SESSION_JOURNAL_SNAPSHOT_INTERVAL", "300"))  # 0 = only on shutdown
+
+# Prompt token budget configuration
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+HISTORY_SUMMARIZE = os.getenv("HISTORY_SUMMARIZE", "false").lower() == "true"
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "200"))
+
+# Response cache configuration
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+
+# Coalesce concurrent identical upstream calls
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# Admission control: concurrency limits and a fair queue for upstream calls
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+ADMISSION_MAX_PER_SESSION = int(os.getenv("ADMISSION_MAX_PER_SESSION", "4"))
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "256"))
+ADMISSION_MAX_QUEUED_PER_SESSION = int(os.getenv("ADMISSION_MAX_QUEUED_PER_SESSION", "8"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10.0"))  # 0 = wait indefinitely
+
+# Upstream connection pool configuration
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30.0"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10.0"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "10.0"))
+UPSTREAM_PREWARM = os.getenv("UPSTREAM_PREWARM", "true").lower() == "true"  # open connections before /ready
+
+# Upstream retry, rate limit and circuit breaker configuration
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.5"))
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "8.0"))
+UPSTREAM_REQUESTS_PER_MINUTE = float(os.getenv("UPSTREAM_REQUESTS_PER_MINUTE", "0"))  # 0 = unlimited
+UPSTREAM_TOKENS_PER_MINUTE = float(os.getenv("UPSTREAM_TOKENS_PER_MINUTE", "0"))  # 0 = unlimited
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+UPSTREAM_BREAKER_RESET_SECONDS = float(os.getenv("UPSTREAM_BREAKER_RESET_SECONDS", "30.0"))
+
+# WebSocket chat configuration
+WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", "4"))
+WS_CANCEL_ON_NEW_MESSAGE = os.getenv("WS_CANCEL_ON_NEW_MESSAGE", "true").lower() == "true"
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "20.0"))  # 0 = no pings
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "60.0"))  # 0 = never reap
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5.0"))
+WS_MAX_QUEUE = int(os.getenv("WS_MAX_QUEUE", "64"))
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest").lower()  # or "disconnect"
+
+# Multi-deployment endpoint pools
+UPSTREAM_ENDPOINTS_FILE = os.getenv("UPSTREAM_ENDPOINTS_FILE")  # JSON with "text", "vision" and "image" pools
+UPSTREAM_ROUTING = os.getenv("UPSTREAM_ROUTING", "least_outstanding").lower()  # or "latency"
+
+# Profile registry: profiles load on first use and reload when their files change
+profiles = ProfileRegistry(
+    PROFILES_DIR,
+    default_profile=DEFAULT_PROFILE,
+    reload_interval=PROFILE_RELOAD_INTERVAL,
+    max_sessions=SESSION_MAX_SESSIONS,
+)
+
+# Metrics registry, exposed in the Prometheus text format at /metrics
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    "app_stage_duration_seconds", "Time spent in each stage of request handling", ["route", "stage"]
+)
+fallback_replies = metrics.counter(
+    "demo_fallback_replies_total", "Replies served by the demo-mode fallback", ["route", "reason"]
+)
+def stage(route: str, name: str):
+    """Time a stage of request handling"""
+    return stage_seconds.time(route=route, stage=name)
+
+# Reject oversized uploads before the multipart body is parsed
+# (the margin leaves room for the other form fields)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=MAX_UPLOAD_BYTES + 1024 * 1024,
+    path_prefixes=["/api/image-analysis"],
+)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=VISION_BATCH_MAX_BYTES + 1024 * 1024,
+    path_prefixes=["/api/batch/image-analysis"],
+)
+
+# Record latency and status of every request (outermost, so rejected uploads count too)
+app.add_middleware(MetricsMiddleware, registry=metrics)
 
 # Validate required configuration
-if not API_KEY:
-    logger.warning("LLM_API_KEY not found in environment variables. API calls will use demo mode.")
-if not LLM_API_ENDPOINT:
-    logger.warning("LLM_API_ENDPOINT not found in environment variables. API calls will use demo mode.")
-if not DALLE_ENDPOINT:
-    logger.warning("DALLE_ENDPOINT not found in environment variables. Image generation will use demo mode.")
-
-# Initialize DALL-E client
-dalle_client = None
-if DALLE_API_KEY and DALLE_ENDPOINT:
+if UPSTREAM_ENDPOINTS_FILE:
+    logger.info(f"Loading upstream endpoints from {UPSTREAM_ENDPOINTS_FILE}")
+else:
+    if not API_KEY:
+        logger.warning("LLM_API_KEY not found in environment variables. API calls will use demo mode.")
+    if not LLM_API_ENDPOINT:
+        logger.warning("LLM_API_ENDPOINT not found in environment variables. API calls will use demo mode.")
+    if not DALLE_ENDPOINT:
+        logger.warning("DALLE_ENDPOINT not found in environment variables. Image generation will use demo mode.")
+
+# Upstream deployments: from the endpoints file, or the single endpoints above
+if UPSTREAM_ENDPOINTS_FILE:
+    endpoint_settings = load_endpoints_file(UPSTREAM_ENDPOINTS_FILE)
+else:
+    endpoint_settings = {
+        "text": [{"url": LLM_API_ENDPOINT, "api_key": API_KEY}] if LLM_API_ENDPOINT else [],
+        "image": [{"url": DALLE_ENDPOINT, "api_key": DALLE_API_KEY}] if DALLE_API_KEY and DALLE_ENDPOINT else [],
+    }
+
+def build_endpoint_pool(name: str, entries: List[Dict[str, Any]], **defaults: Any) -> EndpointPool:
+    """Build an endpoint pool, filling unset per-endpoint limits from the UPSTREAM_* settings"""
+    defaults = {
+        "requests_per_minute": UPSTREAM_REQUESTS_PER_MINUTE,
+        "tokens_per_minute": UPSTREAM_TOKENS_PER_MINUTE,
+        "breaker_failures": UPSTREAM_BREAKER_FAILURES,
+        "breaker_reset_seconds": UPSTREAM_BREAKER_RESET_SECONDS,
+        **defaults,
+    }
+    endpoints = [
+        Endpoint(**{"name": f"{name}-{index}", **defaults, **entry})
+        for index, entry in enumerate(entries)
+    ]
+    return EndpointPool(name, endpoints, strategy=UPSTREAM_ROUTING, metrics=metrics)
+
+with startup.initializer("endpoint_pools"):
+    text_pool = build_endpoint_pool("text", endpoint_settings.get("text", []))
+    # Vision calls share the text deployments unless the file lists its own
+    vision_pool = build_endpoint_pool("vision", endpoint_settings["vision"]) if "vision" in endpoint_settings else text_pool
+    image_pool = build_endpoint_pool(
+        "image", endpoint_settings.get("image", []),
+        deployment=DALLE_DEPLOYMENT, api_version=DALLE_API_VERSION,
+    )
+
+# DALL-E generator; its per-deployment clients are created during warm-up or on first use
+image_generator = None
+if len(image_pool):
     try:
-        dalle_client = AzureOpenAI(
-            api_version=DALLE_API_VERSION,
-            azure_endpoint=DALLE_ENDPOINT,
-            api_key=DALLE_API_KEY,
+        image_generator = ImageGenerator(
+            image_pool,
+            max_concurrency=DALLE_MAX_CONCURRENCY,
+            max_queue=DALLE_MAX_QUEUE,
+            timeout=DALLE_REQUEST_TIMEOUT,
+            metrics=metrics,
         )
-        logger.info("DALL-E client initialized successfully")
+        logger.info(f"DALL-E generator initialized for {len(image_pool)} deployment(s)")
     except Exception as e:
         logger.error(f"Failed to initialize DALL-E client: {str(e)}")
-        dalle_client = None
+        image_generator = None
 
-# WebSocket connection manager and session storage
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
-        self.active_connections[client_id] = websocket
-        
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
-            
-    async def send_message(self, message: str, client_id: str):
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_text(message)
-            
-    async def broadcast(self, message: str):
-        for connection in self.active_connections.values():
-            await connection.send_text(message)
+# Generated images are downloaded once and served locally under content-addressed URLs
+with startup.initializer("image_store"):
+    image_store = None
+    if IMAGE_STORE_ENABLED:
+        image_store = ImageStore(
+            IMAGE_STORE_DIR,
+            max_bytes=IMAGE_STORE_MAX_BYTES,
+            thumbnail_widths=IMAGE_STORE_THUMBNAIL_WIDTHS,
+            fetch_timeout=IMAGE_STORE_FETCH_TIMEOUT,
+            metrics=metrics,
+        )
+
+# Shared upstream HTTP client (connection pool reused by all LLM calls)
+with startup.initializer("upstream_client"):
+    upstream_client = UpstreamClient(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        http2=UPSTREAM_HTTP2,
+        connect_timeout=UPSTREAM_CONNECT_TIMEOUT,
+        pool_timeout=UPSTREAM_POOL_TIMEOUT,
+        route_timeouts={"text": REQUEST_TIMEOUT, "vision": VISION_REQUEST_TIMEOUT},
+        default_timeout=REQUEST_TIMEOUT,
+        metrics=metrics,
+        retry_policy=RetryPolicy(
+            max_retries=UPSTREAM_MAX_RETRIES,
+            base_delay=UPSTREAM_RETRY_BASE_DELAY,
+            max_delay=UPSTREAM_RETRY_MAX_DELAY,
+        ),
+        pools={"text": text_pool, "vision": vision_pool},
+    )
+
+# WebSocket connection manager
+manager = ConnectionManager(
+    send_timeout=WS_SEND_TIMEOUT,
+    max_queue=WS_MAX_QUEUE,
+    slow_consumer_policy=WS_SLOW_CONSUMER_POLICY,
+    metrics=metrics,
+)
+metrics.gauge("websocket_connections_active", "Open WebSocket connections", callback=lambda: len(manager.active_connections))
+websocket_closes = metrics.counter("websocket_closes_total", "Closed WebSocket connections by reason", ["reason"])
 
 # Session storage for conversation history
-class SessionManager:
-    def __init__(self):
-        self.sessions: Dict[str, List[Dict[str, str]]] = {}
-    
-    def get_conversation_history(self, session_id: str) -> List[Dict[str, str]]:
-        """Get conversation history for a session"""
-        return self.sessions.get(session_id, [])
-    
-    def add_message(self, session_id: str, role: str, content: str):
-        """Add a message to session history"""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = []
-        
-        self.sessions[session_id].append({
-            "role": role,
-            "content": content
-        })
-        
-        # Keep only last 20 messages to prevent memory issues
-        if len(self.sessions[session_id]) > 20:
-            self.sessions[session_id] = self.sessions[session_id][-20:]
-    
-    def clear_session(self, session_id: str):
-        """Clear conversation history for a session"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+with startup.initializer("session_store"):
+    session_backend = None
+    if SESSION_BACKEND == "sqlite":
+        session_backend = SQLiteSessionBackend(
+            SESSION_SQLITE_PATH,
+            max_messages=SESSION_MAX_MESSAGES,
+            ttl_seconds=SESSION_TTL_SECONDS,
+            flush_interval=SESSION_FLUSH_INTERVAL,
+            batch_size=SESSION_FLUSH_BATCH,
+        )
+    elif SESSION_BACKEND == "journal":
+        session_backend = JournalSessionBackend(
+            SESSION_JOURNAL_DIR,
+            max_messages=SESSION_MAX_MESSAGES,
+            ttl_seconds=SESSION_TTL_SECONDS,
+            flush_interval=SESSION_FLUSH_INTERVAL,
+            batch_size=SESSION_FLUSH_BATCH,
+            segment_bytes=SESSION_JOURNAL_SEGMENT_BYTES,
+            snapshot_interval=SESSION_JOURNAL_SNAPSHOT_INTERVAL,
+        )
+    elif SESSION_BACKEND != "memory":
+        logger.warning(f"Unknown SESSION_BACKEND '{SESSION_BACKEND}'. Using in-memory sessions.")
+
+    session_manager = SessionManager(
+        max_sessions=SESSION_MAX_SESSIONS,
+        max_messages=SESSION_MAX_MESSAGES,
+        ttl_seconds=SESSION_TTL_SECONDS,
+        max_total_bytes=SESSION_MAX_BYTES,
+        backend=session_backend,
+    )
+
+metrics.gauge("session_store_sessions", "Sessions held in memory", callback=lambda: len(session_manager.sessions))
+metrics.gauge("session_store_bytes", "Approximate size of stored conversation history", callback=lambda: session_manager.total_bytes)
 
-manager = ConnectionManager()
-session_manager = SessionManager()
+# Token-budget windowing of conversation history
+history_window = HistoryWindow(
+    budget=CONTEXT_TOKEN_BUDGET,
+    summarize=HISTORY_SUMMARIZE,
+    summary_tokens=HISTORY_SUMMARY_TOKENS,
+)
+
+# Cache of upstream replies for repeated chat and vision prompts (opt-in)
+response_cache = None
+if RESPONSE_CACHE_ENABLED:
+    response_cache = ResponseCache(
+        max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes=RESPONSE_CACHE_MAX_BYTES,
+        ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+    )
+    metrics.gauge("response_cache_entries", "Cached upstream replies", callback=lambda: response_cache.stats()["entries"])
+
+# In-flight request coalescing for chat, vision and image generation calls
+single_flight = SingleFlight(metrics=metrics)
+
+async def coalesced(route: str, key: str, fn):
+    """Run an upstream call, sharing it with concurrent identical requests"""
+    if not SINGLE_FLIGHT_ENABLED:
+        return await fn()
+    return await single_flight.do(key, fn, route)
+
+# Per-session admission control in front of chat, vision and image generation calls
+admission = AdmissionController(
+    max_concurrency=ADMISSION_MAX_CONCURRENCY,
+    max_per_session=ADMISSION_MAX_PER_SESSION,
+    max_queued=ADMISSION_MAX_QUEUED,
+    max_queued_per_session=ADMISSION_MAX_QUEUED_PER_SESSION,
+    max_wait=ADMISSION_MAX_WAIT,
+    metrics=metrics,
+)
+
+async def admit(session_id: str, route: str) -> Optional[float]:
+    """Wait for an upstream slot; 429 with Retry-After if the request is shed"""
+    if not ADMISSION_ENABLED:
+        return None
+    try:
+        return await admission.acquire(session_id, route)
+    except AdmissionRejected as e:
+        logger.warning(f"Shedding {route} request for session {session_id}: {str(e)}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests in progress. Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def release(session_id: str, admitted_at: Optional[float]):
+    """Give back a slot taken by admit()"""
+    if ADMISSION_ENABLED:
+        admission.release(session_id, admitted_at)
+
+@asynccontextmanager
+async def admitted(session_id: str, route: str):
+    """Hold an upstream slot for the duration of the block"""
+    admitted_at = await admit(session_id, route)
+    try:
+        yield
+    finally:
+        release(session_id, admitted_at)
+
+# Home page rendered once per profile; re-rendered when the profile reloads or assets are rebuilt
+page_cache = PageCache(metrics=metrics)
 
 # Pydantic models for request/response
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
+    profile: Optional[str] = None
 
 class ChatResponse(BaseModel):
     reply: str
@@ -155,6 +496,7 @@ class ChatResponse(BaseModel):
 class ImageAnalysisRequest(BaseModel):
     prompt: Optional[str] = "Please describe this image in detail."
     session_id: Optional[str] = None
+    profile: Optional[str] = None
 
 class ImageGenerationRequest(BaseModel):
     prompt: str
@@ -162,279 +504,807 @@ class ImageGenerationRequest(BaseModel):
     quality: Optional[str] = "standard"  # "standard" or "hd"
     size: Optional[str] = "1024x1024"  # "1024x1024", "1792x1024", or "1024x1792"
     session_id: Optional[str] = None
+    profile: Optional[str] = None
 
 class ImageGenerationResponse(BaseModel):
     image_url: str
     session_id: str
     prompt_used: str
 
+class ImageGenerationJobRequest(ImageGenerationRequest):
+    priority: Optional[str] = "normal"  # "high", "normal" or "low"
+    client_id: Optional[str] = None  # WebSocket client ID to push the result to
+
+async def resolve_profile(session_id: Optional[str], profile_id: Optional[str]) -> ProfileModel:
+    """Profile named by the request, else the session's, else the default; 404 if unknown"""
+    try:
+        return await profiles.resolve(session_id, profile_id)
+    except ProfileNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+def build_chat_messages(profile_model: ProfileModel, conversation_history: List[Dict[str, str]], user_message: str) -> List[Dict[str, Any]]:
+    """Build the messages array with system prompt, history that fits the token budget, and current message"""
+    return history_window.build(profile_model.get_personality_prompt(), profile_model.get_prompt_token_count(), conversation_history, user_message)
+
+def estimate_chat_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Prompt plus completion tokens charged to the upstream token quota"""
+    return sum(history_window.count(message) for message in messages) + MAX_TOKENS
+
+def fallback_reason(error: Exception) -> str:
+    """Label for a demo-mode fallback caused by an upstream exception"""
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, RateLimitExceeded):
+        return "rate_limited"
+    if isinstance(error, NoEndpointAvailable):
+        return "no_endpoint"
+    return "upstream_error"
+
+def demo_chat_reply(profile_model: ProfileModel, conversation_history: List[Dict[str, str]], user_message: str) -> str:
+    """Simulated contextual reply used when the LLM API is unavailable"""
+    context_info = ""
+    if len(conversation_history) > 0:
+        context_info = f" I can see we've been chatting, and you previously mentioned: '{conversation_history[-1].get('content', '')[:50]}...'"
+    return f"I'm {profile_model.get_name()}, your AI assistant.{context_info} Regarding '{user_message}', I'm currently in demo mode. In a real implementation, I would connect to an LLM API to generate a personalized response based on our conversation history."
+
+def demo_image_analysis(profile_model: ProfileModel) -> str:
+    """Simulated image analysis used when the vision API is unavailable"""
+    return f"I'm {profile_model.get_name()}, your AI assistant. I can see you've shared an image with me. In a real implementation, I would analyze this image using a vision model and provide a detailed description based on my personality profile."
+
+def cache_bypassed(cache_control: Optional[str], x_cache_bypass: Optional[str]) -> bool:
+    """Whether the client asked to skip the response cache"""
+    if x_cache_bypass and x_cache_bypass.lower() not in ("0", "false"):
+        return True
+    return bool(cache_control) and "no-cache" in cache_control.lower()
+
+def lookup_cached_reply(cache_key: str, bypass: bool):
+    """Look up a cached reply and return it with the X-Cache status"""
+    if bypass:
+        response_cache.record_bypass()
+        return None, "BYPASS"
+    cached_reply = response_cache.get(cache_key)
+    return cached_reply, "HIT" if cached_reply is not None else "MISS"
+
+async def stream_chat_reply(session_id: str, user_message: str, bypass_cache: bool = False, profile_model: Optional[ProfileModel] = None):
+    """Yield reply deltas from the LLM and store the assembled reply once the stream finishes"""
+    if profile_model is None:
+        profile_model = await profiles.resolve(session_id)
+    system_prompt = profile_model.get_personality_prompt()
+    with stage("chat_stream", "history_load"):
+        conversation_history = await session_manager.get_conversation_history(session_id)
+    with stage("chat_stream", "prompt_build"):
+        messages = build_chat_messages(profile_model, conversation_history, user_message)
+    
+    # Serve repeated prompts from the response cache
+    cache_key = None
+    if response_cache:
+        with stage("chat_stream", "cache_lookup"):
+            cache_key = response_cache.chat_key(TEXT_MODEL, system_prompt, messages[1:])
+            cached_reply, _ = lookup_cached_reply(cache_key, bypass_cache)
+        if cached_reply is not None:
+            yield cached_reply
+            with stage("chat_stream", "session_write"):
+                await session_manager.add_message(session_id, "user", user_message)
+                await session_manager.add_message(session_id, "assistant", cached_reply)
+            return
+    
+    parts = []
+    streamed = False
+    reason = "empty_reply"
+    try:
+        async with upstream_client.stream(
+            "POST",
+            route="text",
+            token_cost=estimate_chat_tokens(messages),
+            json={
+                "model": TEXT_MODEL,
+                "messages": messages,
+                "max_tokens": MAX_TOKENS,
+                "stream": True
+            }
+        ) as response:
+            if response.status_code == 200:
+                async for delta in iter_chat_deltas(response):
+                    parts.append(delta)
+                    yield delta
+                streamed = bool(parts)
+            else:
+                logger.warning(f"Streaming API call failed with status {response.status_code}. Using simulated response.")
+                reason = "upstream_status"
+    except Exception as e:
+        logger.error(f"Error streaming from LLM API: {str(e)}")
+        reason = fallback_reason(e)
+    
+    # Fall back to the demo reply if nothing was streamed
+    if not parts:
+        fallback_replies.inc(route="chat_stream", reason=reason)
+        assistant_reply = demo_chat_reply(profile_model, conversation_history, user_message)
+        parts.append(assistant_reply)
+        yield assistant_reply
+    
+    # Store the conversation
+    assistant_reply = "".join(parts)
+    with stage("chat_stream", "session_write"):
+        await session_manager.add_message(session_id, "user", user_message)
+        await session_manager.add_message(session_id, "assistant", assistant_reply)
+    if cache_key and streamed:
+        response_cache.set(cache_key, assistant_reply)
+
+async def admitted_stream(session_id: str, route: str, stream):
+    """Yield from a reply stream while holding an upstream slot"""
+    async with admitted(session_id, route):
+        async for delta in stream:
+            yield delta
+
 # Routes
-@app.get("/", response_class=HTMLResponse)
+@app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
 async def get_home(request: Request):
-    """Render the home page"""
-    ui_theme = profile_model.get_ui_theme()
-    assistant_name = profile_model.get_name()
-    avatar = profile_model.get_avatar()
-    
-    return templates.TemplateResponse(
-        "index.html", 
-        {
-            "request": request, 
-            "assistant_name": assistant_name,
-            "avatar": avatar,
-            "theme": ui_theme
-        }
-    )
+    """Serve the home page, rendered once per profile"""
+    profile_id = request.query_params.get("profile") or profiles.default_profile
+    profile_model = await resolve_profile(None, profile_id)
+
+    def render() -> str:
+        return get_templates().get_template("index.html").render(
+            assistant_name=profile_model.get_name(),
+            avatar=profile_model.get_avatar(),
+            theme=profile_model.get_ui_theme(),
+        )
+
+    page = page_cache.get(profile_id, (profile_model, static_assets.generation), render)
+    return page_cache.response(page, request.headers, request.method)
 
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(
+    request: ChatRequest,
+    response: Response,
+    cache_control: Optional[str] = Header(None),
+    x_cache_bypass: Optional[str] = Header(None)
+):
     """Handle text chat requests with conversation history"""
     try:
-        # Generate system prompt based on profile
-        system_prompt = profile_model.get_personality_prompt()
-        
         # Create session ID if not provided
         session_id = request.session_id or str(uuid.uuid4())
         
+        # Generate system prompt based on the session's profile
+        profile_model = await resolve_profile(session_id, request.profile)
+        system_prompt = profile_model.get_personality_prompt()
+        
         # Get conversation history for this session
-        conversation_history = session_manager.get_conversation_history(session_id)
+        with stage("chat", "history_load"):
+            conversation_history = await session_manager.get_conversation_history(session_id)
         
         # Build messages array with system prompt, history, and current message
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(conversation_history)
-        messages.append({"role": "user", "content": request.message})
+        with stage("chat", "prompt_build"):
+            messages = build_chat_messages(profile_model, conversation_history, request.message)
+        
+        # Serve repeated prompts from the response cache
+        with stage("chat", "cache_lookup"):
+            request_key = ResponseCache.chat_key(TEXT_MODEL, system_prompt, messages[1:])
+            cache_key = None
+            cached_reply = None
+            if response_cache:
+                cache_key = request_key
+                cached_reply, cache_status = lookup_cached_reply(cache_key, cache_bypassed(cache_control, x_cache_bypass))
+                response.headers["X-Cache"] = cache_status
+        if cached_reply is not None:
+            with stage("chat", "session_write"):
+                await session_manager.add_message(session_id, "user", request.message)
+                await session_manager.add_message(session_id, "assistant", cached_reply)
+            return ChatResponse(
+                reply=cached_reply,
+                session_id=session_id
+            )
         
-        # Call LLM API
-        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
-            # In a real implementation, replace with actual API call
-            try:
-                response = await client.post(
-                    LLM_API_ENDPOINT,
-                    headers={"Authorization": f"Bearer {API_KEY}"},
+        # Call LLM API (shared with concurrent identical requests)
+        try:
+            async with admitted(session_id, "chat"):
+                upstream_response = await coalesced("chat", request_key, lambda: upstream_client.post(
+                    route="text",
+                    token_cost=estimate_chat_tokens(messages),
                     json={
                         "model": TEXT_MODEL,
                         "messages": messages,
                         "max_tokens": MAX_TOKENS
                     }
-                )
-                
-                # For demo purposes, simulate a response if API call fails
-                if response.status_code != 200:
-                    logger.warning(f"API call failed with status {response.status_code}. Using simulated response.")
-                    # Simulate a contextual response based on the personality and history
-                    context_info = ""
-                    if len(conversation_history) > 0:
-                        context_info = f" I can see we've been chatting, and you previously mentioned: '{conversation_history[-1].get('content', '')[:50]}...'"
-                    
-                    assistant_reply = f"I'm {profile_model.get_name()}, your AI assistant.{context_info} Regarding '{request.message}', I'm currently in demo mode. In a real implementation, I would connect to an LLM API to generate a personalized response based on our conversation history."
-                    
-                    # Store the conversation
-                    session_manager.add_message(session_id, "user", request.message)
-                    session_manager.add_message(session_id, "assistant", assistant_reply)
-                    
-                    return ChatResponse(
-                        reply=assistant_reply,
-                        session_id=session_id
-                    )
-                
-                result = response.json()
-                assistant_reply = result["choices"][0]["message"]["content"]
-                
-                # Store the conversation
-                session_manager.add_message(session_id, "user", request.message)
-                session_manager.add_message(session_id, "assistant", assistant_reply)
-                
-                return ChatResponse(
-                    reply=assistant_reply,
-                    session_id=session_id
-                )
-                
-            except Exception as e:
-                logger.error(f"Error calling LLM API: {str(e)}")
-                # Fallback response for demo with context
-                context_info = ""
-                if len(conversation_history) > 0:
-                    context_info = f" I remember our conversation history, including your previous message about '{conversation_history[-1].get('content', '')[:50]}...'"
-                
-                assistant_reply = f"I'm {profile_model.get_name()}, your AI assistant.{context_info} I'd love to help you with '{request.message}', but I'm currently in demo mode. In a real implementation, I would connect to an LLM API to generate a personalized response based on our conversation history."
+                ))
+            
+            # For demo purposes, simulate a response if API call fails
+            if upstream_response.status_code != 200:
+                logger.warning(f"API call failed with status {upstream_response.status_code}. Using simulated response.")
+                fallback_replies.inc(route="chat", reason="upstream_status")
+                # Simulate a contextual response based on the personality and history
+                assistant_reply = demo_chat_reply(profile_model, conversation_history, request.message)
                 
                 # Store the conversation
-                session_manager.add_message(session_id, "user", request.message)
-                session_manager.add_message(session_id, "assistant", assistant_reply)
+                await session_manager.add_message(session_id, "user", request.message)
+                await session_manager.add_message(session_id, "assistant", assistant_reply)
                 
                 return ChatResponse(
                     reply=assistant_reply,
                     session_id=session_id
                 )
-                
+            
+            with stage("chat", "response_parse"):
+                result = upstream_response.json()
+                assistant_reply = result["choices"][0]["message"]["content"]
+            
+            # Store the conversation
+            with stage("chat", "session_write"):
+                await session_manager.add_message(session_id, "user", request.message)
+                await session_manager.add_message(session_id, "assistant", assistant_reply)
+            if cache_key:
+                response_cache.set(cache_key, assistant_reply)
+            
+            return ChatResponse(
+                reply=assistant_reply,
+                session_id=session_id
+            )
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error calling LLM API: {str(e)}")
+            fallback_replies.inc(route="chat", reason=fallback_reason(e))
+            # Fallback response for demo with context
+            assistant_reply = demo_chat_reply(profile_model, conversation_history, request.message)
+            
+            # Store the conversation
+            await session_manager.add_message(session_id, "user", request.message)
+            await session_manager.add_message(session_id, "assistant", assistant_reply)
+            
+            return ChatResponse(
+                reply=assistant_reply,
+                session_id=session_id
+            )
+            
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    cache_control: Optional[str] = Header(None),
+    x_cache_bypass: Optional[str] = Header(None)
+):
+    """Stream a chat reply as server-sent events while it is generated"""
+    session_id = request.session_id or str(uuid.uuid4())
+    profile_model = await resolve_profile(session_id, request.profile)
+    bypass_cache = cache_bypassed(cache_control, x_cache_bypass)
+    # Take the slot before streaming starts, so a shed request still gets a 429
+    admitted_at = await admit(session_id, "chat_stream")
+    released = False
+    
+    def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            release(session_id, admitted_at)
+    
+    async def release_after_response():
+        # Runs even when the client disconnects before the body starts and event_stream() never runs
+        release_slot()
+    
+    async def event_stream():
+        try:
+            yield format_sse({"session_id": session_id}, event="start")
+            parts = []
+            async for delta in stream_chat_reply(session_id, request.message, bypass_cache, profile_model):
+                parts.append(delta)
+                yield format_sse({"delta": delta})
+            yield format_sse({"reply": "".join(parts), "session_id": session_id}, event="done")
+        finally:
+            release_slot()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_after_response)
+    )
+
 @app.post("/api/image-analysis")
 async def analyze_image(
     file: UploadFile = File(...),
     prompt: str = Form("Please describe this image in detail."),
-    session_id: Optional[str] = Form(None)
+    session_id: Optional[str] = Form(None),
+    profile: Optional[str] = Form(None),
+    cache_control: Optional[str] = Header(None),
+    x_cache_bypass: Optional[str] = Header(None)
 ):
     """Handle image analysis requests"""
     try:
-        # Generate system prompt based on profile
-        system_prompt = profile_model.get_personality_prompt()
-        
         # Create session ID if not provided
         session_id = session_id or str(uuid.uuid4())
         
-        # Read the uploaded image
-        image_data = await file.read()
-        base64_image = base64.b64encode(image_data).decode('utf-8')
+        # Generate system prompt based on the session's profile
+        profile_model = await resolve_profile(session_id, profile)
+        system_prompt = profile_model.get_personality_prompt()
+        
+        # Read the uploaded image, enforcing the size limit while streaming
+        try:
+            with stage("image_analysis", "image_read"):
+                image_data = await read_upload(file, MAX_UPLOAD_BYTES)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        
+        # Serve re-uploaded images from the response cache
+        with stage("image_analysis", "cache_lookup"):
+            image_hash = hashlib.sha256(image_data).hexdigest()
+            request_key = ResponseCache.vision_key(VISION_MODEL, system_prompt, image_hash, prompt)
+            cache_key = None
+            cached_analysis = None
+            cache_headers = {}
+            if response_cache:
+                cache_key = request_key
+                cached_analysis, cache_status = lookup_cached_reply(cache_key, cache_bypassed(cache_control, x_cache_bypass))
+                cache_headers["X-Cache"] = cache_status
+        if cached_analysis is not None:
+            return JSONResponse({
+                "analysis": cached_analysis,
+                "session_id": session_id
+            }, headers=cache_headers)
         
-        # Call Vision LLM API
-        async with httpx.AsyncClient(timeout=VISION_REQUEST_TIMEOUT) as client:
-            # In a real implementation, replace with actual API call
-            try:
-                response = await client.post(
-                    LLM_API_ENDPOINT,
-                    headers={"Authorization": f"Bearer {API_KEY}"},
+        # Detect the real format and downscale to the resolution the vision model uses
+        try:
+            with stage("image_analysis", "image_prepare"):
+                image_data, mime_type = await prepare_image(image_data, VISION_IMAGE_MAX_SIDE, VISION_IMAGE_SHORT_SIDE)
+        except UnsupportedImageFormat as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        with stage("image_analysis", "image_encode"):
+            image_url = build_data_url(image_data, mime_type)
+        del image_data
+        
+        # Call Vision LLM API (shared with concurrent identical requests)
+        try:
+            async with admitted(session_id, "image_analysis"):
+                response = await coalesced("image_analysis", request_key, lambda: upstream_client.post(
+                    route="vision",
+                    token_cost=profile_model.get_prompt_token_count() + count_tokens(prompt) + IMAGE_TOKENS_ESTIMATE + MAX_TOKENS,
                     json={
                         "model": VISION_MODEL,
                         "messages": [
                             {"role": "system", "content": system_prompt},
                             {"role": "user", "content": [
                                 {"type": "text", "text": prompt},
-                                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                                {"type": "image_url", "image_url": {"url": image_url}}
                             ]}
                         ],
                         "max_tokens": MAX_TOKENS
                     }
-                )
-                
-                # For demo purposes, simulate a response if API call fails
-                if response.status_code != 200:
-                    logger.warning(f"API call failed with status {response.status_code}. Using simulated response.")
-                    # Simulate a response based on the personality
-                    return JSONResponse({
-                        "analysis": f"I'm {profile_model.get_name()}, your AI assistant. I can see you've shared an image with me. In a real implementation, I would analyze this image using a vision model and provide a detailed description based on my personality profile.",
-                        "session_id": session_id
-                    })
-                
-                result = response.json()
-                return JSONResponse({
-                    "analysis": result["choices"][0]["message"]["content"],
-                    "session_id": session_id
-                })
-                
-            except Exception as e:
-                logger.error(f"Error calling Vision LLM API: {str(e)}")
-                # Fallback response for demo
+                ))
+            
+            # For demo purposes, simulate a response if API call fails
+            if response.status_code != 200:
+                logger.warning(f"API call failed with status {response.status_code}. Using simulated response.")
+                fallback_replies.inc(route="image_analysis", reason="upstream_status")
+                # Simulate a response based on the personality
                 return JSONResponse({
-                    "analysis": f"I'm {profile_model.get_name()}, your AI assistant. I can see you've shared an image with me. In a real implementation, I would analyze this image using a vision model and provide a detailed description based on my personality profile.",
+                    "analysis": demo_image_analysis(profile_model),
                     "session_id": session_id
                 })
-                
+            
+            with stage("image_analysis", "response_parse"):
+                result = response.json()
+                analysis = result["choices"][0]["message"]["content"]
+            if cache_key:
+                response_cache.set(cache_key, analysis)
+            return JSONResponse({
+                "analysis": analysis,
+                "session_id": session_id
+            }, headers=cache_headers)
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error calling Vision LLM API: {str(e)}")
+            fallback_replies.inc(route="image_analysis", reason=fallback_reason(e))
+            # Fallback response for demo
+            return JSONResponse({
+                "analysis": demo_image_analysis(profile_model),
+                "session_id": session_id
+            })
+            
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in image analysis endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def analyze_vision_call(call: List[VisionTask], profile_model: ProfileModel, image_urls: Dict[str, str]) -> List[Optional[str]]:
+    """Answer the tasks of one batch call in a single upstream request; None marks a task the API could not answer, PackedReplyError a packed reply that could not be split"""
+    system_prompt = profile_model.get_personality_prompt()
+    packed = len(call) > 1
+    if packed:
+        content = build_packed_content(call, image_urls)
+        request_key = "vision-batch:" + hashlib.sha256(
+            json.dumps([VISION_MODEL, system_prompt, [task.key for task in call]]).encode("utf-8")
+        ).hexdigest()
+    else:
+        task = call[0]
+        content = [
+            {"type": "text", "text": task.prompt},
+            {"type": "image_url", "image_url": {"url": image_urls[task.image_hash]}}
+        ]
+        # Same key as /api/image-analysis, so the two share in-flight calls
+        request_key = ResponseCache.vision_key(VISION_MODEL, system_prompt, task.image_hash, task.prompt)
+    body = {
+        "model": VISION_MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": content}
+        ],
+        "max_tokens": MAX_TOKENS * len(call)
+    }
+    if packed:
+        body["response_format"] = {"type": "json_object"}
+    images = len({task.image_hash for task in call})
+    token_cost = (
+        profile_model.get_prompt_token_count() + sum(count_tokens(task.prompt) for task in call)
+        + IMAGE_TOKENS_ESTIMATE * images + MAX_TOKENS * len(call)
+    )
+    
+    try:
+        response = await coalesced("image_analysis_batch", request_key, lambda: upstream_client.post(route="vision", token_cost=token_cost, json=body))
+        if response.status_code != 200:
+            logger.warning(f"Batch vision call failed with status {response.status_code}. Using simulated responses.")
+            fallback_replies.inc(route="image_analysis_batch", reason="upstream_status")
+            return [None] * len(call)
+        with stage("image_analysis_batch", "response_parse"):
+            reply = response.json()["choices"][0]["message"]["content"]
+    except Exception as e:
+        logger.error(f"Error calling Vision LLM API: {str(e)}")
+        fallback_replies.inc(route="image_analysis_batch", reason=fallback_reason(e))
+        return [None] * len(call)
+    
+    if not packed:
+        return [reply]
+    # Raises PackedReplyError; run_calls then asks each question on its own
+    return parse_packed_reply(reply, len(call))
+
+@app.post("/api/batch/image-analysis")
+async def analyze_images_batch(
+    files: List[UploadFile] = File(...),
+    prompts: List[str] = Form([]),
+    session_id: Optional[str] = Form(None),
+    profile: Optional[str] = Form(None),
+    cache_control: Optional[str] = Header(None),
+    x_cache_bypass: Optional[str] = Header(None)
+):
+    """Analyze many images with one or more prompts each, streaming per-item results as server-sent events"""
+    session_id = session_id or str(uuid.uuid4())
+    profile_model = await resolve_profile(session_id, profile)
+    system_prompt = profile_model.get_personality_prompt()
+    prompts = [prompt for prompt in (prompts or []) if prompt.strip()] or ["Please describe this image in detail."]
+    if len(files) > VISION_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {VISION_BATCH_MAX_FILES} images per batch")
+    if len(files) * len(prompts) > VISION_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {VISION_BATCH_MAX_ITEMS} image/prompt pairs per batch")
+    
+    # Read the uploads; identical files are kept once, keyed by content hash
+    filenames = [file.filename for file in files]
+    image_hashes = []
+    raw_images: Dict[str, bytearray] = {}
+    try:
+        with stage("image_analysis_batch", "image_read"):
+            for file in files:
+                image_data = await read_upload(file, MAX_UPLOAD_BYTES)
+                image_hash = hashlib.sha256(image_data).hexdigest()
+                raw_images.setdefault(image_hash, image_data)
+                image_hashes.append(image_hash)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    # One item per (file, prompt); identical items share a task
+    tasks = group_tasks([(image_hash, prompt) for image_hash in image_hashes for prompt in prompts])
+    
+    # Answer what we can from the response cache
+    cached = []
+    pending = []
+    with stage("image_analysis_batch", "cache_lookup"):
+        bypass_cache = cache_bypassed(cache_control, x_cache_bypass)
+        for task in tasks:
+            answer = None
+            if response_cache:
+                answer, _ = lookup_cached_reply(ResponseCache.vision_key(VISION_MODEL, system_prompt, task.image_hash, task.prompt), bypass_cache)
+            if answer is not None:
+                cached.append((task, answer))
+            else:
+                pending.append(task)
+    
+    # Prepare each distinct image still needed, concurrently
+    needed = list(dict.fromkeys(task.image_hash for task in pending))
+    with stage("image_analysis_batch", "image_prepare"):
+        prepared = await asyncio.gather(
+            *(prepare_image(raw_images[image_hash], VISION_IMAGE_MAX_SIDE, VISION_IMAGE_SHORT_SIDE) for image_hash in needed),
+            return_exceptions=True
+        )
+    del raw_images
+    image_urls = {}
+    image_errors = {}
+    for image_hash, result in zip(needed, prepared):
+        if isinstance(result, Exception):
+            image_errors[image_hash] = str(result)
+        else:
+            image_urls[image_hash] = build_data_url(*result)
+    calls = pack_tasks(
+        [task for task in pending if task.image_hash in image_urls],
+        VISION_BATCH_IMAGES_PER_CALL,
+        VISION_BATCH_TASKS_PER_CALL
+    )
+    
+    def item_events(task: VisionTask, event: str, **fields: Any):
+        for index in task.items:
+            file_index = index // len(prompts)
+            yield format_sse({
+                "index": index,
+                "file_index": file_index,
+                "filename": filenames[file_index],
+                "prompt": task.prompt,
+                **fields
+            }, event=event)
+    
+    async def event_stream():
+        yield format_sse({
+            "session_id": session_id,
+            "items": len(image_hashes) * len(prompts),
+            "images": len(set(image_hashes)),
+            "tasks": len(tasks),
+            "calls": len(calls)
+        }, event="start")
+        counts = {"completed": 0, "errors": 0}
+        for task in pending:
+            if task.image_hash in image_errors:
+                counts["errors"] += len(task.items)
+                for event in item_events(task, "error", error=image_errors[task.image_hash]):
+                    yield event
+        for task, answer in cached:
+            counts["completed"] += len(task.items)
+            for event in item_events(task, "result", analysis=answer, cached=True):
+                yield event
+        # Tasks answered within a packed call; their answers are not cached under the single-question key
+        packed_tasks = set()
+
+        async def analyze(call: List[VisionTask]) -> List[Optional[str]]:
+            # Each call queues fairly with other sessions' requests; a shed call reports its items as errors
+            async with admitted(session_id, "image_analysis_batch"):
+                answers = await analyze_vision_call(call, profile_model, image_urls)
+            if len(call) > 1:
+                packed_tasks.update(task.key for task in call)
+            return answers
+
+        results = run_calls(calls, analyze, VISION_BATCH_CONCURRENCY)
+        async for task, answer, error in results:
+            if error is not None:
+                counts["errors"] += len(task.items)
+                for event in item_events(task, "error", error="Failed to analyze image"):
+                    yield event
+                continue
+            if answer is None:
+                answer = demo_image_analysis(profile_model)
+            elif response_cache and task.key not in packed_tasks:
+                response_cache.set(ResponseCache.vision_key(VISION_MODEL, system_prompt, task.image_hash, task.prompt), answer)
+            counts["completed"] += len(task.items)
+            for event in item_events(task, "result", analysis=answer, cached=False):
+                yield event
+        yield format_sse({"session_id": session_id, **counts}, event="done")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def generate_image_url(request: ImageGenerationRequest) -> str:
+    """Image URL from DALL-E, or a placeholder in demo mode or when the call fails; raises if DALL-E is busy or times out"""
+    if not image_generator:
+        # Demo mode response
+        logger.info("DALL-E client not available, using demo mode")
+        fallback_replies.inc(route="image_generation", reason="not_configured")
+        return f"https://via.placeholder.com/1024x1024/4A90E2/FFFFFF?text=Generated:+{request.prompt.replace(' ', '+')[:20]}"
+
+    try:
+        # Generate image using DALL-E without blocking the event loop
+        request_key = "image:" + hashlib.sha256(
+            json.dumps([request.prompt, request.style, request.quality, request.size]).encode("utf-8")
+        ).hexdigest()
+        async def generate_and_store():
+            image_url = await image_generator.generate(
+                prompt=request.prompt,
+                style=request.style,
+                quality=request.quality,
+                size=request.size
+            )
+            if image_store:
+                # Keep a local copy; the DALL-E URL expires and is slow to serve repeatedly
+                try:
+                    image_id = await image_store.save_from_url(image_url)
+                    image_url = f"/images/generated/{image_id}"
+                except ImageFetchError as e:
+                    logger.warning(f"Serving the DALL-E URL, could not store the image: {str(e)}")
+            return image_url
+
+        image_url = await coalesced("image_generation", request_key, generate_and_store)
+        logger.info(f"Image generated successfully for prompt: {request.prompt[:50]}...")
+        return image_url
+    except (ImageGenerationQueueFull, asyncio.TimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"Error calling DALL-E API: {str(e)}")
+        fallback_replies.inc(route="image_generation", reason=fallback_reason(e))
+        # Fallback response for demo
+        return "https://via.placeholder.com/1024x1024/4A90E2/FFFFFF?text=Image+Generation+Demo+Mode"
+
+async def run_image_job(job) -> Dict[str, Any]:
+    """Run a queued image generation job, waiting rather than failing when DALL-E is busy"""
+    request = job.params
+    while True:
+        try:
+            image_url = await generate_image_url(request)
+            break
+        except ImageGenerationQueueFull:
+            await asyncio.sleep(image_generator.retry_after())
+        except asyncio.TimeoutError:
+            logger.error(f"DALL-E request timed out after {DALLE_REQUEST_TIMEOUT}s")
+            raise RuntimeError("Image generation timed out")
+    return ImageGenerationResponse(
+        image_url=image_url,
+        session_id=job.session_id,
+        prompt_used=request.prompt
+    ).model_dump()
+
+async def push_image_job(job):
+    """Send a finished job to the WebSocket client that submitted it, if connected"""
+    if job.client_id:
+        await manager.send_message(json.dumps({"type": "image_job", **job.to_dict()}), job.client_id)
+
+# Background image generation: submit returns a job ID, workers run the jobs
+image_jobs = ImageJobQueue(
+    run_image_job,
+    workers=IMAGE_JOB_WORKERS,
+    max_queued=IMAGE_JOB_MAX_QUEUED,
+    max_queued_per_session=IMAGE_JOB_MAX_QUEUED_PER_SESSION,
+    result_ttl=IMAGE_JOB_RESULT_TTL,
+    on_finished=push_image_job,
+    metrics=metrics,
+)
+
 @app.post("/api/image-generation", response_model=ImageGenerationResponse)
 async def generate_image(request: ImageGenerationRequest):
     """Handle image generation requests using DALL-E"""
     try:
-        # Generate system prompt based on profile for enhancing user prompt
-        system_prompt = profile_model.get_personality_prompt()
-        
         # Create session ID if not provided
         session_id = request.session_id or str(uuid.uuid4())
         
+        # Generate system prompt based on the session's profile for enhancing user prompt
+        profile_model = await resolve_profile(session_id, request.profile)
+        system_prompt = profile_model.get_personality_prompt()
+        
         # Enhance the prompt using the assistant's personality
         enhanced_prompt = f"Based on my personality as {profile_model.get_name()}, I'll generate an image with this description: {request.prompt}"
         
-        if dalle_client:
-            try:
-                # Generate image using DALL-E
-                result = dalle_client.images.generate(
-                    model=DALLE_DEPLOYMENT,
-                    prompt=request.prompt,
-                    n=1,
-                    style=request.style,
-                    quality=request.quality,
-                    size=request.size
-                )
-                
-                # Extract image URL from response
-                image_data = json.loads(result.model_dump_json())
-                image_url = image_data['data'][0]['url']
-                
-                logger.info(f"Image generated successfully for prompt: {request.prompt[:50]}...")
-                
-                return ImageGenerationResponse(
-                    image_url=image_url,
-                    session_id=session_id,
-                    prompt_used=request.prompt
-                )
-                
-            except Exception as e:
-                logger.error(f"Error calling DALL-E API: {str(e)}")
-                # Fallback response for demo
-                return ImageGenerationResponse(
-                    image_url="https://via.placeholder.com/1024x1024/4A90E2/FFFFFF?text=Image+Generation+Demo+Mode",
-                    session_id=session_id,
-                    prompt_used=request.prompt
-                )
-        else:
-            # Demo mode response
-            logger.info("DALL-E client not available, using demo mode")
-            return ImageGenerationResponse(
-                image_url=f"https://via.placeholder.com/1024x1024/4A90E2/FFFFFF?text=Generated:+{request.prompt.replace(' ', '+')[:20]}",
-                session_id=session_id,
-                prompt_used=request.prompt
+        try:
+            async with admitted(session_id, "image_generation"):
+                image_url = await generate_image_url(request)
+        except ImageGenerationQueueFull as e:
+            logger.warning(f"Rejecting image generation request: {str(e)}")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many image generation requests in progress. Please retry shortly.",
+                headers={"Retry-After": str(image_generator.retry_after())}
             )
+        except asyncio.TimeoutError:
+            logger.error(f"DALL-E request timed out after {DALLE_REQUEST_TIMEOUT}s")
+            raise HTTPException(status_code=504, detail="Image generation timed out")
+        
+        return ImageGenerationResponse(
+            image_url=image_url,
+            session_id=session_id,
+            prompt_used=request.prompt
+        )
                 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in image generation endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/image-generation/jobs", status_code=202)
+async def submit_image_generation_job(request: ImageGenerationJobRequest):
+    """Queue an image generation job and return its ID right away"""
+    try:
+        session_id = request.session_id or request.client_id or str(uuid.uuid4())
+        await resolve_profile(session_id, request.profile)
+        job = image_jobs.submit(
+            request,
+            session_id=session_id,
+            priority=request.priority or "normal",
+            client_id=request.client_id,
+        )
+        return {
+            **job.to_dict(),
+            "status_url": f"/api/image-generation/jobs/{job.id}",
+            "queued": image_jobs.queued,
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImageJobQueueFull as e:
+        logger.warning(f"Rejecting image generation job: {str(e)}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many image generation jobs queued. Please retry shortly.",
+            headers={"Retry-After": str(image_jobs.retry_after())}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error submitting image generation job: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/image-generation/jobs/{job_id}")
+async def image_generation_job_status(job_id: str, wait: float = 0):
+    """Status of an image generation job; wait up to `wait` seconds for it to finish"""
+    job = image_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    await image_jobs.wait(job, min(max(wait, 0), IMAGE_JOB_MAX_WAIT))
+    return job.to_dict()
+
+@app.api_route("/images/generated/{image_id}", methods=["GET", "HEAD"])
+async def get_generated_image(image_id: str, request: Request, w: Optional[int] = None):
+    """Serve a stored generated image, or its thumbnail at width `w`"""
+    response = None
+    if image_store:
+        response = await image_store.response(
+            image_id,
+            width=w,
+            if_none_match=request.headers.get("if-none-match"),
+            range_header=request.headers.get("range"),
+            if_range=request.headers.get("if-range"),
+            method=request.method,
+        )
+    if response is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return response
+
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     """WebSocket endpoint for real-time chat"""
-    await manager.connect(websocket, client_id)
+    profile_id = websocket.query_params.get("profile")
+    # Check the profile once at connect time rather than failing every message
     try:
-        while True:
-            data = await websocket.receive_text()
-            
-            # Parse the received data
-            try:
-                message_data = json.loads(data)
-                user_message = message_data.get("message", "")
-                session_id = message_data.get("session_id", client_id)
-                
-                # Generate system prompt based on profile
-                system_prompt = profile_model.get_personality_prompt()
-                
-                # Process the message (in a real implementation, call the LLM API)
-                # For demo, we'll use a simulated response
-                assistant_response = f"I'm {profile_model.get_name()}, your AI assistant. In a real-time WebSocket connection, I would process your message: '{user_message}' and respond based on my personality profile."
-                
-                # Send the response back to the client
-                await manager.send_message(
-                    json.dumps({
-                        "reply": assistant_response,
-                        "session_id": session_id
-                    }),
-                    client_id
-                )
-                
-            except json.JSONDecodeError:
-                await manager.send_message(
-                    json.dumps({
-                        "error": "Invalid JSON format",
-                        "session_id": client_id
-                    }),
-                    client_id
-                )
-                
-    except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        await profiles.load(profile_id)
+    except ProfileNotFound as e:
+        await websocket.accept()
+        await websocket.close(code=1008, reason=str(e)[:123])
+        websocket_closes.inc(reason="invalid_profile")
+        return
+    connection = await manager.connect(websocket, client_id)
+
+    async def reply(session_id: str, message: str):
+        profile_model = await profiles.resolve(session_id, profile_id)
+        async for delta in stream_chat_reply(session_id, message, profile_model=profile_model):
+            yield delta
+
+    session = WebSocketChatSession(
+        websocket,
+        client_id,
+        lambda session_id, message: admitted_stream(session_id, "websocket", reply(session_id, message)),
+        max_in_flight=WS_MAX_IN_FLIGHT,
+        cancel_on_new_message=WS_CANCEL_ON_NEW_MESSAGE,
+        heartbeat_interval=WS_HEARTBEAT_INTERVAL,
+        idle_timeout=WS_IDLE_TIMEOUT,
+        metrics=metrics,
+        send_text=connection.send_text,
+    )
+    reason = "error"
+    try:
+        reason = await session.run()
+    finally:
+        manager.disconnect(client_id, websocket)
+        websocket_closes.inc(reason=reason)
 
 # Health check endpoint
 @app.get("/health")
@@ -442,11 +1312,83 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness check: succeeds once the startup warm-up has finished"""
+    if not startup.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "pending": startup.pending})
+    return {"status": "ready"}
+
+@app.get("/api/startup/stats")
+async def startup_stats():
+    """Startup import, initializer and warm-up timings"""
+    return startup.stats()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics"""
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/api/admission/stats")
+async def admission_stats():
+    """Admission control slots, queue depth and shed requests"""
+    return admission.stats()
+
+@app.get("/api/upstream/stats")
+async def upstream_stats():
+    """Upstream connection pool statistics"""
+    return upstream_client.stats()
+
+@app.get("/api/image-generation/stats")
+async def image_generation_stats():
+    """Image generation queue statistics"""
+    store = image_store.stats() if image_store else {"enabled": False}
+    if not image_generator:
+        return {"enabled": False, "jobs": image_jobs.stats(), "store": store}
+    return {"enabled": True, **image_generator.stats(), "jobs": image_jobs.stats(), "store": store}
+
+@app.get("/api/profiles/stats")
+async def profile_stats():
+    """Profile registry statistics"""
+    return profiles.stats()
+
+@app.get("/api/websocket/stats")
+async def websocket_stats():
+    """WebSocket connection and broadcast statistics"""
+    return manager.stats()
+
+@app.get("/api/pages/stats")
+async def page_stats():
+    """Cached home page renders and hit counts"""
+    return page_cache.stats()
+
+@app.get("/api/static/stats")
+async def static_asset_stats():
+    """Fingerprinted static assets and their compressed sizes"""
+    return static_assets.stats()
+
+@app.get("/api/single-flight/stats")
+async def single_flight_stats():
+    """In-flight request coalescing statistics"""
+    return {"enabled": SINGLE_FLIGHT_ENABLED, **single_flight.stats()}
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Response cache statistics"""
+    if not response_cache:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+@app.get("/api/sessions/stats")
+async def session_stats():
+    """Session store and history window statistics"""
+    return {**session_manager.stats(), "history_window": history_window.stats()}
+
 @app.delete("/api/chat/{session_id}")
 async def clear_chat_history(session_id: str):
     """Clear conversation history for a session"""
     try:
-        session_manager.clear_session(session_id)
+        await session_manager.clear_session(session_id)
         return {"message": "Chat history cleared successfully", "session_id": session_id}
     except Exception as e:
         logger.error(f"Error clearing chat history: {str(e)}")
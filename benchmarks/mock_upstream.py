@@ -0,0 +1,161 @@
+"""
+Local mock of the OpenAI-compatible chat completions API and the Azure
+DALL-E image generation API, used to benchmark the assistant without
+spending real quota.
+
+Run standalone:
+    python benchmarks/mock_upstream.py --port 9100 --latency 0.2 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# 1x1 transparent PNG returned for generated image URLs
+PIXEL_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+@dataclass
+class MockSettings:
+    latency: float = 0.2           # Seconds before a non-streaming chat reply
+    jitter: float = 0.05           # Uniform +/- jitter added to every delay
+    ttfb: float = 0.1              # Seconds before the first streamed token
+    token_delay: float = 0.01      # Seconds between streamed tokens
+    reply_tokens: int = 50         # Tokens per reply
+    error_rate: float = 0.0        # Fraction of requests answered with error_status
+    error_status: int = 429        # Status code of injected errors
+    retry_after: int = 1           # Retry-After header sent with injected errors
+    image_latency: float = 2.0     # Seconds per image generation
+
+
+settings = MockSettings()
+counters = {"chat": 0, "chat_stream": 0, "vision": 0, "images": 0, "errors": 0}
+
+app = FastAPI(title="Mock upstream")
+
+
+def _delay(base: float) -> float:
+    return max(0.0, base + random.uniform(-settings.jitter, settings.jitter))
+
+
+def _injected_error() -> Optional[Response]:
+    if settings.error_rate and random.random() < settings.error_rate:
+        counters["errors"] += 1
+        return JSONResponse(
+            {"error": {"code": str(settings.error_status), "message": "Injected mock error"}},
+            status_code=settings.error_status,
+            headers={"Retry-After": str(settings.retry_after)},
+        )
+    return None
+
+
+def _reply_words() -> list:
+    return [f"token{i} " for i in range(settings.reply_tokens)]
+
+
+@app.post("/{prefix:path}/chat/completions")
+async def chat_completions(prefix: str, request: Request):
+    body = await request.json()
+    error = _injected_error()
+    if error is not None:
+        return error
+
+    is_vision = any(isinstance(m.get("content"), list) for m in body.get("messages", []))
+    counters["vision" if is_vision else ("chat_stream" if body.get("stream") else "chat")] += 1
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    model = body.get("model", "mock")
+
+    if body.get("stream"):
+        async def events():
+            await asyncio.sleep(_delay(settings.ttfb))
+            for word in _reply_words():
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                if settings.token_delay:
+                    await asyncio.sleep(settings.token_delay)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(_delay(settings.latency))
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "".join(_reply_words()).strip()},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": settings.reply_tokens, "total_tokens": settings.reply_tokens},
+    }
+
+
+@app.post("/openai/deployments/{deployment}/images/generations")
+async def image_generations(deployment: str, request: Request):
+    body = await request.json()
+    error = _injected_error()
+    if error is not None:
+        return error
+
+    counters["images"] += 1
+    await asyncio.sleep(_delay(settings.image_latency))
+    image_id = uuid.uuid4().hex
+    return {
+        "created": int(time.time()),
+        "data": [{
+            "url": f"{str(request.base_url).rstrip('/')}/mock-images/{image_id}.png",
+            "revised_prompt": body.get("prompt", ""),
+        }],
+    }
+
+
+@app.get("/mock-images/{name}")
+async def mock_image(name: str):
+    return Response(PIXEL_PNG, media_type="image/png")
+
+
+@app.get("/mock/stats")
+async def mock_stats():
+    return {"settings": asdict(settings), "counters": counters}
+
+
+@app.post("/mock/reset")
+async def mock_reset():
+    for key in counters:
+        counters[key] = 0
+    return {"counters": counters}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI/DALL-E upstream for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    for name, value in asdict(MockSettings()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    for name in asdict(settings):
+        setattr(settings, name, getattr(args, name))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""
+Load/benchmark suite for the assistant.
+
+Starts the local mock upstream and the app (unless --target is given),
+drives each scenario at fixed concurrency and reports requests per
+second, latency percentiles and memory per connection. Results are saved
+as JSON so runs on different commits can be compared.
+
+Examples:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --scenarios chat,websocket --concurrency 10,100 --duration 20
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/baseline.json
+    python benchmarks/run_benchmarks.py -- --latency 0.5 --error-rate 0.05   # extra args go to the mock
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SCENARIOS = ["chat", "chat_stream", "image_analysis", "image_generation", "websocket"]
+
+# Metrics compared between runs: (name, higher is better)
+COMPARED_METRICS = [("rps", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("rss_per_connection_kb", False)]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_rss_kb(pid: Optional[int]) -> Optional[int]:
+    """Resident set size of a process in KB (Linux only)"""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def make_test_image(side: int) -> bytes:
+    """JPEG test image of the given size, or a tiny PNG if Pillow is missing"""
+    try:
+        from PIL import Image
+    except ImportError:
+        from mock_upstream import PIXEL_PNG
+        return PIXEL_PNG
+    image = Image.new("RGB", (side, side))
+    # A gradient compresses like a photo more than a flat color does
+    image.putdata([(x % 256, y % 256, (x + y) % 256) for y in range(side) for x in range(side)])
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+async def demo_fallbacks(client: httpx.AsyncClient) -> Optional[float]:
+    """Total demo-mode fallback replies reported by the app's /metrics endpoint"""
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200:
+        return None
+    return sum(
+        float(line.rsplit(" ", 1)[1])
+        for line in response.text.splitlines()
+        if line.startswith("demo_fallback_replies_total")
+    )
+
+
+async def wait_until_healthy(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become healthy within {timeout}s")
+
+
+class Scenario:
+    """Runs one kind of request in a loop; run_once returns the latency in seconds"""
+    name = ""
+
+    def __init__(self, base_url: str, image_bytes: bytes):
+        self.base_url = base_url
+        self.image_bytes = image_bytes
+
+    async def setup(self, worker: int, client: httpx.AsyncClient):
+        return None
+
+    async def teardown(self, state):
+        pass
+
+    async def run_once(self, worker: int, client: httpx.AsyncClient, state) -> float:
+        raise NotImplementedError
+
+
+class ChatScenario(Scenario):
+    name = "chat"
+
+    async def run_once(self, worker, client, state):
+        # Unique messages so the response cache and coalescing do not hide upstream latency
+        start = time.perf_counter()
+        response = await client.post("/api/chat", json={"message": f"Hello {uuid.uuid4().hex}", "session_id": f"bench-{worker}"})
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+
+class ChatStreamScenario(Scenario):
+    name = "chat_stream"
+
+    async def run_once(self, worker, client, state):
+        start = time.perf_counter()
+        async with client.stream(
+            "POST", "/api/chat/stream", json={"message": f"Hello {uuid.uuid4().hex}", "session_id": f"bench-stream-{worker}"}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line == "event: done":
+                    break
+        return time.perf_counter() - start
+
+
+class ImageAnalysisScenario(Scenario):
+    name = "image_analysis"
+
+    async def run_once(self, worker, client, state):
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/image-analysis",
+            files={"file": ("bench.jpg", self.image_bytes, "image/jpeg")},
+            data={"prompt": f"Describe this image ({uuid.uuid4().hex})", "session_id": f"bench-vision-{worker}"},
+        )
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+
+class ImageGenerationScenario(Scenario):
+    name = "image_generation"
+
+    async def run_once(self, worker, client, state):
+        start = time.perf_counter()
+        response = await client.post("/api/image-generation", json={"prompt": f"A lighthouse at dusk {uuid.uuid4().hex}"})
+        if response.status_code == 429:
+            raise RuntimeError("rejected (429)")
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+
+class WebSocketScenario(Scenario):
+    """One long-lived connection per worker, one chat message per iteration"""
+    name = "websocket"
+
+    async def setup(self, worker, client):
+        import websockets
+        ws_url = self.base_url.replace("http", "ws", 1) + f"/ws/bench-{worker}-{uuid.uuid4().hex[:8]}"
+        return await websockets.connect(ws_url, max_size=None)
+
+    async def teardown(self, state):
+        await state.close()
+
+    async def run_once(self, worker, client, state):
+        start = time.perf_counter()
+        await state.send(json.dumps({"message": f"Hello {uuid.uuid4().hex}"}))
+        while True:
+            frame = json.loads(await state.recv())
+            if frame.get("type") == "done" or "error" in frame:
+                break
+        return time.perf_counter() - start
+
+
+SCENARIO_CLASSES = {cls.name: cls for cls in (
+    ChatScenario, ChatStreamScenario, ImageAnalysisScenario, ImageGenerationScenario, WebSocketScenario
+)}
+
+
+async def run_scenario(scenario: Scenario, concurrency: int, duration: float, warmup: int, app_pid: Optional[int]) -> Dict[str, Any]:
+    """Drive a scenario with a fixed number of concurrent workers for a fixed duration"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    peak_rss = [0]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=scenario.base_url, limits=limits, timeout=120.0) as client:
+        states = await asyncio.gather(*[scenario.setup(worker, client) for worker in range(concurrency)])
+        for i in range(warmup):
+            try:
+                await scenario.run_once(i % concurrency, client, states[i % concurrency])
+            except Exception:
+                pass
+
+        baseline_rss = read_rss_kb(app_pid)
+        fallbacks_before = await demo_fallbacks(client)
+        stop_at = time.monotonic() + duration
+
+        async def sample_memory():
+            while time.monotonic() < stop_at:
+                peak_rss[0] = max(peak_rss[0], read_rss_kb(app_pid) or 0)
+                await asyncio.sleep(0.1)
+
+        async def worker_loop(worker: int):
+            while time.monotonic() < stop_at:
+                try:
+                    latencies.append(await scenario.run_once(worker, client, states[worker]))
+                except Exception as e:
+                    key = type(e).__name__ if not str(e) else f"{type(e).__name__}: {str(e)[:60]}"
+                    errors[key] = errors.get(key, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(sample_memory(), *[worker_loop(worker) for worker in range(concurrency)])
+        elapsed = time.perf_counter() - started
+        fallbacks_after = await demo_fallbacks(client)
+
+        for state in states:
+            if state is not None:
+                await scenario.teardown(state)
+
+    latencies.sort()
+    result = {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+    }
+    if fallbacks_before is not None and fallbacks_after is not None:
+        # Upstream failures are answered with demo replies rather than errors
+        result["demo_fallbacks"] = int(fallbacks_after - fallbacks_before)
+    if baseline_rss is not None:
+        result["rss_kb"] = peak_rss[0]
+        result["rss_per_connection_kb"] = round(max(0, peak_rss[0] - baseline_rss) / concurrency, 1)
+    return result
+
+
+def print_results(results: List[Dict[str, Any]]):
+    header = f"{'scenario':<18}{'conc':>6}{'reqs':>8}{'errs':>6}{'demo':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'KB/conn':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        per_conn = r.get("rss_per_connection_kb")
+        print(
+            f"{r['scenario']:<18}{r['concurrency']:>6}{r['requests']:>8}{r['errors']:>6}{r.get('demo_fallbacks', '-'):>6}{r['rps']:>10}"
+            f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{'-' if per_conn is None else per_conn:>10}"
+        )
+
+
+def compare_results(current: List[Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    """Print the change against a saved run; returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nComparison with {baseline_path} (commit {baseline.get('commit', '?')}):")
+    regressions = 0
+    for r in current:
+        old = previous.get((r["scenario"], r["concurrency"]))
+        if old is None:
+            continue
+        changes = []
+        for metric, higher_is_better in COMPARED_METRICS:
+            if metric not in r or not old.get(metric):
+                continue
+            change = (r[metric] - old[metric]) / old[metric]
+            worse = change < -threshold if higher_is_better else change > threshold
+            regressions += worse
+            changes.append(f"{metric} {old[metric]} -> {r[metric]} ({change:+.1%}){' REGRESSION' if worse else ''}")
+        print(f"  {r['scenario']} @ {r['concurrency']}: " + "; ".join(changes))
+    return regressions
+
+
+def start_process(args: List[str], env: Dict[str, str], log_file) -> subprocess.Popen:
+    return subprocess.Popen(args, cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+async def main_async(args, mock_args: List[str]) -> int:
+    processes = []
+    log_file = open(args.app_log, "w") if args.app_log else subprocess.DEVNULL
+    app_pid = args.pid
+    base_url = args.target
+    try:
+        if base_url is None:
+            mock_port = free_port()
+            app_port = free_port()
+            mock_url = f"http://127.0.0.1:{mock_port}"
+            processes.append(start_process(
+                [sys.executable, os.path.join(ROOT, "benchmarks", "mock_upstream.py"), "--port", str(mock_port), *mock_args],
+                dict(os.environ), log_file,
+            ))
+            env = dict(os.environ)
+            env.update({
+                "LLM_API_KEY": "bench",
+                "LLM_API_ENDPOINT": f"{mock_url}/v1/chat/completions",
+                "DALLE_ENDPOINT": mock_url,
+                "DALLE_API_KEY": "bench",
+            })
+            app_process = start_process(
+                [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning"],
+                env, log_file,
+            )
+            processes.append(app_process)
+            app_pid = app_process.pid
+            base_url = f"http://127.0.0.1:{app_port}"
+            await wait_until_healthy(f"{mock_url}/mock/stats")
+        await wait_until_healthy(f"{base_url}/health")
+
+        image_bytes = make_test_image(args.image_side)
+        results = []
+        for name in args.scenarios.split(","):
+            if name not in SCENARIO_CLASSES:
+                print(f"Unknown scenario '{name}', expected one of {', '.join(SCENARIOS)}")
+                continue
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                print(f"Running {name} at concurrency {concurrency} for {args.duration}s...", flush=True)
+                scenario = SCENARIO_CLASSES[name](base_url, image_bytes)
+                try:
+                    results.append(await run_scenario(scenario, concurrency, args.duration, args.warmup, app_pid))
+                except Exception as e:
+                    print(f"  {name} failed: {type(e).__name__}: {e}")
+
+        print()
+        print_results(results)
+
+        run = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "target": args.target or "local",
+            "duration_s": args.duration,
+            "mock_args": mock_args,
+            "results": results,
+        }
+        if not args.no_save:
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            path = args.output or os.path.join(
+                RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{run['commit']}.json"
+            )
+            with open(path, "w") as f:
+                json.dump(run, f, indent=2)
+            print(f"\nResults saved to {path}")
+
+        regressions = 0
+        if args.compare:
+            regressions = compare_results(results, args.compare, args.threshold)
+        return 1 if regressions and args.fail_on_regression else 0
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if log_file is not subprocess.DEVNULL:
+            log_file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the assistant against a local mock upstream",
+        epilog="Arguments after -- are passed to benchmarks/mock_upstream.py",
+    )
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--concurrency", default="10,50", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="Warm-up requests before measuring")
+    parser.add_argument("--image-side", type=int, default=1024, help="Side length of the uploaded test image")
+    parser.add_argument("--target", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--pid", type=int, help="Process id of --target, used to sample its memory")
+    parser.add_argument("--app-log", help="Write app and mock output to this file")
+    parser.add_argument("--output", help="Path of the results file")
+    parser.add_argument("--no-save", action="store_true", help="Do not save results")
+    parser.add_argument("--compare", help="Saved results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    argv = sys.argv[1:]
+    mock_args = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, mock_args = argv[:split], argv[split + 1:]
+    args = parser.parse_args(argv)
+    sys.exit(asyncio.run(main_async(args, mock_args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import json
 import os
 
+from services.tokenizer import count_tokens
+
 class ProfileModel:
     """
     Profile model for the personalized multimodal AI assistant.
@@ -13,7 +15,60 @@ class ProfileModel:
         Args:
             profile_path (str): Path to the profile JSON file
         """
+        self.profile_path = profile_path
         self.profile = self.load_profile(profile_path)
+    
+    @property
+    def profile(self):
+        """
+        The profile data. Assigning a new profile invalidates the cached
+        prompt and accessors.
+        """
+        return self._profile
+    
+    @profile.setter
+    def profile(self, value):
+        self._profile = value
+        self.invalidate_cache()
+    
+    def invalidate_cache(self):
+        """
+        Drop the cached prompt and accessor values. Call this after
+        mutating the profile dict in place.
+        """
+        self._rendered = None
+    
+    def _get_rendered(self):
+        """
+        Render the prompt and accessor values once and cache them.
+        
+        Returns:
+            dict: Cached prompt, token count, name, UI theme and avatar
+        """
+        if self._rendered is None:
+            prompt = self.render_personality_prompt()
+            self._rendered = {
+                "prompt": prompt,
+                "prompt_tokens": count_tokens(prompt),
+                "name": self._profile["basic_attributes"]["name"],
+                "ui_theme": self._profile["appearance"],
+                "avatar": self._profile["basic_attributes"]["avatar"],
+            }
+        return self._rendered
+    
+    def update_profile(self, updates):
+        """
+        Merge top-level sections into the profile and invalidate the cache.
+        
+        Args:
+            updates (dict): Profile sections to merge
+        """
+        for section, values in updates.items():
+            if isinstance(values, dict) and isinstance(self._profile.get(section), dict):
+                self._profile[section].update(values)
+            else:
+                self._profile[section] = values
+        self.invalidate_cache()
         
     def load_profile(self, path):
         """
@@ -88,6 +143,24 @@ class ProfileModel:
         }
     
     def get_personality_prompt(self):
+        """
+        Get the system prompt for the profile, rendered once and cached.
+        
+        Returns:
+            str: A system prompt for the LLM
+        """
+        return self._get_rendered()["prompt"]
+    
+    def get_prompt_token_count(self):
+        """
+        Get the token count of the cached system prompt.
+        
+        Returns:
+            int: Number of tokens in the system prompt
+        """
+        return self._get_rendered()["prompt_tokens"]
+    
+    def render_personality_prompt(self):
         """
         Generate a system prompt based on the profile's personality traits.
         
@@ -142,7 +215,7 @@ Always respond in a way that reflects these personality traits and values. Maint
         Returns:
             dict: UI theme settings
         """
-        return self.profile["appearance"]
+        return self._get_rendered()["ui_theme"]
     
     def get_name(self):
         """
@@ -151,7 +224,7 @@ Always respond in a way that reflects these personality traits and values. Maint
         Returns:
             str: The assistant's name
         """
-        return self.profile["basic_attributes"]["name"]
+        return self._get_rendered()["name"]
     
     def get_avatar(self):
         """
@@ -160,7 +233,7 @@ Always respond in a way that reflects these personality traits and values. Maint
         Returns:
             str: Path to the avatar image
         """
-        return self.profile["basic_attributes"]["avatar"]
+        return self._get_rendered()["avatar"]
     
     def save_profile(self, path=None):
         """
@@ -173,4 +246,7 @@ Always respond in a way that reflects these personality traits and values. Maint
             path = self.profile_path
             
         with open(path, 'w', encoding='utf-8') as f:
-            json.dump(self.profile, f, indent=4)
\ No newline at end of file
+            json.dump(self.profile, f, indent=4)
+        
+        # The saved profile may have been edited in place before saving
+        self.invalidate_cache()
\ No newline at end of file
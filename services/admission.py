@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+from services.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of queued for an upstream slot"""
+    def __init__(self, message: str, reason: str, retry_after: int):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, session_id: str, route: str):
+        self.session_id = session_id
+        self.route = route
+        self.queued_at = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    """
+    Admission control for upstream calls.
+
+    At most max_concurrency calls run at once, and at most
+    max_per_session of them for any one session. Requests beyond that
+    wait in a queue that is served round-robin across sessions, so one
+    session sending a burst waits behind its own requests rather than
+    everyone else's. Requests are shed with AdmissionRejected when the
+    queue, or the session's share of it, is full, or when they have
+    waited max_wait seconds.
+    """
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        max_per_session: int = 4,
+        max_queued: int = 256,
+        max_queued_per_session: int = 8,
+        max_wait: float = 10.0,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Initialize the controller.
+
+        Args:
+            max_concurrency (int): Upstream calls running at once across all sessions
+            max_per_session (int): Upstream calls running at once for one session
+            max_queued (int): Requests waiting across all sessions before new ones are shed
+            max_queued_per_session (int): Requests one session may have waiting
+            max_wait (float): Seconds a request may wait for a slot; 0 = no limit
+            metrics (MetricsRegistry, optional): Registry for the queue wait
+                histogram, the admission counter and in-flight and queue gauges
+        """
+        self.max_concurrency = max_concurrency
+        self.max_per_session = max_per_session
+        self.max_queued = max_queued
+        self.max_queued_per_session = max_queued_per_session
+        self.max_wait = max_wait
+
+        self.in_flight = 0
+        self.queued = 0
+        self._session_in_flight: Dict[str, int] = {}
+        # Session ID -> that session's waiting requests, in round-robin order
+        self._waiting: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected: Dict[str, int] = {}
+        self.total_queue_wait_seconds = 0.0
+        self.total_hold_seconds = 0.0
+        self.released = 0
+
+        self._queue_wait_seconds = None
+        self._requests_total = None
+        if metrics is not None:
+            self._queue_wait_seconds = metrics.histogram(
+                "admission_queue_wait_seconds", "Time requests wait for an upstream slot", ["route"]
+            )
+            self._requests_total = metrics.counter(
+                "admission_requests_total", "Requests admitted or shed by admission control", ["route", "outcome"]
+            )
+            metrics.gauge("admission_in_flight", "Upstream calls holding an admission slot", callback=lambda: self.in_flight)
+            metrics.gauge("admission_queued", "Requests waiting for an upstream slot", callback=lambda: self.queued)
+
+    def _has_slot(self, session_id: str) -> bool:
+        return (
+            self.in_flight < self.max_concurrency
+            and self._session_in_flight.get(session_id, 0) < self.max_per_session
+        )
+
+    def _grant(self, session_id: str, route: str, waited: float):
+        self.in_flight += 1
+        self._session_in_flight[session_id] = self._session_in_flight.get(session_id, 0) + 1
+        self.admitted += 1
+        self.total_queue_wait_seconds += waited
+        if self._queue_wait_seconds is not None:
+            self._queue_wait_seconds.observe(waited, route=route)
+            self._requests_total.inc(route=route, outcome="admitted")
+
+    def _reject(self, route: str, reason: str, message: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        if self._requests_total is not None:
+            self._requests_total.inc(route=route, outcome=reason)
+        raise AdmissionRejected(message, reason, self.retry_after())
+
+    async def acquire(self, session_id: str, route: str) -> float:
+        """
+        Wait for an upstream slot. Every successful acquire() must be
+        matched by a release().
+
+        Args:
+            session_id (str): Session the request is scheduled fairly within
+            route (str): Route label for the metrics ("chat", "vision", ...)
+
+        Returns:
+            float: Monotonic time the slot was granted, for release()
+
+        Raises:
+            AdmissionRejected: If the request is shed
+        """
+        # Run at once unless the session already has requests waiting (they go first)
+        if session_id not in self._waiting and self._has_slot(session_id):
+            self._grant(session_id, route, 0.0)
+            return time.monotonic()
+
+        if self.queued >= self.max_queued:
+            self._reject(route, "queue_full", f"{self.queued} requests already waiting for an upstream slot")
+        session_waiting = self._waiting.get(session_id)
+        if session_waiting is not None and len(session_waiting) >= self.max_queued_per_session:
+            self._reject(route, "session_queue_full", f"Session already has {len(session_waiting)} requests waiting")
+
+        waiter = _Waiter(session_id, route)
+        if session_waiting is None:
+            # A session with nothing waiting joins the back of the rotation
+            session_waiting = self._waiting[session_id] = deque()
+        session_waiting.append(waiter)
+        self.queued += 1
+        self.queued_total += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait or None)
+        except BaseException as e:
+            if waiter.future.done():
+                # Granted just as we gave up; hand the slot on
+                self.release(session_id)
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(route, "timeout", f"No upstream slot within {self.max_wait}s")
+            raise
+        return time.monotonic()
+
+    def release(self, session_id: str, admitted_at: Optional[float] = None):
+        """
+        Give back a slot taken by acquire() and admit the next waiting request.
+
+        Args:
+            session_id (str): Session passed to acquire()
+            admitted_at (float, optional): Value returned by acquire(), for the
+                average hold time behind retry_after()
+        """
+        self.in_flight -= 1
+        remaining = self._session_in_flight.get(session_id, 1) - 1
+        if remaining:
+            self._session_in_flight[session_id] = remaining
+        else:
+            self._session_in_flight.pop(session_id, None)
+        if admitted_at is not None:
+            self.released += 1
+            self.total_hold_seconds += time.monotonic() - admitted_at
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, session_id: str, route: str):
+        """Hold an upstream slot for the duration of the block"""
+        admitted_at = await self.acquire(session_id, route)
+        try:
+            yield
+        finally:
+            self.release(session_id, admitted_at)
+
+    def _remove(self, waiter: _Waiter):
+        session_waiting = self._waiting.get(waiter.session_id)
+        if session_waiting is None:
+            return
+        try:
+            session_waiting.remove(waiter)
+        except ValueError:
+            return
+        self.queued -= 1
+        if not session_waiting:
+            del self._waiting[waiter.session_id]
+
+    def _dispatch(self):
+        """Admit waiting requests round-robin across sessions while slots are free"""
+        while self.in_flight < self.max_concurrency and self._waiting:
+            for session_id in self._waiting:
+                if self._has_slot(session_id):
+                    break
+            else:
+                # Every waiting session is at its own limit
+                return
+            session_waiting = self._waiting.pop(session_id)
+            waiter = session_waiting.popleft()
+            self.queued -= 1
+            if session_waiting:
+                # Back of the rotation
+                self._waiting[session_id] = session_waiting
+            self._grant(session_id, waiter.route, time.monotonic() - waiter.queued_at)
+            waiter.future.set_result(None)
+
+    def retry_after(self) -> int:
+        """
+        Estimate how long a shed client should wait before retrying.
+
+        Returns:
+            int: Suggested delay in seconds
+        """
+        avg_hold = self.total_hold_seconds / self.released if self.released else 1.0
+        return max(1, math.ceil(avg_hold * (self.queued + 1) / self.max_concurrency))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get slot usage, queue depth and admission counters.
+
+        Returns:
+            dict: Admission control statistics
+        """
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_per_session": self.max_per_session,
+            "max_queued": self.max_queued,
+            "max_queued_per_session": self.max_queued_per_session,
+            "max_wait": self.max_wait,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "waiting_sessions": len(self._waiting),
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "rejected": dict(self.rejected),
+            "avg_queue_wait_seconds": round(self.total_queue_wait_seconds / self.admitted, 4) if self.admitted else 0.0,
+            "avg_hold_seconds": round(self.total_hold_seconds / self.released, 4) if self.released else 0.0,
+        }
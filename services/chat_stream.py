@@ -0,0 +1,51 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+async def iter_chat_deltas(response: httpx.Response) -> AsyncIterator[str]:
+    """
+    Parse an OpenAI-compatible streaming chat completion response.
+
+    Args:
+        response (httpx.Response): Streaming upstream response
+
+    Yields:
+        str: Content deltas in the order they arrive
+    """
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping malformed stream chunk: {data[:100]}")
+            continue
+        for choice in chunk.get("choices", []):
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+def format_sse(data: Any, event: Optional[str] = None) -> str:
+    """
+    Format a server-sent event.
+
+    Args:
+        data: JSON-serializable event payload
+        event (str, optional): Event name
+
+    Returns:
+        str: The encoded event, terminated by a blank line
+    """
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n" + message
+    return message
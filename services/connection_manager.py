@@ -0,0 +1,246 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple, Union
+
+from fastapi import WebSocket
+
+from services.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "disconnect")
+
+# Close code for consumers disconnected because they cannot keep up (1008 = policy violation)
+SLOW_CONSUMER_CLOSE_CODE = 1008
+
+
+class ClientConnection:
+    """
+    One open WebSocket and its outbound broadcast queue.
+
+    Direct sends (chat replies) and queued broadcasts share a lock, so
+    frames never interleave, and every send is bounded by the send timeout.
+    The queue is drained by a writer task that only runs while it has
+    messages, so idle connections cost no task.
+    """
+    def __init__(self, manager: "ConnectionManager", websocket: WebSocket, client_id: str):
+        self.manager = manager
+        self.websocket = websocket
+        self.client_id = client_id
+        self.queue: Deque[Tuple[str, float]] = deque()
+        self.closed = False
+        self.dropped = 0
+        self._send_lock = asyncio.Lock()
+        self._writer: Optional[asyncio.Task] = None
+
+    async def send_text(self, text: str):
+        """
+        Send a frame right away (ahead of queued broadcasts).
+
+        Raises:
+            asyncio.TimeoutError: If the client does not take the frame within the send timeout
+        """
+        async with self._send_lock:
+            await asyncio.wait_for(self.websocket.send_text(text), timeout=self.manager.send_timeout)
+
+    def enqueue(self, text: str, queued_at: float) -> bool:
+        """
+        Queue a broadcast frame without waiting.
+
+        Returns:
+            bool: False if the connection was disconnected as a slow consumer
+        """
+        if self.closed:
+            return False
+        if len(self.queue) >= self.manager.max_queue:
+            if self.manager.slow_consumer_policy == "disconnect":
+                self.manager._dropped("queue_full")
+                self.manager._reap(self, "slow_consumer")
+                return False
+            self.queue.popleft()
+            self.dropped += 1
+            self.manager._dropped("queue_full")
+        self.queue.append((text, queued_at))
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._drain())
+        return True
+
+    async def _drain(self):
+        try:
+            while self.queue and not self.closed:
+                text, queued_at = self.queue.popleft()
+                try:
+                    await self.send_text(text)
+                except asyncio.TimeoutError:
+                    self.manager._dropped("send_timeout")
+                    self.manager._reap(self, "send_timeout")
+                    return
+                except Exception as e:
+                    logger.info(f"Broadcast to {self.client_id} failed: {str(e)}")
+                    self.manager._dropped("send_error")
+                    self.manager._reap(self, "send_error")
+                    return
+                self.manager._delivered(time.perf_counter() - queued_at)
+        finally:
+            self._writer = None
+
+    def close(self):
+        """Stop delivering queued broadcasts"""
+        self.closed = True
+        self.queue.clear()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+
+class ConnectionManager:
+    """
+    Tracks open WebSockets and fans broadcasts out to them.
+
+    A broadcast is serialized once and appended to every connection's
+    bounded queue; each connection's writer delivers it concurrently with
+    the others under a per-send timeout, so one slow or dead client never
+    holds up the rest. A connection whose queue is full either loses its
+    oldest queued message or is disconnected, depending on the policy.
+    """
+    def __init__(
+        self,
+        send_timeout: float = 5.0,
+        max_queue: int = 64,
+        slow_consumer_policy: str = "drop_oldest",
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Initialize the connection manager.
+
+        Args:
+            send_timeout (float): Seconds a single send may take before the
+                client is treated as dead and disconnected
+            max_queue (int): Broadcasts queued per connection
+            slow_consumer_policy (str): "drop_oldest" or "disconnect" when a queue is full
+            metrics (MetricsRegistry, optional): Registry for fan-out and
+                delivery latency and drop counters
+        """
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            logger.warning(f"Unknown slow consumer policy '{slow_consumer_policy}'. Using drop_oldest.")
+            slow_consumer_policy = "drop_oldest"
+        self.active_connections: Dict[str, ClientConnection] = {}
+        self.send_timeout = send_timeout
+        self.max_queue = max_queue
+        self.slow_consumer_policy = slow_consumer_policy
+
+        self.broadcasts = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.reaped = 0
+        self.last_fanout_seconds = 0.0
+
+        self._fanout_seconds = None
+        self._delivery_seconds = None
+        self._dropped_messages = None
+        if metrics is not None:
+            self._fanout_seconds = metrics.histogram(
+                "websocket_broadcast_fanout_seconds", "Time to serialize a broadcast and queue it for every connection"
+            )
+            self._delivery_seconds = metrics.histogram(
+                "websocket_broadcast_delivery_seconds", "Time from broadcast to delivery on a connection"
+            )
+            self._dropped_messages = metrics.counter(
+                "websocket_broadcast_dropped_total", "Broadcast messages not delivered, by reason", ["reason"]
+            )
+            metrics.gauge(
+                "websocket_broadcast_queued", "Broadcast messages waiting in connection queues",
+                callback=lambda: sum(len(connection.queue) for connection in list(self.active_connections.values())),
+            )
+
+    async def connect(self, websocket: WebSocket, client_id: str) -> ClientConnection:
+        await websocket.accept()
+        previous = self.active_connections.get(client_id)
+        if previous is not None:
+            previous.close()
+        connection = ClientConnection(self, websocket, client_id)
+        self.active_connections[client_id] = connection
+        return connection
+
+    def disconnect(self, client_id: str, websocket: Optional[WebSocket] = None):
+        # A reconnect may already have replaced the socket under this ID
+        connection = self.active_connections.get(client_id)
+        if connection is not None and websocket in (None, connection.websocket):
+            del self.active_connections[client_id]
+            connection.close()
+
+    async def send_message(self, message: str, client_id: str):
+        connection = self.active_connections.get(client_id)
+        if connection is not None:
+            await connection.send_text(message)
+
+    async def broadcast(self, message: Union[str, Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Queue a message for every open connection. Delivery happens in the
+        background; this returns as soon as every queue has the message.
+
+        Args:
+            message (str or dict): Text frame, or an object to send as JSON
+
+        Returns:
+            dict: Number of connections the message was queued for and
+                number of slow consumers disconnected instead
+        """
+        started = time.perf_counter()
+        text = message if isinstance(message, str) else json.dumps(message)
+        queued = 0
+        disconnected = 0
+        # Iterate over a snapshot: slow consumers are removed while we go
+        for connection in list(self.active_connections.values()):
+            if connection.enqueue(text, started):
+                queued += 1
+            else:
+                disconnected += 1
+        self.broadcasts += 1
+        self.last_fanout_seconds = time.perf_counter() - started
+        if self._fanout_seconds is not None:
+            self._fanout_seconds.observe(self.last_fanout_seconds)
+        return {"queued": queued, "disconnected": disconnected}
+
+    def _delivered(self, latency: float):
+        self.delivered += 1
+        if self._delivery_seconds is not None:
+            self._delivery_seconds.observe(latency)
+
+    def _dropped(self, reason: str):
+        self.dropped += 1
+        if self._dropped_messages is not None:
+            self._dropped_messages.inc(reason=reason)
+
+    def _reap(self, connection: ClientConnection, reason: str):
+        """Disconnect a client that cannot keep up; its receive loop then ends"""
+        if connection.closed:
+            return
+        logger.warning(f"Disconnecting WebSocket {connection.client_id}: {reason}")
+        self.reaped += 1
+        self.disconnect(connection.client_id, connection.websocket)
+        connection.close()
+        task = asyncio.ensure_future(connection.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get connection and broadcast counters.
+
+        Returns:
+            dict: Connection manager statistics
+        """
+        return {
+            "active_connections": len(self.active_connections),
+            "queued": sum(len(connection.queue) for connection in self.active_connections.values()),
+            "max_queue": self.max_queue,
+            "send_timeout": self.send_timeout,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "broadcasts": self.broadcasts,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "reaped": self.reaped,
+            "last_fanout_seconds": round(self.last_fanout_seconds, 6),
+        }
@@ -0,0 +1,320 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from services.metrics import MetricsRegistry
+from services.resilience import CircuitBreaker, RateLimiter, UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Smoothing factor of the latency and success moving averages
+EWMA_ALPHA = 0.2
+
+# Endpoints whose success average drops below this are only used as a last resort
+UNHEALTHY_BELOW = 0.5
+
+# Half-life in seconds of a health deficit, so a drained endpoint gets
+# traffic again once it has been left alone for a while
+HEALTH_RECOVERY_HALF_LIFE = 30.0
+
+STRATEGIES = ("least_outstanding", "latency")
+
+
+class NoEndpointAvailable(UpstreamUnavailable):
+    """Raised when a pool has no endpoint that can take a call"""
+
+
+class Endpoint:
+    """
+    One upstream deployment: its URL and key, its own quota limiter and
+    circuit breaker, and the load and health figures used for routing.
+    """
+    def __init__(
+        self,
+        name: str,
+        url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        deployment: Optional[str] = None,
+        api_version: Optional[str] = None,
+        weight: float = 1.0,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        breaker_failures: int = 5,
+        breaker_reset_seconds: float = 30.0,
+    ):
+        """
+        Initialize an endpoint.
+
+        Args:
+            name (str): Name used in stats and metrics
+            url (str, optional): Chat completions URL, or the resource URL for DALL-E
+            api_key (str, optional): API key for this deployment
+            deployment (str, optional): Deployment name (DALL-E endpoints)
+            api_version (str, optional): API version (DALL-E endpoints)
+            weight (float): Relative capacity; a weight-2 endpoint takes twice the load
+            requests_per_minute (float): Request quota; 0 = unlimited
+            tokens_per_minute (float): Token quota; 0 = unlimited
+            breaker_failures (int): Consecutive failures that open the circuit
+            breaker_reset_seconds (float): Seconds before a probe call is allowed
+        """
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.deployment = deployment
+        self.api_version = api_version
+        self.weight = max(weight, 0.001)
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.circuit_breaker = CircuitBreaker(breaker_failures, breaker_reset_seconds)
+        # SDK client for endpoints not called through UpstreamClient (DALL-E)
+        self.client = None
+
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None
+        self._health = 1.0
+        self._health_at = time.monotonic()
+        self.throttled_until = 0.0
+
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.throttled = 0
+
+    @property
+    def health(self) -> float:
+        """Moving average of call success, recovering towards 1 while idle"""
+        idle = time.monotonic() - self._health_at
+        return 1.0 - (1.0 - self._health) * 0.5 ** (idle / HEALTH_RECOVERY_HALF_LIFE)
+
+    def record_health(self, success: bool):
+        self._health = EWMA_ALPHA * success + (1 - EWMA_ALPHA) * self.health
+        self._health_at = time.monotonic()
+
+    def available(self, now: float) -> bool:
+        return now >= self.throttled_until and self.circuit_breaker.allows_call()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "deployment": self.deployment,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "latency_ewma_seconds": round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+            "health": round(self.health, 3),
+            "throttled_for_seconds": round(max(0.0, self.throttled_until - time.monotonic()), 3),
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "circuit_breaker": self.circuit_breaker.stats(),
+            "rate_limiter": self.rate_limiter.stats(),
+        }
+
+
+class EndpointPool:
+    """
+    Routes calls for one model across several deployments.
+    Throttled endpoints are drained until their Retry-After passes, open
+    circuits are skipped, endpoints with a poor success average are only
+    used when nothing healthier is left, and among the rest the pick is by
+    least outstanding requests or by latency-weighted load.
+    """
+    def __init__(self, name: str, endpoints: List[Endpoint], strategy: str = "least_outstanding", metrics: Optional[MetricsRegistry] = None):
+        """
+        Initialize the pool.
+
+        Args:
+            name (str): Pool name, e.g. "text", "vision" or "image"
+            endpoints (list): Endpoints in the pool
+            strategy (str): "least_outstanding" or "latency"
+            metrics (MetricsRegistry, optional): Registry for per-endpoint metrics
+        """
+        if strategy not in STRATEGIES:
+            logger.warning(f"Unknown routing strategy '{strategy}' for pool {name}. Using least_outstanding.")
+            strategy = "least_outstanding"
+        self.name = name
+        self.endpoints = endpoints
+        self.strategy = strategy
+
+        self._requests = None
+        self._latency = None
+        self._outstanding = None
+        self._health = None
+        if metrics is not None:
+            # Shared by all pools; the first pool registers them
+            labels = ["pool", "endpoint"]
+            self._requests = metrics.get("upstream_endpoint_requests_total") or metrics.counter(
+                "upstream_endpoint_requests_total", "Upstream calls by pool, endpoint and outcome", labels + ["outcome"]
+            )
+            self._latency = metrics.get("upstream_endpoint_latency_seconds") or metrics.histogram(
+                "upstream_endpoint_latency_seconds", "Upstream call latency by pool and endpoint", labels
+            )
+            self._outstanding = metrics.get("upstream_endpoint_outstanding") or metrics.gauge(
+                "upstream_endpoint_outstanding", "Calls in flight per endpoint", labels
+            )
+            self._health = metrics.get("upstream_endpoint_health") or metrics.gauge(
+                "upstream_endpoint_health", "Moving average of call success per endpoint at its last call (0-1)", labels
+            )
+            for endpoint in endpoints:
+                self._outstanding.set(0, pool=name, endpoint=endpoint.name)
+                self._health.set(endpoint.health, pool=name, endpoint=endpoint.name)
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def _load(self, endpoint: Endpoint) -> float:
+        load = (endpoint.outstanding + 1) / endpoint.weight
+        if self.strategy == "latency" and endpoint.latency_ewma is not None:
+            load *= endpoint.latency_ewma
+        return load
+
+    def select(self, token_cost: int = 0, exclude: Iterable[str] = ()) -> Endpoint:
+        """
+        Pick the endpoint for the next call.
+
+        Args:
+            token_cost (int): Estimated tokens of the call
+            exclude (iterable): Names of endpoints to avoid (e.g. ones that
+                just failed), ignored if nothing else is available
+
+        Returns:
+            Endpoint: The selected endpoint
+
+        Raises:
+            NoEndpointAvailable: If every endpoint is throttled or its circuit is open
+        """
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.available(now)]
+        if not candidates:
+            if not self.endpoints:
+                raise NoEndpointAvailable(f"No {self.name} endpoints are configured")
+            raise NoEndpointAvailable(f"All {self.name} endpoints are throttled or failing")
+        excluded = set(exclude)
+        preferred = [endpoint for endpoint in candidates if endpoint.name not in excluded]
+        candidates = preferred or candidates
+        return min(candidates, key=lambda endpoint: (
+            endpoint.health < UNHEALTHY_BELOW,
+            endpoint.rate_limiter.wait_time(token_cost) > 0,
+            self._load(endpoint),
+        ))
+
+    def next_available_in(self) -> Optional[float]:
+        """
+        Time until a throttled endpoint can take a call again. Endpoints
+        with an open circuit are not waited for, so calls fail fast.
+
+        Returns:
+            float: Seconds to wait, or None if no endpoint is merely throttled
+        """
+        now = time.monotonic()
+        waits = [
+            max(0.0, endpoint.throttled_until - now)
+            for endpoint in self.endpoints
+            if endpoint.circuit_breaker.allows_call()
+        ]
+        return min(waits) if waits else None
+
+    def can_fail_over(self, exclude: Iterable[str]) -> bool:
+        """Whether an endpoint other than the excluded ones can take a call now"""
+        now = time.monotonic()
+        excluded = set(exclude)
+        return any(endpoint.available(now) for endpoint in self.endpoints if endpoint.name not in excluded)
+
+    def begin(self, endpoint: Endpoint) -> float:
+        """
+        Mark the start of a call on an endpoint.
+
+        Returns:
+            float: Start time to pass to end()
+        """
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        if self._outstanding is not None:
+            self._outstanding.set(endpoint.outstanding, pool=self.name, endpoint=endpoint.name)
+        return time.perf_counter()
+
+    def release(self, endpoint: Endpoint):
+        """Stop counting a call as outstanding on its endpoint"""
+        endpoint.outstanding -= 1
+        if self._outstanding is not None:
+            self._outstanding.set(endpoint.outstanding, pool=self.name, endpoint=endpoint.name)
+
+    def end(self, endpoint: Endpoint, started: float, outcome: str, retry_after: Optional[float] = None, release: bool = True):
+        """
+        Record the outcome of a call.
+
+        Args:
+            endpoint (Endpoint): The endpoint that was called
+            started (float): Value returned by begin()
+            outcome (str): "success", "failure", "throttled" or "cancelled"
+            retry_after (float, optional): Server-provided cooldown for throttling
+            release (bool): Release the call now; pass False for a response
+                that is still being streamed and call release() when it closes
+        """
+        if release:
+            self.release(endpoint)
+        if outcome == "cancelled":
+            endpoint.circuit_breaker.abandon()
+            return
+        elapsed = time.perf_counter() - started
+        if outcome == "success":
+            endpoint.successes += 1
+            endpoint.circuit_breaker.record_success()
+            endpoint.latency_ewma = elapsed if endpoint.latency_ewma is None else (
+                EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * endpoint.latency_ewma
+            )
+        elif outcome == "throttled":
+            endpoint.throttled += 1
+            endpoint.circuit_breaker.record_success()
+            cooldown = retry_after if retry_after is not None else 1.0
+            endpoint.throttled_until = max(endpoint.throttled_until, time.monotonic() + cooldown)
+        else:
+            endpoint.failures += 1
+            endpoint.circuit_breaker.record_failure()
+        endpoint.record_health(outcome == "success")
+
+        if self._requests is not None:
+            self._requests.inc(pool=self.name, endpoint=endpoint.name, outcome=outcome)
+            self._latency.observe(elapsed, pool=self.name, endpoint=endpoint.name)
+            self._health.set(endpoint.health, pool=self.name, endpoint=endpoint.name)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get routing strategy and per-endpoint load and health.
+
+        Returns:
+            dict: Pool statistics
+        """
+        return {
+            "strategy": self.strategy,
+            "endpoints": {endpoint.name: endpoint.stats() for endpoint in self.endpoints},
+        }
+
+
+def load_endpoints_file(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Load endpoint definitions per pool from a JSON file.
+
+    Entries take the Endpoint constructor arguments; they may give
+    "api_key_env" to read the key from an environment variable instead of
+    storing it in the file.
+
+    Args:
+        path (str): Path to the JSON file
+
+    Returns:
+        dict: Pool name to list of endpoint settings
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    pools = {}
+    for pool_name, entries in config.items():
+        pools[pool_name] = []
+        for entry in entries:
+            entry = dict(entry)
+            key_env = entry.pop("api_key_env", None)
+            if key_env and not entry.get("api_key"):
+                entry["api_key"] = os.getenv(key_env)
+            pools[pool_name].append(entry)
+    return pools
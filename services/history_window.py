@@ -0,0 +1,167 @@
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from services.tokenizer import count_tokens
+
+# Tokens the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Characters of each dropped message kept in the summary
+SUMMARY_SNIPPET_CHARS = 120
+
+
+class HistoryWindow:
+    """
+    Fits conversation history into a token budget.
+    Messages are packed newest first until the budget is spent; older
+    turns are dropped, or optionally condensed into a short summary note.
+    Token counts are cached by a digest of the message content, so each
+    message is only tokenized once and long messages are not kept alive
+    by the cache.
+    """
+    def __init__(self, budget: int = 6000, summarize: bool = False, summary_tokens: int = 200, cache_size: int = 10000):
+        """
+        Initialize the history window.
+
+        Args:
+            budget (int): Token budget for the whole prompt
+            summarize (bool): Add a summary of dropped turns to the prompt
+            summary_tokens (int): Maximum tokens used by the summary
+            cache_size (int): Number of per-message token counts cached
+        """
+        self.budget = budget
+        self.summarize = summarize
+        self.summary_tokens = summary_tokens
+        self.cache_size = cache_size
+        # Content digest -> token count
+        self._token_cache: "OrderedDict[bytes, int]" = OrderedDict()
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.messages_dropped = 0
+        self.windows_trimmed = 0
+
+    def count(self, message: Dict[str, Any]) -> int:
+        """
+        Count the tokens of a chat message, using the cache when possible.
+
+        Args:
+            message (dict): Message with role and string content
+
+        Returns:
+            int: Token count including per-message overhead
+        """
+        content = message.get("content") or ""
+        if not isinstance(content, str):
+            content = str(content)
+        key = hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+        tokens = self._token_cache.get(key)
+        if tokens is None:
+            self.cache_misses += 1
+            tokens = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            self._token_cache[key] = tokens
+            if len(self._token_cache) > self.cache_size:
+                self._token_cache.popitem(last=False)
+        else:
+            self.cache_hits += 1
+            self._token_cache.move_to_end(key)
+        return tokens
+
+    def fit(self, history: List[Dict[str, str]], reserved_tokens: int) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """
+        Select the newest messages that fit in the budget.
+
+        Args:
+            history (list): Conversation history, oldest first
+            reserved_tokens (int): Tokens already used by the system prompt
+                and the current message
+
+        Returns:
+            tuple: (kept messages oldest first, dropped messages oldest first)
+        """
+        available = self.budget - reserved_tokens
+        if self.summarize:
+            available -= self.summary_tokens
+
+        kept = 0
+        used = 0
+        for message in reversed(history):
+            tokens = self.count(message)
+            if used + tokens > available:
+                break
+            used += tokens
+            kept += 1
+
+        split = len(history) - kept
+        if split:
+            self.windows_trimmed += 1
+            self.messages_dropped += split
+        return history[split:], history[:split]
+
+    def summarize_dropped(self, dropped: List[Dict[str, str]]) -> str:
+        """
+        Build a short extractive summary of dropped turns without calling the LLM.
+
+        Args:
+            dropped (list): Dropped messages, oldest first
+
+        Returns:
+            str: Summary note that fits in summary_tokens
+        """
+        header = "Summary of earlier conversation turns that no longer fit in context:"
+        lines = [header]
+        used = count_tokens(header)
+        # Prefer the most recent dropped turns when the summary is full
+        for message in reversed(dropped):
+            snippet = " ".join(message["content"].split())
+            if len(snippet) > SUMMARY_SNIPPET_CHARS:
+                snippet = snippet[:SUMMARY_SNIPPET_CHARS] + "..."
+            line = f"- {message['role']}: {snippet}"
+            tokens = count_tokens(line)
+            if used + tokens > self.summary_tokens:
+                break
+            lines.insert(1, line)
+            used += tokens
+        return "\n".join(lines)
+
+    def build(self, system_prompt: str, system_tokens: int, history: List[Dict[str, str]], user_message: str) -> List[Dict[str, str]]:
+        """
+        Build the messages array within the token budget.
+
+        Args:
+            system_prompt (str): System prompt
+            system_tokens (int): Token count of the system prompt
+            history (list): Conversation history, oldest first
+            user_message (str): Current user message
+
+        Returns:
+            list: Messages for the chat completion request
+        """
+        current = {"role": "user", "content": user_message}
+        reserved = system_tokens + MESSAGE_OVERHEAD_TOKENS + self.count(current)
+        kept, dropped = self.fit(history, reserved)
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if dropped and self.summarize:
+            messages.append({"role": "system", "content": self.summarize_dropped(dropped)})
+        messages.extend(kept)
+        messages.append(current)
+        return messages
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get windowing and token cache counters.
+
+        Returns:
+            dict: History window statistics
+        """
+        return {
+            "budget": self.budget,
+            "summarize": self.summarize,
+            "cached_token_counts": len(self._token_cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "windows_trimmed": self.windows_trimmed,
+            "messages_dropped": self.messages_dropped,
+        }
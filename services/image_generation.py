@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from services.endpoint_pool import EndpointPool
+from services.metrics import MetricsRegistry
+from services.resilience import CircuitOpenError, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+class ImageGenerationQueueFull(Exception):
+    """Raised when too many image generation requests are already waiting"""
+
+
+class ImageGenerator:
+    """
+    Async, bounded front end for DALL-E image generation.
+    At most max_concurrency generations run at once; up to max_queue more
+    wait for a slot, and anything beyond that is rejected immediately.
+    Each generation goes to a deployment picked from the endpoint pool and
+    moves once to another deployment if the first is throttled or fails.
+    The openai SDK is only imported, and its clients created, on first use.
+    """
+    def __init__(
+        self,
+        pool: EndpointPool,
+        max_concurrency: int = 4,
+        max_queue: int = 16,
+        timeout: float = 90.0,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Initialize the image generator.
+
+        Args:
+            pool (EndpointPool): DALL-E endpoints, each with a resource URL,
+                API key, API version and deployment name
+            max_concurrency (int): Maximum number of concurrent generations
+            max_queue (int): Maximum number of requests waiting for a slot
+            timeout (float): Per-request timeout in seconds, including queue wait
+            metrics (MetricsRegistry, optional): Registry for queue wait and
+                generation latency histograms and queue depth gauges
+        """
+        self.pool = pool
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.total_generation_seconds = 0.0
+
+        self._queue_wait_seconds = None
+        self._generation_seconds = None
+        if metrics is not None:
+            self._queue_wait_seconds = metrics.histogram(
+                "image_generation_queue_wait_seconds", "Time image generation requests wait for a slot"
+            )
+            self._generation_seconds = metrics.histogram(
+                "image_generation_duration_seconds", "DALL-E call latency by outcome", ["outcome"]
+            )
+            metrics.gauge("image_generation_waiting", "Image generation requests waiting for a slot", callback=lambda: self.waiting)
+            metrics.gauge("image_generation_in_flight", "Image generation requests running", callback=lambda: self.in_flight)
+
+    async def generate(self, prompt: str, style: str, quality: str, size: str) -> str:
+        """
+        Generate an image without blocking the event loop.
+
+        Args:
+            prompt (str): Image description
+            style (str): "vivid" or "natural"
+            quality (str): "standard" or "hd"
+            size (str): Image size such as "1024x1024"
+
+        Returns:
+            str: URL of the generated image
+
+        Raises:
+            ImageGenerationQueueFull: If the wait queue is full
+            asyncio.TimeoutError: If the request does not finish within the timeout
+        """
+        queued_at = time.monotonic()
+        if not self._semaphore.locked():
+            # A slot is free, so this acquire does not suspend
+            await self._semaphore.acquire()
+        elif self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ImageGenerationQueueFull(f"{self.waiting} image generation requests already queued")
+        else:
+            # Wait for a free slot; the wait counts against the request timeout
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+            finally:
+                self.waiting -= 1
+        waited = time.monotonic() - queued_at
+        self.total_wait_seconds += waited
+        if self._queue_wait_seconds is not None:
+            self._queue_wait_seconds.observe(waited)
+
+        self.in_flight += 1
+        started_at = time.monotonic()
+        outcome = "error"
+        try:
+            result = await asyncio.wait_for(
+                self._generate_on_pool(prompt=prompt, n=1, style=style, quality=quality, size=size),
+                timeout=max(self.timeout - waited, 0.001)
+            )
+            image_data = json.loads(result.model_dump_json())
+            self.completed += 1
+            self.total_generation_seconds += time.monotonic() - started_at
+            outcome = "success"
+            return image_data['data'][0]['url']
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            outcome = "timeout"
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            if self._generation_seconds is not None:
+                self._generation_seconds.observe(time.monotonic() - started_at, outcome=outcome)
+
+    def create_clients(self):
+        """Create the SDK client of every endpoint now rather than on first use"""
+        import openai
+
+        for endpoint in self.pool.endpoints:
+            if endpoint.client is None:
+                endpoint.client = openai.AsyncAzureOpenAI(
+                    api_version=endpoint.api_version,
+                    azure_endpoint=endpoint.url,
+                    api_key=endpoint.api_key,
+                    timeout=self.timeout,
+                    # With several deployments, fail over instead of retrying a throttled one
+                    max_retries=0 if len(self.pool) > 1 else 2,
+                )
+
+    async def close(self):
+        """Close the SDK clients"""
+        for endpoint in self.pool.endpoints:
+            if endpoint.client is not None:
+                await endpoint.client.close()
+                endpoint.client = None
+
+    async def _generate_on_pool(self, **params: Any):
+        """Call images.generate on a pooled deployment, failing over once"""
+        import openai
+
+        self.create_clients()
+        tried = set()
+        # Deployments whose circuit refused the call; skipped without using up the failover
+        skipped = set()
+        while True:
+            endpoint = self.pool.select(exclude=tried | skipped)
+            try:
+                endpoint.circuit_breaker.before_call()
+            except CircuitOpenError:
+                if endpoint.name in skipped:
+                    # select() only returns a skipped deployment when nothing else is left
+                    raise
+                skipped.add(endpoint.name)
+                continue
+            started = self.pool.begin(endpoint)
+            try:
+                result = await endpoint.client.images.generate(model=endpoint.deployment, **params)
+            except openai.RateLimitError as e:
+                self.pool.end(endpoint, started, "throttled", parse_retry_after(e.response.headers))
+                error = e
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                self.pool.end(endpoint, started, "failure")
+                error = e
+            except openai.APIStatusError:
+                # Rejected request (e.g. content policy); the deployment itself is fine
+                self.pool.end(endpoint, started, "success")
+                raise
+            except BaseException:
+                self.pool.end(endpoint, started, "cancelled")
+                raise
+            else:
+                self.pool.end(endpoint, started, "success")
+                return result
+
+            tried.add(endpoint.name)
+            if len(tried) > 1 or not self.pool.can_fail_over(tried):
+                raise error
+            logger.warning(f"Image generation failed on {endpoint.name} ({type(error).__name__}); trying another deployment")
+
+    def retry_after(self) -> int:
+        """
+        Estimate how long a rejected client should wait before retrying.
+
+        Returns:
+            int: Suggested delay in seconds
+        """
+        avg_generation = self.total_generation_seconds / self.completed if self.completed else self.timeout / 4
+        return max(1, int(avg_generation * (self.waiting + self.in_flight) / self.max_concurrency))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue and concurrency counters.
+
+        Returns:
+            dict: Image generation counters
+        """
+        started = self.completed + self.failed + self.timeouts
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_queue_wait_seconds": round(self.total_wait_seconds / started, 3) if started else 0.0,
+            "avg_generation_seconds": round(self.total_generation_seconds / self.completed, 3) if self.completed else 0.0,
+            "pool": self.pool.stats(),
+        }
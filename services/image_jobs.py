@@ -0,0 +1,311 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from services.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# Lower value = served first
+JOB_PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class ImageJobQueueFull(Exception):
+    """Raised when no more image generation jobs can be queued"""
+
+
+class ImageJob:
+    """One image generation request: queued, running, then succeeded or failed"""
+    def __init__(self, params: Any, session_id: str, priority: str = "normal", client_id: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.session_id = session_id
+        self.priority = priority
+        self.client_id = client_id
+        self.status = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+        self.created_at = time.time()
+        self.queued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        queue_wait = (self.started_at or time.monotonic()) - self.queued_at
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "session_id": self.session_id,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "queue_wait_seconds": round(queue_wait, 3),
+            "run_seconds": round(self.finished_at - self.started_at, 3) if self.finished_at and self.started_at else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class ImageJobQueue:
+    """
+    Background queue of image generation jobs.
+
+    Submitting returns at once; a fixed pool of workers runs the jobs. Jobs
+    are taken by priority, and within a priority round-robin across
+    sessions, so one session submitting a burst cannot starve the others.
+    Finished jobs are kept for result_ttl seconds so clients can poll for
+    them, and an optional callback is told about each finished job (e.g.
+    to push it over the client's WebSocket).
+    """
+    def __init__(
+        self,
+        runner: Callable[[ImageJob], Awaitable[Dict[str, Any]]],
+        workers: int = 4,
+        max_queued: int = 256,
+        max_queued_per_session: int = 16,
+        result_ttl: float = 600.0,
+        on_finished: Optional[Callable[[ImageJob], Awaitable[None]]] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Initialize the job queue.
+
+        Args:
+            runner (callable): Coroutine function running a job and returning its result
+            workers (int): Number of jobs run concurrently
+            max_queued (int): Jobs waiting across all sessions before submissions are rejected
+            max_queued_per_session (int): Jobs one session may have waiting
+            result_ttl (float): Seconds finished jobs stay available for polling
+            on_finished (callable, optional): Coroutine function called with each finished job
+            metrics (MetricsRegistry, optional): Registry for queue wait and
+                run time histograms, job counters and queue depth gauges
+        """
+        self.runner = runner
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_queued_per_session = max_queued_per_session
+        self.result_ttl = result_ttl
+        self.on_finished = on_finished
+
+        self._jobs: Dict[str, ImageJob] = {}
+        self._finished: Deque[ImageJob] = deque()
+        # Per priority: session ID -> that session's waiting jobs, in round-robin order
+        self._waiting: Dict[int, "OrderedDict[str, Deque[ImageJob]]"] = {
+            level: OrderedDict() for level in JOB_PRIORITIES.values()
+        }
+        self._ready = asyncio.Semaphore(0)
+        self._workers: List[asyncio.Task] = []
+
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.total_run_seconds = 0.0
+
+        self._queue_wait_seconds = None
+        self._run_seconds = None
+        self._jobs_total = None
+        if metrics is not None:
+            self._queue_wait_seconds = metrics.histogram(
+                "image_job_queue_wait_seconds", "Time image generation jobs wait for a worker", ["priority"]
+            )
+            self._run_seconds = metrics.histogram(
+                "image_job_run_seconds", "Time image generation jobs take once started", ["status"]
+            )
+            self._jobs_total = metrics.counter(
+                "image_jobs_total", "Image generation jobs by final status", ["status"]
+            )
+            metrics.gauge("image_jobs_queued", "Image generation jobs waiting for a worker", callback=lambda: self.queued)
+            metrics.gauge("image_jobs_running", "Image generation jobs running", callback=lambda: self.running)
+
+    def submit(self, params: Any, session_id: str, priority: str = "normal", client_id: Optional[str] = None) -> ImageJob:
+        """
+        Queue a job without waiting for it.
+
+        Args:
+            params: Request passed to the runner through job.params
+            session_id (str): Session the job is scheduled fairly within
+            priority (str): "high", "normal" or "low"
+            client_id (str, optional): WebSocket client to notify when it finishes
+
+        Returns:
+            ImageJob: The queued job
+
+        Raises:
+            ValueError: If the priority is unknown
+            ImageJobQueueFull: If the queue or the session's share of it is full
+        """
+        if priority not in JOB_PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'. Use one of: {', '.join(JOB_PRIORITIES)}")
+        self._expire()
+        if self.queued >= self.max_queued:
+            self.rejected += 1
+            raise ImageJobQueueFull(f"{self.queued} image generation jobs already queued")
+        level = self._waiting[JOB_PRIORITIES[priority]]
+        session_jobs = level.get(session_id)
+        session_queued = sum(len(lvl.get(session_id, ())) for lvl in self._waiting.values())
+        if session_queued >= self.max_queued_per_session:
+            self.rejected += 1
+            raise ImageJobQueueFull(f"Session already has {session_queued} image generation jobs queued")
+
+        job = ImageJob(params, session_id, priority, client_id)
+        if session_jobs is None:
+            # A session new to this priority joins the back of the rotation
+            session_jobs = level[session_id] = deque()
+        session_jobs.append(job)
+        self._jobs[job.id] = job
+        self.queued += 1
+        self.submitted += 1
+        self._ensure_workers()
+        self._ready.release()
+        return job
+
+    def get(self, job_id: str) -> Optional[ImageJob]:
+        """
+        Look up a job.
+
+        Args:
+            job_id (str): Job ID returned by submit()
+
+        Returns:
+            ImageJob: The job, or None if it is unknown or expired
+        """
+        self._expire()
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: ImageJob, timeout: float) -> ImageJob:
+        """Wait up to timeout seconds for a job to finish (long polling)"""
+        if timeout > 0 and not job.finished:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def _next_job(self) -> Optional[ImageJob]:
+        for level in sorted(self._waiting):
+            sessions = self._waiting[level]
+            if not sessions:
+                continue
+            session_id, session_jobs = sessions.popitem(last=False)
+            job = session_jobs.popleft()
+            if session_jobs:
+                sessions[session_id] = session_jobs
+            self.queued -= 1
+            return job
+        return None
+
+    def _ensure_workers(self):
+        # Started on first use, so the queue can be built before the event loop runs
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.workers:
+            self._workers.append(asyncio.ensure_future(self._work()))
+
+    async def _work(self):
+        while True:
+            await self._ready.acquire()
+            job = self._next_job()
+            if job is not None:
+                await self._run(job)
+
+    async def _run(self, job: ImageJob):
+        job.status = "running"
+        job.started_at = time.monotonic()
+        if self._queue_wait_seconds is not None:
+            self._queue_wait_seconds.observe(job.started_at - job.queued_at, priority=job.priority)
+        self.running += 1
+        try:
+            job.result = await self.runner(job)
+            job.status = "succeeded"
+            self.succeeded += 1
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = "Cancelled"
+            self.failed += 1
+            raise
+        except Exception as e:
+            logger.error(f"Image generation job {job.id} failed: {str(e)}")
+            job.status = "failed"
+            job.error = str(e) or type(e).__name__
+            self.failed += 1
+        finally:
+            self.running -= 1
+            job.finished_at = time.monotonic()
+            self.total_run_seconds += job.finished_at - job.started_at
+            self._finished.append(job)
+            job.done.set()
+            if self._jobs_total is not None:
+                self._jobs_total.inc(status=job.status)
+                self._run_seconds.observe(job.finished_at - job.started_at, status=job.status)
+        await self._notify(job)
+
+    async def _notify(self, job: ImageJob):
+        if self.on_finished is None:
+            return
+        try:
+            await self.on_finished(job)
+        except Exception as e:
+            logger.info(f"Could not deliver image generation job {job.id}: {str(e)}")
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.result_ttl
+        while self._finished and self._finished[0].finished_at <= cutoff:
+            job = self._finished.popleft()
+            self._jobs.pop(job.id, None)
+            self.expired += 1
+
+    def retry_after(self) -> int:
+        """
+        Estimate how long a rejected client should wait before resubmitting.
+
+        Returns:
+            int: Suggested delay in seconds
+        """
+        finished = self.succeeded + self.failed
+        avg_run = self.total_run_seconds / finished if finished else 10.0
+        return max(1, int(avg_run * (self.queued + self.running) / self.workers))
+
+    async def close(self):
+        """Stop the workers; running jobs are cancelled"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue depth and job counters.
+
+        Returns:
+            dict: Job queue statistics
+        """
+        finished = self.succeeded + self.failed
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "max_queued_per_session": self.max_queued_per_session,
+            "queued": self.queued,
+            "queued_by_priority": {
+                name: sum(len(jobs) for jobs in self._waiting[level].values())
+                for name, level in JOB_PRIORITIES.items()
+            },
+            "running": self.running,
+            "retained": len(self._jobs),
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "avg_run_seconds": round(self.total_run_seconds / finished, 3) if finished else 0.0,
+        }
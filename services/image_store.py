@@ -0,0 +1,453 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+from fastapi import Response
+from fastapi.responses import FileResponse
+
+from services.image_upload import PILLOW_AVAILABLE, UnsupportedImageFormat, detect_image_format
+from services.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# Generated images are a few MB at most; anything far larger is not an image we asked for
+MAX_IMAGE_BYTES = 32 * 1024 * 1024
+
+EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp", "image/gif": "gif"}
+MEDIA_TYPES = {extension: media_type for media_type, extension in EXTENSIONS.items()}
+
+# <sha256 of the original>.<ext>, optionally with a thumbnail width: <sha256>.w256.<ext>
+IMAGE_ID_PATTERN = re.compile(r"^([0-9a-f]{64})\.(png|jpg|webp|gif)$")
+FILE_NAME_PATTERN = re.compile(r"^([0-9a-f]{64})(?:\.w(\d+))?\.(png|jpg|webp|gif)$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ImageFetchError(Exception):
+    """Raised when a generated image cannot be downloaded"""
+
+
+class ImageStore:
+    """
+    Content-addressed disk store for generated images.
+
+    Each image is downloaded once and saved under the SHA-256 of its bytes,
+    so the same image is only stored once and its URL never changes, which
+    lets browsers and CDNs cache it forever. Thumbnails are rendered on
+    first request and stored next to the original. When the store grows
+    past max_bytes, the least recently served images (with their
+    thumbnails) are deleted. The index of stored files is built by start()
+    in a worker thread, and all file system calls run off the event loop.
+    """
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 512 * 1024 * 1024,
+        thumbnail_widths: Iterable[int] = (256, 512),
+        fetch_timeout: float = 30.0,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            directory (str): Directory the images are kept in
+            max_bytes (int): Total size of stored files before old ones are evicted
+            thumbnail_widths (iterable): Widths thumbnails may be requested at
+            fetch_timeout (float): Timeout for downloading an image, in seconds
+            metrics (MetricsRegistry, optional): Registry for store size and
+                request counters
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.thumbnail_widths = sorted(set(thumbnail_widths))
+        self.fetch_timeout = fetch_timeout
+
+        # File name -> size, least recently used first; built from the directory by start()
+        self._files: "Optional[OrderedDict[str, int]]" = None
+        # Digest of an original -> names of its stored thumbnails
+        self._thumbnail_names: Dict[str, Set[str]] = {}
+        self._indexing: Optional[asyncio.Future] = None
+        self.total_bytes = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._thumbnailing: Dict[str, asyncio.Future] = {}
+
+        self.stored = 0
+        self.deduplicated = 0
+        self.fetch_errors = 0
+        self.thumbnails = 0
+        self.evicted = 0
+
+        self._requests = None
+        if metrics is not None:
+            self._requests = metrics.counter(
+                "image_store_requests_total", "Stored image requests by result (hit, not_modified, partial, miss)", ["result"]
+            )
+            metrics.gauge("image_store_bytes", "Size of the generated image store", callback=lambda: self.total_bytes)
+
+    def _path(self, name: str) -> str:
+        # Shard by the first two hex digits so no directory gets huge
+        return os.path.join(self.directory, name[:2], name)
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        entries = []
+        if os.path.isdir(self.directory):
+            for shard in os.listdir(self.directory):
+                shard_path = os.path.join(self.directory, shard)
+                if not os.path.isdir(shard_path):
+                    continue
+                for name in os.listdir(shard_path):
+                    if not FILE_NAME_PATTERN.match(name):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(shard_path, name))
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, name, stat.st_size))
+        entries.sort()
+        return entries
+
+    async def _build_index(self):
+        entries = await asyncio.to_thread(self._scan)
+        self._files = OrderedDict()
+        self._thumbnail_names = {}
+        self.total_bytes = 0
+        for _, name, size in entries:
+            self._index(name, size)
+        logger.info(f"Indexed {len(self._files)} stored images ({self.total_bytes} bytes)")
+
+    async def start(self):
+        """Build the index of stored files in a worker thread"""
+        await self._load_index()
+
+    async def _load_index(self) -> "OrderedDict[str, int]":
+        if self._files is not None:
+            return self._files
+        # One scan, however many requests arrive before it finishes
+        if self._indexing is None:
+            self._indexing = asyncio.ensure_future(self._build_index())
+        try:
+            await asyncio.shield(self._indexing)
+        except Exception:
+            # Retry the scan on the next request
+            self._indexing = None
+            raise
+        return self._files
+
+    def _index(self, name: str, size: int):
+        files = self._files
+        self.total_bytes += size - files.get(name, 0)
+        files[name] = size
+        files.move_to_end(name)
+        if FILE_NAME_PATTERN.match(name).group(2) is not None:
+            self._thumbnail_names.setdefault(name[:64], set()).add(name)
+
+    def _unindex(self, name: str):
+        self.total_bytes -= self._files.pop(name, 0)
+        thumbnails = self._thumbnail_names.get(name[:64])
+        if thumbnails is not None:
+            thumbnails.discard(name)
+            if not thumbnails:
+                del self._thumbnail_names[name[:64]]
+
+    async def _known(self, name: str) -> bool:
+        files = await self._load_index()
+        if name in files:
+            return True
+        # Another worker sharing the directory may have stored it
+        try:
+            stat = await asyncio.to_thread(os.stat, self._path(name))
+        except OSError:
+            return False
+        if name not in files:
+            self._index(name, stat.st_size)
+        return True
+
+    def _touch(self, name: str):
+        if self._files is not None and name in self._files:
+            self._files.move_to_end(name)
+
+    def _write(self, name: str, data: bytes):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so readers never see a partial file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    async def _add(self, name: str, data: bytes):
+        # File I/O in a worker thread; the index is only touched on the event loop
+        await asyncio.to_thread(self._write, name, data)
+        await self._load_index()
+        self._index(name, len(data))
+        await self._evict()
+
+    def _remove_files(self, names: List[str]):
+        for name in names:
+            try:
+                os.remove(self._path(name))
+            except OSError as e:
+                logger.warning(f"Could not delete stored image {name}: {str(e)}")
+
+    async def _evict(self):
+        files = self._files
+        victims = []
+        while self.total_bytes > self.max_bytes and len(files) > 1:
+            name = next(iter(files))
+            if FILE_NAME_PATTERN.match(name).group(2) is None:
+                # An original goes together with its thumbnails
+                batch = [name, *self._thumbnail_names.get(name[:64], ())]
+            else:
+                batch = [name]
+            for victim in batch:
+                self._unindex(victim)
+                self.evicted += 1
+            victims.extend(batch)
+        if victims:
+            # Already out of the index, so they are not served while being deleted
+            await asyncio.to_thread(self._remove_files, victims)
+
+    async def _download(self, url: str) -> bytes:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.fetch_timeout, follow_redirects=True)
+        try:
+            async with self._client.stream("GET", url) as response:
+                response.raise_for_status()
+                data = bytearray()
+                async for chunk in response.aiter_bytes():
+                    data += chunk
+                    if len(data) > MAX_IMAGE_BYTES:
+                        raise ImageFetchError(f"Image exceeds {MAX_IMAGE_BYTES} bytes")
+                return bytes(data)
+        except httpx.HTTPError as e:
+            raise ImageFetchError(f"Could not download image: {str(e)}") from e
+
+    async def save_from_url(self, url: str) -> str:
+        """
+        Download an image and store it.
+
+        Args:
+            url (str): URL of the image, e.g. a short-lived blob URL
+
+        Returns:
+            str: Image ID, "<sha256>.<ext>"
+
+        Raises:
+            ImageFetchError: If the download fails or is not a supported image
+        """
+        try:
+            data = await self._download(url)
+            media_type = detect_image_format(data[:12])
+        except ImageFetchError:
+            self.fetch_errors += 1
+            raise
+        except UnsupportedImageFormat as e:
+            self.fetch_errors += 1
+            raise ImageFetchError("Downloaded file is not a supported image") from e
+        return await self.save(data, media_type)
+
+    async def save(self, data: bytes, media_type: str) -> str:
+        """
+        Store image bytes.
+
+        Args:
+            data (bytes): Image data
+            media_type (str): MIME type of the data
+
+        Returns:
+            str: Image ID, "<sha256>.<ext>"
+        """
+        image_id = f"{hashlib.sha256(data).hexdigest()}.{EXTENSIONS[media_type]}"
+        if await self._known(image_id) and await asyncio.to_thread(os.path.exists, self._path(image_id)):
+            self.deduplicated += 1
+            self._touch(image_id)
+        else:
+            await self._add(image_id, data)
+            self.stored += 1
+        return image_id
+
+    def _render_thumbnail(self, image_id: str, width: int, image_format: str) -> Optional[bytes]:
+        from PIL import Image
+
+        with Image.open(self._path(image_id)) as image:
+            if image.width <= width:
+                return None
+            height = max(1, round(image.height * width / image.width))
+            thumbnail = image.resize((width, height), Image.LANCZOS)
+            if image_format == "JPEG":
+                thumbnail = thumbnail.convert("RGB")
+            output = io.BytesIO()
+            thumbnail.save(output, format=image_format, optimize=True)
+            return output.getvalue()
+
+    async def _create_thumbnail(self, image_id: str, width: int, name: str) -> Optional[str]:
+        image_format = {"jpg": "JPEG", "png": "PNG", "webp": "WEBP", "gif": "GIF"}[name.rsplit(".", 1)[1]]
+        data = await asyncio.to_thread(self._render_thumbnail, image_id, width, image_format)
+        if data is None:
+            # Already no wider than the thumbnail
+            return None
+        await self._add(name, data)
+        self.thumbnails += 1
+        return name
+
+    async def _thumbnail(self, image_id: str, width: int) -> str:
+        digest, extension = IMAGE_ID_PATTERN.match(image_id).groups()
+        name = f"{digest}.w{width}.{extension}"
+        if await self._known(name):
+            return name
+        # One render per thumbnail, however many requests ask for it at once
+        pending = self._thumbnailing.get(name)
+        if pending is None:
+            pending = asyncio.ensure_future(self._create_thumbnail(image_id, width, name))
+            self._thumbnailing[name] = pending
+            pending.add_done_callback(lambda _: self._thumbnailing.pop(name, None))
+        try:
+            return await asyncio.shield(pending) or image_id
+        except Exception as e:
+            logger.warning(f"Could not render thumbnail of {image_id}: {str(e)}")
+            return image_id
+
+    async def response(
+        self,
+        image_id: str,
+        width: Optional[int] = None,
+        if_none_match: Optional[str] = None,
+        range_header: Optional[str] = None,
+        if_range: Optional[str] = None,
+        method: str = "GET",
+    ) -> Optional[Response]:
+        """
+        Build the HTTP response for a stored image.
+
+        Args:
+            image_id (str): Image ID returned by save()
+            width (int, optional): Thumbnail width; must be one of thumbnail_widths
+            if_none_match (str, optional): If-None-Match request header
+            range_header (str, optional): Range request header
+            if_range (str, optional): If-Range request header
+            method (str): Request method ("HEAD" sends no body)
+
+        Returns:
+            Response: The image (200 or 206), 304, 416, or None if the image
+                or thumbnail width is unknown
+        """
+        if not IMAGE_ID_PATTERN.match(image_id) or not await self._known(image_id):
+            self._count("miss")
+            return None
+        name = image_id
+        if width is not None:
+            if width not in self.thumbnail_widths:
+                return None
+            if PILLOW_AVAILABLE:
+                name = await self._thumbnail(image_id, width)
+        self._touch(image_id)
+        self._touch(name)
+
+        etag = f'"{name.rsplit(".", 1)[0]}"'
+        headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+        media_type = MEDIA_TYPES[name.rsplit(".", 1)[1]]
+        if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+            self._count("not_modified")
+            return Response(status_code=304, headers=headers)
+
+        path = self._path(name)
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+        except OSError:
+            # Deleted behind our back; forget it
+            self._unindex(name)
+            self._count("miss")
+            return None
+
+        byte_range = None
+        if range_header and (not if_range or if_range.strip() == etag):
+            byte_range = parse_range(range_header, stat.st_size)
+            if byte_range is None:
+                self._count("miss")
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+        if byte_range is not None and byte_range != (0, stat.st_size - 1):
+            start, end = byte_range
+            self._count("partial")
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            body = b"" if method.upper() == "HEAD" else await asyncio.to_thread(_read_range, path, start, end)
+            headers["Content-Length"] = str(end - start + 1)
+            return Response(body, status_code=206, media_type=media_type, headers=headers)
+
+        self._count("hit")
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat, method=method)
+
+    def _count(self, result: str):
+        if self._requests is not None:
+            self._requests.inc(result=result)
+
+    async def close(self):
+        """Close the download client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get store size and counters.
+
+        Returns:
+            dict: Image store statistics
+        """
+        return {
+            "directory": self.directory,
+            "files": len(self._files) if self._files is not None else 0,
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "thumbnail_widths": self.thumbnail_widths,
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "thumbnails": self.thumbnails,
+            "evicted": self.evicted,
+            "fetch_errors": self.fetch_errors,
+        }
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range Range header.
+
+    Args:
+        range_header (str): Header value, e.g. "bytes=0-1023" or "bytes=-500"
+        size (int): Size of the file
+
+    Returns:
+        tuple: Inclusive (start, end), (0, size - 1) for headers that are
+            ignored (multiple ranges or another unit), or None if unsatisfiable
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return (0, size - 1)
+    first, last = match.groups()
+    if not first and not last:
+        return (0, size - 1)
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return None
+        return (max(0, size - length), size - 1)
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return None
+    return (start, end)
+
+
+def _read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
@@ -0,0 +1,242 @@
+import asyncio
+import base64
+import importlib.util
+import io
+import json
+import logging
+from typing import Iterable, Optional, Tuple
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Pillow is optional (images are then sent unmodified) and is imported on first use, off the event loop
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+if not PILLOW_AVAILABLE:
+    logger.warning("Pillow not installed; uploaded images will not be downscaled")
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# EXIF orientations that rotate the image by 90 or 270 degrees
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+# Magic-byte signatures of formats accepted by the vision API
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit"""
+
+
+class UnsupportedImageFormat(Exception):
+    """Raised when an upload is not a JPEG, PNG, GIF or WebP image"""
+
+
+def detect_image_format(data: bytes) -> str:
+    """
+    Detect the image MIME type from its leading bytes.
+
+    Args:
+        data (bytes): Image data, or at least its first 12 bytes
+
+    Returns:
+        str: MIME type such as "image/png"
+
+    Raises:
+        UnsupportedImageFormat: If the data is not a supported image
+    """
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    raise UnsupportedImageFormat("Uploaded file is not a JPEG, PNG, GIF or WebP image")
+
+
+async def read_upload(file: UploadFile, max_bytes: int) -> bytearray:
+    """
+    Read an upload in chunks, stopping as soon as it exceeds max_bytes.
+
+    Args:
+        file (UploadFile): The uploaded file
+        max_bytes (int): Maximum accepted size
+
+    Returns:
+        bytearray: The file contents
+
+    Raises:
+        UploadTooLarge: If the file is larger than max_bytes
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(f"Upload of {file.size} bytes exceeds the {max_bytes} byte limit")
+    data = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        data += chunk
+        if len(data) > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {max_bytes} byte limit")
+    return data
+
+
+def _target_size(width: int, height: int, max_side: int, max_short_side: int) -> Tuple[int, int]:
+    scale = min(1.0, max_side / max(width, height), max_short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def downscale_image(data: bytes, mime_type: str, max_side: int, max_short_side: int, jpeg_quality: int = 85) -> Tuple[bytes, str]:
+    """
+    Downscale an image to the resolution the vision model actually uses
+    and re-encode it. Runs CPU-bound work, so call it from a worker thread.
+
+    Args:
+        data (bytes): Original image data
+        mime_type (str): Detected MIME type
+        max_side (int): Maximum length of the longer side
+        max_short_side (int): Maximum length of the shorter side
+        jpeg_quality (int): JPEG quality used when re-encoding
+
+    Returns:
+        tuple: (image data, MIME type), unchanged if no resize was needed
+    """
+    if not PILLOW_AVAILABLE or mime_type == "image/gif":
+        return data, mime_type
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        # Size the image as displayed, i.e. after its EXIF orientation is applied
+        transposed = image.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS
+        width, height = (image.height, image.width) if transposed else (image.width, image.height)
+        size = _target_size(width, height, max_side, max_short_side)
+        if size == (width, height):
+            return data, mime_type
+
+        # draft() works on the stored pixels, before the orientation is applied
+        image.draft("RGB", size[::-1] if transposed else size)
+        # Re-encoding drops the EXIF orientation, so rotate the pixels instead
+        oriented = ImageOps.exif_transpose(image)
+        resized = oriented.resize(size, Image.LANCZOS)
+        output = io.BytesIO()
+        if resized.mode in ("RGBA", "LA", "P"):
+            # Keep transparency by staying with PNG
+            resized.save(output, format="PNG", optimize=True)
+            return output.getvalue(), "image/png"
+        resized.convert("RGB").save(output, format="JPEG", quality=jpeg_quality, optimize=True)
+        return output.getvalue(), "image/jpeg"
+
+
+async def prepare_image(data: bytes, max_side: int, max_short_side: int) -> Tuple[bytes, str]:
+    """
+    Validate and downscale an uploaded image off the event loop.
+
+    Args:
+        data (bytes): Uploaded image data
+        max_side (int): Maximum length of the longer side
+        max_short_side (int): Maximum length of the shorter side
+
+    Returns:
+        tuple: (image data, MIME type)
+
+    Raises:
+        UnsupportedImageFormat: If the data is not a supported image
+    """
+    mime_type = detect_image_format(bytes(data[:12]))
+    try:
+        return await asyncio.to_thread(downscale_image, data, mime_type, max_side, max_short_side)
+    except Exception as e:
+        logger.warning(f"Could not downscale uploaded image, sending original: {str(e)}")
+        return data, mime_type
+
+
+def build_data_url(data: bytes, mime_type: str) -> str:
+    """
+    Encode image data as a base64 data URL.
+
+    Args:
+        data (bytes): Image data
+        mime_type (str): MIME type
+
+    Returns:
+        str: The data URL
+    """
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware that rejects oversized request bodies on upload routes
+    before they are parsed, using Content-Length when present and counting
+    streamed bytes otherwise.
+    """
+    def __init__(self, app, max_bytes: int, path_prefixes: Iterable[str]):
+        """
+        Args:
+            app: The wrapped ASGI application
+            max_bytes (int): Maximum accepted request body size
+            path_prefixes (iterable): URL path prefixes the limit applies to
+        """
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefixes = tuple(path_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        content_length: Optional[int] = None
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    pass
+                break
+        if content_length is not None and content_length > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLarge(f"Request body exceeds the {self.max_bytes} byte limit")
+            return message
+
+        async def guarded_send(message):
+            nonlocal rejected
+            if not exceeded:
+                await send(message)
+            elif message["type"] == "http.response.start" and not rejected:
+                # Replace whatever error the app produced with a 413
+                rejected = True
+                await self._reject(send)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            if not rejected:
+                rejected = True
+                await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"Upload exceeds the {self.max_bytes} byte limit"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import logging
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from services.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# Revalidate on every view, so a profile change shows up at once
+PAGE_CACHE_CONTROL = "no-cache"
+
+
+class CachedPage:
+    """One rendered page with its ETag and precompressed variant"""
+    def __init__(self, body: bytes, source: Hashable):
+        self.body = body
+        self.source = source
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        self.gzip = compressed if len(compressed) < len(body) else None
+
+
+class PageCache:
+    """
+    Cache of rendered HTML pages.
+
+    Each page is rendered once per key (e.g. per profile) and kept as
+    bytes, together with a gzip variant and an ETag, so a page view is a
+    memory copy rather than a template render. The caller passes the
+    inputs the page was rendered from as its source; when they change
+    (e.g. a profile is reloaded) the page is rendered again on the next
+    view.
+    """
+    def __init__(self, media_type: str = "text/html; charset=utf-8", metrics: Optional[MetricsRegistry] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            media_type (str): Content type of the cached pages
+            metrics (MetricsRegistry, optional): Registry for the page view counter
+        """
+        self.media_type = media_type
+        self._pages: Dict[Hashable, CachedPage] = {}
+
+        self.hits = 0
+        self.renders = 0
+        self.not_modified = 0
+
+        self._views_total = None
+        if metrics is not None:
+            self._views_total = metrics.counter(
+                "page_cache_views_total", "Cached page views: hit, render or not_modified (304)", ["result"]
+            )
+
+    def get(self, key: Hashable, source: Hashable, render: Callable[[], str]) -> CachedPage:
+        """
+        Get a page, rendering it if it is not cached or its source changed.
+
+        Args:
+            key (hashable): Page key
+            source (hashable): Inputs the page is rendered from
+            render (callable): Function returning the page HTML
+
+        Returns:
+            CachedPage: The cached page
+        """
+        page = self._pages.get(key)
+        if page is not None and page.source == source:
+            self.hits += 1
+            result = "hit"
+        else:
+            page = self._pages[key] = CachedPage(render().encode("utf-8"), source)
+            self.renders += 1
+            result = "render"
+            logger.info(f"Rendered page {key}")
+        if self._views_total is not None:
+            self._views_total.inc(result=result)
+        return page
+
+    def response(self, page: CachedPage, headers: Headers, method: str = "GET") -> Response:
+        """
+        Build the response for a page view.
+
+        Args:
+            page (CachedPage): Page from get()
+            headers (Headers): Request headers (If-None-Match, Accept-Encoding)
+            method (str): Request method; HEAD gets headers only
+
+        Returns:
+            Response: 304 if the client's copy is current, else the page,
+            gzip-encoded if the client accepts it
+        """
+        body = page.body
+        etag = page.etag
+        response_headers = {"Cache-Control": PAGE_CACHE_CONTROL}
+        if page.gzip is not None:
+            response_headers["Vary"] = "Accept-Encoding"
+            accepted = {coding.split(";")[0].strip() for coding in headers.get("accept-encoding", "").split(",")}
+            if "gzip" in accepted:
+                body = page.gzip
+                etag = f'{etag[:-1]}-gzip"'
+                response_headers["Content-Encoding"] = "gzip"
+        response_headers["ETag"] = etag
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            self.not_modified += 1
+            if self._views_total is not None:
+                self._views_total.inc(result="not_modified")
+            return Response(status_code=304, headers=response_headers)
+        if method == "HEAD":
+            response_headers["Content-Length"] = str(len(body))
+            return Response(status_code=200, media_type=self.media_type, headers=response_headers)
+        return Response(body, media_type=self.media_type, headers=response_headers)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cached pages and hit counters.
+
+        Returns:
+            dict: Page cache statistics
+        """
+        return {
+            "pages": {
+                str(key): {"bytes": len(page.body), "gzip_bytes": len(page.gzip) if page.gzip else None, "etag": page.etag}
+                for key, page in self._pages.items()
+            },
+            "hits": self.hits,
+            "renders": self.renders,
+            "not_modified": self.not_modified,
+        }
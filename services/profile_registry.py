@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from models.profile_model import ProfileModel
+
+logger = logging.getLogger(__name__)
+
+# Profile IDs are file names without ".json"; anything else could escape the directory
+PROFILE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class ProfileNotFound(Exception):
+    """Raised when a requested profile does not exist"""
+
+
+class ProfileRegistry:
+    """
+    Directory of assistant profiles, loaded on first use.
+
+    Each profile is a ProfileModel whose prompt, token count and theme are
+    rendered when it is loaded, so requests only read cached values.
+    Loading and the file checks run in worker threads, off the event loop.
+    A watcher polls the files of loaded profiles and swaps in a freshly
+    loaded model when one changes; requests already holding the old model
+    finish with it, and a file that fails to load leaves the old model in
+    place. Sessions remember the profile they were started with.
+    """
+    def __init__(self, directory: str, default_profile: str = "default_profile", reload_interval: float = 2.0, max_sessions: int = 10000):
+        """
+        Initialize the registry.
+
+        Args:
+            directory (str): Directory holding <profile_id>.json files
+            default_profile (str): Profile used when a request names none
+            reload_interval (float): Seconds between file checks; 0 disables hot reload
+            max_sessions (int): Session-to-profile bindings kept (least recently used are dropped)
+        """
+        self.directory = directory
+        self.default_profile = default_profile
+        self.reload_interval = reload_interval
+        self.max_sessions = max_sessions
+
+        self._profiles: Dict[str, ProfileModel] = {}
+        self._versions: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._sessions: "OrderedDict[str, str]" = OrderedDict()
+        self._watcher: Optional[asyncio.Task] = None
+
+        self.loads = 0
+        self.reloads = 0
+        self.reload_errors = 0
+
+    def path_for(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.json")
+
+    def _version(self, path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self, profile_id: str) -> ProfileModel:
+        path = self.path_for(profile_id)
+        version = self._version(path)
+        try:
+            profile = ProfileModel(path)
+            # Render now so no request pays for it
+            profile.get_personality_prompt()
+        except (ValueError, OSError, KeyError, TypeError) as e:
+            # Unreadable file, malformed JSON or missing fields
+            raise ProfileNotFound(f"Profile '{profile_id}' could not be loaded: {str(e)}") from e
+        self._versions[profile_id] = version
+        return profile
+
+    def get(self, profile_id: Optional[str] = None) -> ProfileModel:
+        """
+        Get a profile, loading it on first use in the calling thread. On the
+        event loop use load(), which loads in a worker thread.
+
+        Args:
+            profile_id (str, optional): Profile ID; the default profile if None
+
+        Returns:
+            ProfileModel: The current version of the profile
+
+        Raises:
+            ProfileNotFound: If the ID is invalid, has no profile file or the
+                file cannot be loaded
+        """
+        profile_id = profile_id or self.default_profile
+        profile = self._profiles.get(profile_id)
+        if profile is not None:
+            return profile
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            raise ProfileNotFound(f"Invalid profile ID '{profile_id}'")
+        # The default profile falls back to the built-in one when its file is missing
+        if profile_id != self.default_profile and not os.path.isfile(self.path_for(profile_id)):
+            raise ProfileNotFound(f"Profile '{profile_id}' not found")
+        try:
+            profile = self._load(profile_id)
+        except ProfileNotFound as e:
+            logger.error(str(e))
+            raise
+        self._profiles[profile_id] = profile
+        self.loads += 1
+        logger.info(f"Loaded profile {profile_id}")
+        return profile
+
+    async def load(self, profile_id: Optional[str] = None) -> ProfileModel:
+        """
+        Get a profile, loading it in a worker thread on first use.
+
+        Args:
+            profile_id (str, optional): Profile ID; the default profile if None
+
+        Returns:
+            ProfileModel: The current version of the profile
+
+        Raises:
+            ProfileNotFound: If the ID is invalid, has no profile file or the
+                file cannot be loaded
+        """
+        profile = self._profiles.get(profile_id or self.default_profile)
+        if profile is not None:
+            return profile
+        return await asyncio.to_thread(self.get, profile_id)
+
+    async def resolve(self, session_id: Optional[str] = None, profile_id: Optional[str] = None) -> ProfileModel:
+        """
+        Pick the profile for a request: the one it names, else the one its
+        session was started with, else the default.
+
+        Args:
+            session_id (str, optional): Session of the request
+            profile_id (str, optional): Profile named by the request
+
+        Returns:
+            ProfileModel: The selected profile
+
+        Raises:
+            ProfileNotFound: If the named profile does not exist
+        """
+        if profile_id is None and session_id is not None:
+            profile_id = self._sessions.get(session_id)
+            if profile_id is not None:
+                self._sessions.move_to_end(session_id)
+        profile = await self.load(profile_id)
+        if session_id is not None and profile_id is not None:
+            self._sessions[session_id] = profile_id
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return profile
+
+    def forget_session(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+    def available(self) -> List[str]:
+        """
+        List the profile IDs in the directory.
+
+        Returns:
+            list: Sorted profile IDs
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        ids = {name[:-5] for name in names if name.endswith(".json") and PROFILE_ID_PATTERN.match(name[:-5])}
+        ids.add(self.default_profile)
+        return sorted(ids)
+
+    def check_for_changes(self) -> List[str]:
+        """
+        Reload loaded profiles whose files changed.
+
+        Returns:
+            list: IDs of the profiles that were swapped
+        """
+        swapped = []
+        for profile_id in list(self._profiles):
+            version = self._version(self.path_for(profile_id))
+            if version is None or version == self._versions.get(profile_id):
+                continue
+            try:
+                profile = self._load(profile_id)
+            except Exception as e:
+                # Keep serving the previous version; retry once the file changes again
+                self._versions[profile_id] = version
+                self.reload_errors += 1
+                logger.error(f"Failed to reload profile {profile_id}: {str(e)}")
+                continue
+            self._profiles[profile_id] = profile
+            self.reloads += 1
+            swapped.append(profile_id)
+            logger.info(f"Reloaded profile {profile_id}")
+        return swapped
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await asyncio.to_thread(self.check_for_changes)
+            except Exception as e:
+                logger.error(f"Profile watcher failed: {str(e)}")
+
+    async def start(self):
+        """Load the default profile and start watching for changes"""
+        await self.load()
+        if self.reload_interval > 0 and self._watcher is None:
+            self._watcher = asyncio.ensure_future(self._watch())
+
+    async def close(self):
+        """Stop watching for changes"""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get loaded profiles and reload counters.
+
+        Returns:
+            dict: Profile registry statistics
+        """
+        return {
+            "default_profile": self.default_profile,
+            "available": self.available(),
+            "loaded": {profile_id: profile.get_name() for profile_id, profile in self._profiles.items()},
+            "sessions": len(self._sessions),
+            "hot_reload": self.reload_interval > 0,
+            "loads": self.loads,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
@@ -0,0 +1,274 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+# Statuses worth retrying: throttling and transient server errors
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling upstream when the call cannot succeed in time"""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """Raised when the circuit breaker is open and calls fail fast"""
+
+
+class RateLimitExceeded(UpstreamUnavailable):
+    """Raised when the rate limiter cannot admit a call before its deadline"""
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """
+    Parse a Retry-After (or Azure retry-after-ms) header.
+
+    Args:
+        headers: Response headers
+
+    Returns:
+        float: Seconds to wait, or None if no usable header is present
+    """
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter. A Retry-After from the server
+    takes precedence over the computed delay.
+    """
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 8.0):
+        """
+        Args:
+            max_retries (int): Retries after the first attempt
+            base_delay (float): Backoff ceiling of the first retry in seconds
+            max_delay (float): Upper bound of the backoff ceiling in seconds
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry: int, retry_after: Optional[float] = None) -> float:
+        """
+        Delay before a retry.
+
+        Args:
+            retry (int): 1 for the first retry, 2 for the second, ...
+            retry_after (float, optional): Server-provided delay
+
+        Returns:
+            float: Seconds to sleep
+        """
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute. Callers reserve
+    their cost up front and sleep off any deficit, so waiters are served
+    in arrival order without polling.
+    """
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, cost: float) -> float:
+        """Take cost tokens and return how long to wait until they are covered"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= min(cost, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    def wait_time(self, cost: float) -> float:
+        """How long a reservation of cost tokens would wait, without taking them"""
+        tokens = min(self.capacity, self.tokens + (time.monotonic() - self.updated_at) * self.rate)
+        return max(0.0, (min(cost, self.capacity) - tokens) / self.rate)
+
+    def refund(self, cost: float):
+        self.tokens = min(self.capacity, self.tokens + min(cost, self.capacity))
+
+
+class RateLimiter:
+    """
+    Client-side limiter matched to the deployment's requests-per-minute
+    and tokens-per-minute quota. Server throttling (429) is handled by the
+    endpoint pool, which drains the endpoint until its Retry-After passes.
+    """
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        """
+        Args:
+            requests_per_minute (float): Request quota; 0 disables the limit
+            tokens_per_minute (float): Token quota; 0 disables the limit
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+        self.waits = 0
+        self.total_wait_seconds = 0.0
+        self.rejected = 0
+
+    def wait_time(self, token_cost: int = 0) -> float:
+        """
+        Estimate how long a call would wait for quota, without reserving it.
+
+        Args:
+            token_cost (int): Estimated prompt plus completion tokens
+
+        Returns:
+            float: Seconds until the call would be admitted
+        """
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None and token_cost:
+            wait = max(wait, self.tokens.wait_time(token_cost))
+        return wait
+
+    async def acquire(self, token_cost: int = 0, deadline: Optional[float] = None):
+        """
+        Wait until a call fits in the quota.
+
+        Args:
+            token_cost (int): Estimated prompt plus completion tokens
+            deadline (float, optional): time.monotonic() by which the call must start
+
+        Raises:
+            RateLimitExceeded: If the call cannot be admitted before the deadline
+        """
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None and token_cost:
+            wait = max(wait, self.tokens.reserve(token_cost))
+        if wait <= 0:
+            return
+
+        if deadline is not None and time.monotonic() + wait >= deadline:
+            if self.requests is not None:
+                self.requests.refund(1)
+            if self.tokens is not None and token_cost:
+                self.tokens.refund(token_cost)
+            self.rejected += 1
+            raise RateLimitExceeded(f"Upstream quota exhausted; next slot in {wait:.1f}s")
+        self.waits += 1
+        self.total_wait_seconds += wait
+        await asyncio.sleep(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests_per_minute": self.requests.capacity if self.requests else 0,
+            "tokens_per_minute": self.tokens.capacity if self.tokens else 0,
+            "waits": self.waits,
+            "total_wait_seconds": round(self.total_wait_seconds, 3),
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the upstream endpoint is down.
+    After failure_threshold consecutive failures the circuit opens and
+    calls are rejected for reset_timeout seconds; then a single probe call
+    is let through (half-open) and its outcome closes or reopens it.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit;
+                0 disables the breaker
+            reset_timeout (float): Seconds the circuit stays open before a probe
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.opened = 0
+        self.rejected = 0
+
+    def allows_call(self) -> bool:
+        """Whether before_call would currently let a call through (no side effects)"""
+        if self.failure_threshold <= 0 or self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return not self._probe_in_flight
+
+    def before_call(self):
+        """
+        Check whether a call may proceed.
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+        """
+        if self.failure_threshold <= 0 or self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.rejected += 1
+        remaining = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f"Upstream circuit is open; next probe in {remaining:.1f}s")
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        self.state = self.CLOSED
+
+    def abandon(self):
+        """Release a half-open probe whose call was cancelled without an outcome"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.failure_threshold <= 0:
+            return
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
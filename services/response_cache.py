@@ -0,0 +1,148 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for cache keys: collapse whitespace and ignore case"""
+    return " ".join(text.split()).casefold()
+
+
+def hash_text(text: str) -> str:
+    """SHA-256 hex digest of a string"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of upstream replies.
+    Keys are hashes of the model, system prompt and normalized message
+    window (chat) or image content and prompt (vision), so repeated
+    questions and re-uploaded images skip the upstream call.
+    """
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 16 * 1024 * 1024, ttl_seconds: float = 3600.0):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Maximum number of cached replies
+            max_bytes (int): Maximum total size of cached replies
+            ttl_seconds (float): Time after which a cached reply expires
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def chat_key(model: str, system_prompt: str, messages: List[Dict[str, Any]]) -> str:
+        """
+        Build the cache key for a chat request.
+
+        Args:
+            model (str): Model name
+            system_prompt (str): System prompt
+            messages (list): Messages sent upstream, excluding the system prompt
+
+        Returns:
+            str: Cache key
+        """
+        window = [[m["role"], normalize_text(m["content"])] for m in messages]
+        return "chat:" + hash_text(json.dumps([model, hash_text(system_prompt), window]))
+
+    @staticmethod
+    def vision_key(model: str, system_prompt: str, image_hash: str, prompt: str) -> str:
+        """
+        Build the cache key for an image analysis request.
+
+        Args:
+            model (str): Model name
+            system_prompt (str): System prompt
+            image_hash (str): SHA-256 hex digest of the image content
+            prompt (str): Analysis prompt
+
+        Returns:
+            str: Cache key
+        """
+        return "vision:" + hash_text(json.dumps([model, hash_text(system_prompt), image_hash, normalize_text(prompt)]))
+
+    def _drop(self, key: str):
+        value, _ = self._entries.pop(key)
+        self.total_bytes -= len(value)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached reply.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            str: The cached reply, or None on a miss
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, stored_at = entry
+        if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+            self._drop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: str):
+        """
+        Store a reply, evicting the least recently used entries if needed.
+
+        Args:
+            key (str): Cache key
+            value (str): Reply to cache
+        """
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (value, time.monotonic())
+        self.total_bytes += len(value)
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def record_bypass(self):
+        """Count a request that skipped the cache lookup"""
+        self.bypasses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache size and hit/miss counters.
+
+        Returns:
+            dict: Cache statistics
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bypasses": self.bypasses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
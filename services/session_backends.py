@@ -0,0 +1,742 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import IO, Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; the journal directory is then not locked
+    fcntl = None
+
+
+class SessionBackend:
+    """
+    Interface for shared session storage behind SessionManager.
+
+    Every session has a version that increases on each append or clear,
+    so a worker can tell whether its cached copy is still current with a
+    single cheap lookup.
+    """
+    def get_version(self, session_id: str) -> int:
+        """
+        Get the current version of a session.
+
+        Args:
+            session_id (str): Session ID
+
+        Returns:
+            int: Session version, or 0 if the session does not exist
+        """
+        raise NotImplementedError
+
+    def load(self, session_id: str, limit: int) -> Tuple[List[Dict[str, str]], int]:
+        """
+        Load the most recent messages of a session.
+
+        Args:
+            session_id (str): Session ID
+            limit (int): Maximum number of messages to return
+
+        Returns:
+            tuple: (messages oldest first, session version)
+        """
+        raise NotImplementedError
+
+    def append(self, session_id: str, message: Dict[str, str]):
+        """
+        Queue a message to be appended to a session.
+
+        Args:
+            session_id (str): Session ID
+            message (dict): Message with role and content
+        """
+        raise NotImplementedError
+
+    def clear(self, session_id: str):
+        """
+        Queue removal of all messages of a session.
+
+        Args:
+            session_id (str): Session ID
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """Write all queued changes"""
+
+    def close(self):
+        """Flush queued changes and release resources"""
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get backend statistics.
+
+        Returns:
+            dict: Backend statistics
+        """
+        return {}
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    Session backend stored in a SQLite database in WAL mode, so several
+    uvicorn workers or containers on a shared volume see the same
+    conversation history. Writes are queued and committed in batches by a
+    background thread; reads go straight to the database.
+    """
+    def __init__(
+        self,
+        path: str,
+        max_messages: int = 20,
+        ttl_seconds: float = 3600.0,
+        flush_interval: float = 0.05,
+        batch_size: int = 256,
+    ):
+        """
+        Open the database and start the writer thread.
+
+        Args:
+            path (str): Path to the SQLite database file
+            max_messages (int): Messages kept per session
+            ttl_seconds (float): Idle time after which a session is deleted
+            flush_interval (float): Maximum delay before queued writes are committed
+            batch_size (int): Maximum number of writes committed in one transaction
+        """
+        self.path = path
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+        self._create_schema(self._read_conn)
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._flushed = threading.Condition()
+        self._pending = 0
+        self._closed = False
+        self._last_expiry = time.time()
+
+        self.batches_written = 0
+        self.writes = 0
+        self.write_errors = 0
+
+        self._writer = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+        self._writer.start()
+        logger.info(f"SQLite session backend opened at {path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            );
+            CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+        """)
+
+    def get_version(self, session_id: str) -> int:
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT version FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def load(self, session_id: str, limit: int) -> Tuple[List[Dict[str, str]], int]:
+        with self._read_lock:
+            self._read_conn.execute("BEGIN")
+            try:
+                row = self._read_conn.execute(
+                    "SELECT version FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                rows = self._read_conn.execute(
+                    "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                    (session_id, limit)
+                ).fetchall()
+            finally:
+                self._read_conn.execute("COMMIT")
+        messages = [{"role": role, "content": content} for role, content in reversed(rows)]
+        return messages, row[0] if row else 0
+
+    def append(self, session_id: str, message: Dict[str, str]):
+        self._enqueue(("append", session_id, message["role"], message["content"]))
+
+    def clear(self, session_id: str):
+        self._enqueue(("clear", session_id))
+
+    def _enqueue(self, op: tuple):
+        with self._flushed:
+            self._pending += 1
+        self._queue.put(op)
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until every write queued so far has been committed"""
+        with self._flushed:
+            self._flushed.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            op = self._queue.get()
+            if op is None:
+                break
+            batch = [op]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    op = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+
+            # Keep the writer alive whatever happens; a dead writer would leave every later write pending
+            try:
+                self._write_batch(conn, batch)
+            except Exception as e:
+                logger.error(f"Session writer failed on a batch of {len(batch)} changes: {str(e)}")
+            if self.ttl_seconds > 0 and time.time() - self._last_expiry > 60:
+                try:
+                    self._expire(conn)
+                except Exception as e:
+                    logger.error(f"Session writer failed to expire idle sessions: {str(e)}")
+            if stop:
+                break
+        conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[tuple]):
+        now = time.time()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op in batch:
+                session_id = op[1]
+                row = conn.execute(
+                    "SELECT version FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                version = (row[0] if row else 0) + 1
+                if op[0] == "append":
+                    conn.execute(
+                        "INSERT INTO messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                        (session_id, version, op[2], op[3])
+                    )
+                    conn.execute(
+                        "DELETE FROM messages WHERE session_id = ? AND seq <= ?",
+                        (session_id, version - self.max_messages)
+                    )
+                else:
+                    conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                conn.execute(
+                    "INSERT INTO sessions (session_id, version, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET version = excluded.version, updated_at = excluded.updated_at",
+                    (session_id, version, now)
+                )
+            conn.execute("COMMIT")
+            self.batches_written += 1
+            self.writes += len(batch)
+        except sqlite3.Error as e:
+            # BEGIN itself may have failed (e.g. "database is locked"), leaving nothing to roll back
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self.write_errors += len(batch)
+            logger.error(f"Failed to write {len(batch)} session changes: {str(e)}")
+        finally:
+            with self._flushed:
+                self._pending -= len(batch)
+                self._flushed.notify_all()
+
+    def _expire(self, conn: sqlite3.Connection):
+        self._last_expiry = time.time()
+        cutoff = self._last_expiry - self.ttl_seconds
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE updated_at < ?)",
+                (cutoff,)
+            )
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error(f"Failed to expire idle sessions: {str(e)}")
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        with self._read_lock:
+            self._read_conn.close()
+        logger.info("SQLite session backend closed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "pending_writes": self._pending,
+            "writes": self.writes,
+            "batches_written": self.batches_written,
+            "write_errors": self.write_errors,
+        }
+
+
+class _JournalEntry:
+    """One retained message: its text until written, then its place in the journal"""
+    __slots__ = ("version", "message", "location")
+
+    def __init__(self, version: int, message: Optional[Dict[str, str]] = None, location: Optional[Tuple[str, int, int]] = None):
+        self.version = version
+        self.message = message
+        # (file name, offset, length) of the record
+        self.location = location
+
+
+class _JournalSession:
+    __slots__ = ("version", "updated_at", "entries")
+
+    def __init__(self, max_messages: int):
+        self.version = 0
+        self.updated_at = 0.0
+        self.entries: Deque[_JournalEntry] = deque(maxlen=max_messages)
+
+
+class JournalSessionBackend(SessionBackend):
+    """
+    Session backend stored in an append-only journal on local disk, so
+    conversation history survives a restart of a single-process
+    deployment.
+
+    Appends and clears are queued and written by a background thread in
+    batches, one fsync per batch, as tab-separated lines to numbered
+    segment files. The index in memory holds each session's version and
+    the positions of its last max_messages records; message text is read
+    from disk when a session is first loaded. Periodically (and on close)
+    the live state is compacted into a snapshot and older files are
+    deleted. On startup the newest snapshot and the segments after it are
+    scanned to rebuild the index, skipping sessions idle longer than the
+    TTL. The directory must not be shared by several processes.
+    """
+    def __init__(
+        self,
+        directory: str,
+        max_messages: int = 20,
+        ttl_seconds: float = 3600.0,
+        flush_interval: float = 0.05,
+        batch_size: int = 256,
+        segment_bytes: int = 16 * 1024 * 1024,
+        snapshot_interval: float = 300.0,
+    ):
+        """
+        Replay the journal and start the writer thread.
+
+        Args:
+            directory (str): Directory holding the journal files
+            max_messages (int): Messages kept per session
+            ttl_seconds (float): Idle time after which a session is dropped
+            flush_interval (float): Maximum delay before queued writes are written and synced
+            batch_size (int): Maximum number of writes per batch
+            segment_bytes (int): Size after which a new segment file is started
+            snapshot_interval (float): Seconds between compactions; 0 = only on close
+        """
+        self.directory = directory
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.segment_bytes = segment_bytes
+        self.snapshot_interval = snapshot_interval
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "LOCK"), "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise RuntimeError(f"Session journal {directory} is in use by another process")
+
+        # Guards the index and the journal files against the writer thread
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, _JournalSession] = {}
+        self._readers: Dict[str, IO[bytes]] = {}
+        self._files: List[str] = []
+        self._next_number = 1
+
+        self.replayed_records = 0
+        self.replay_seconds = 0.0
+        # Records and sessions the next compaction can drop from disk
+        self._replayed_stale = 0
+        self._replay()
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._flushed = threading.Condition()
+        self._pending = 0
+        self._closed = False
+        self._segment: Optional[IO[bytes]] = None
+        self._segment_name = ""
+        self._last_expiry = time.time()
+        self._last_snapshot = time.monotonic()
+        self._writes_since_snapshot = self._replayed_stale
+
+        self.batches_written = 0
+        self.writes = 0
+        self.write_errors = 0
+        self.snapshots = 0
+        self.bytes_written = 0
+
+        self._writer = threading.Thread(target=self._write_loop, name="session-journal", daemon=True)
+        self._writer.start()
+        logger.info(
+            f"Session journal opened at {directory}: {len(self._sessions)} sessions "
+            f"from {self.replayed_records} records in {self.replay_seconds:.3f}s"
+        )
+
+    @staticmethod
+    def _file_number(name: str) -> int:
+        return int(name.split("-", 1)[1].split(".", 1)[0])
+
+    @staticmethod
+    def _encode(op: str, session_id: str, version: int, timestamp: float, message: Optional[Dict[str, str]] = None) -> bytes:
+        # JSON-encoded fields never contain a raw tab or newline
+        payload = json.dumps(message) if message is not None else ""
+        return f"{op}\t{json.dumps(session_id)}\t{version}\t{timestamp:.3f}\t{payload}\n".encode("utf-8")
+
+    def _apply(self, op: str, session_id: str, version: int, timestamp: float, location: Tuple[str, int, int]):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _JournalSession(self.max_messages)
+        # Versions make replay idempotent: a record already reflected is skipped
+        if version <= session.version:
+            return
+        session.version = version
+        session.updated_at = timestamp
+        if op == "a":
+            session.entries.append(_JournalEntry(version, location=location))
+        else:
+            session.entries.clear()
+
+    def _replay(self):
+        started = time.monotonic()
+        names = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                # Left by a compaction that did not finish
+                os.remove(os.path.join(self.directory, name))
+            elif name.endswith(".log"):
+                names.append(name)
+        snapshots = sorted((name for name in names if name.startswith("snapshot-")), key=self._file_number)
+        segments = sorted((name for name in names if name.startswith("segment-")), key=self._file_number)
+        base = self._file_number(snapshots[-1]) if snapshots else 0
+        if names:
+            self._next_number = max(self._file_number(name) for name in names) + 1
+
+        # Files older than the newest snapshot were compacted into it
+        for name in snapshots[:-1] + [name for name in segments if self._file_number(name) < base]:
+            os.remove(os.path.join(self.directory, name))
+        self._files = snapshots[-1:] + [name for name in segments if self._file_number(name) > base]
+
+        for name in self._files:
+            offset = 0
+            with open(os.path.join(self.directory, name), "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn write at the end of a segment
+                        logger.warning(f"Ignoring incomplete record at the end of {name}")
+                        break
+                    try:
+                        op, session_id, version, timestamp, _ = line.split(b"\t", 4)
+                        self._apply(op.decode(), json.loads(session_id), int(version), float(timestamp), (name, offset, len(line)))
+                        self.replayed_records += 1
+                    except ValueError:
+                        logger.warning(f"Skipping unreadable record at offset {offset} of {name}")
+                    offset += len(line)
+
+        # Only recently active sessions are kept
+        if self.ttl_seconds > 0:
+            cutoff = time.time() - self.ttl_seconds
+            recent = {
+                session_id: session for session_id, session in self._sessions.items()
+                if session.updated_at >= cutoff
+            }
+            self._replayed_stale += len(self._sessions) - len(recent)
+            self._sessions = recent
+        self._replayed_stale += sum(1 for name in self._files if name.startswith("segment-"))
+        self.replay_seconds = time.monotonic() - started
+
+    def _read(self, location: Tuple[str, int, int]) -> Dict[str, str]:
+        name, offset, length = location
+        reader = self._readers.get(name)
+        if reader is None:
+            reader = self._readers[name] = open(os.path.join(self.directory, name), "rb")
+        reader.seek(offset)
+        payload = reader.read(length).split(b"\t", 4)[4]
+        return json.loads(payload)
+
+    def get_version(self, session_id: str) -> int:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.version if session is not None else 0
+
+    def load(self, session_id: str, limit: int) -> Tuple[List[Dict[str, str]], int]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return [], 0
+            entries = list(session.entries)[-limit:] if limit > 0 else []
+            messages = [entry.message if entry.message is not None else self._read(entry.location) for entry in entries]
+            return messages, session.version
+
+    def append(self, session_id: str, message: Dict[str, str]):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _JournalSession(self.max_messages)
+            session.version += 1
+            session.updated_at = time.time()
+            entry = _JournalEntry(session.version, message=message)
+            session.entries.append(entry)
+            op = ("a", session_id, session.version, session.updated_at, message, entry)
+        self._enqueue(op)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _JournalSession(self.max_messages)
+            session.version += 1
+            session.updated_at = time.time()
+            session.entries.clear()
+            op = ("c", session_id, session.version, session.updated_at, None, None)
+        self._enqueue(op)
+
+    def _enqueue(self, op: tuple):
+        with self._flushed:
+            self._pending += 1
+        self._queue.put(op)
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until every write queued so far has been synced to disk"""
+        with self._flushed:
+            self._flushed.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def _write_loop(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                break
+            batch = [op]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    op = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+
+            self._write_batch(batch)
+            if self.ttl_seconds > 0 and time.time() - self._last_expiry > 60:
+                self._expire()
+            if (
+                self.snapshot_interval > 0 and self._writes_since_snapshot
+                and time.monotonic() - self._last_snapshot > self.snapshot_interval
+            ):
+                self._compact()
+            if stop:
+                break
+        # Leave a compact journal behind for a fast restart
+        if self._writes_since_snapshot:
+            self._compact()
+        self._close_segment()
+
+    def _open_segment(self) -> IO[bytes]:
+        if self._segment is None or self._segment.tell() >= self.segment_bytes:
+            self._close_segment()
+            self._segment_name = f"segment-{self._next_number:08d}.log"
+            self._next_number += 1
+            self._segment = open(os.path.join(self.directory, self._segment_name), "ab")
+            with self._lock:
+                self._files.append(self._segment_name)
+        return self._segment
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _write_batch(self, batch: List[tuple]):
+        try:
+            segment = self._open_segment()
+            offset = segment.tell()
+            buffer = bytearray()
+            placed = []
+            for op, session_id, version, timestamp, message, entry in batch:
+                record = self._encode(op, session_id, version, timestamp, message)
+                if entry is not None:
+                    placed.append((entry, (self._segment_name, offset + len(buffer), len(record))))
+                buffer += record
+            segment.write(buffer)
+            segment.flush()
+            os.fsync(segment.fileno())
+            with self._lock:
+                for entry, location in placed:
+                    entry.location = location
+                    entry.message = None
+            self.batches_written += 1
+            self.writes += len(batch)
+            self.bytes_written += len(buffer)
+            self._writes_since_snapshot += len(batch)
+        except OSError as e:
+            # Entries keep their text, so the history is still served until restart
+            self.write_errors += len(batch)
+            logger.error(f"Failed to write {len(batch)} session changes to the journal: {str(e)}")
+            self._close_segment()
+        finally:
+            with self._flushed:
+                self._pending -= len(batch)
+                self._flushed.notify_all()
+
+    def _expire(self):
+        self._last_expiry = time.time()
+        cutoff = self._last_expiry - self.ttl_seconds
+        with self._lock:
+            expired = [session_id for session_id, session in self._sessions.items() if session.updated_at < cutoff]
+            for session_id in expired:
+                del self._sessions[session_id]
+        if expired:
+            # Dropped from disk by the next compaction
+            self._writes_since_snapshot += len(expired)
+
+    def _compact(self):
+        """Write the live sessions to a new snapshot and delete the files it replaces"""
+        self._close_segment()
+        name = f"snapshot-{self._next_number:08d}.log"
+        self._next_number += 1
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            sessions = [
+                (session_id, session.version, session.updated_at, list(session.entries))
+                for session_id, session in self._sessions.items()
+            ]
+            replaced = list(self._files)
+        placed = []
+        try:
+            # Only this thread deletes journal files, so the old ones stay readable meanwhile
+            with open(path + ".tmp", "wb") as f:
+                for session_id, version, updated_at, entries in sessions:
+                    base = entries[0].version - 1 if entries else version
+                    f.write(self._encode("c", session_id, base, updated_at))
+                    for entry in entries:
+                        message = entry.message
+                        if message is None:
+                            with self._lock:
+                                message = self._read(entry.location)
+                        record = self._encode("a", session_id, entry.version, updated_at, message)
+                        placed.append((entry, (name, f.tell(), len(record))))
+                        f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.error(f"Failed to compact the session journal: {str(e)}")
+            try:
+                os.remove(path + ".tmp")
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            for entry, location in placed:
+                entry.location = location
+                entry.message = None
+            for old in replaced:
+                reader = self._readers.pop(old, None)
+                if reader is not None:
+                    reader.close()
+                try:
+                    os.remove(os.path.join(self.directory, old))
+                except OSError as e:
+                    logger.warning(f"Could not delete compacted journal file {old}: {str(e)}")
+            self._files = [name] + [old for old in self._files if old not in replaced]
+        self.snapshots += 1
+        self._writes_since_snapshot = 0
+        self._last_snapshot = time.monotonic()
+        logger.info(f"Compacted session journal into {name}: {len(sessions)} sessions")
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            for reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
+        self._lock_file.close()
+        logger.info("Session journal closed")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            files = list(self._files)
+            sessions = len(self._sessions)
+        journal_bytes = 0
+        for name in files:
+            try:
+                journal_bytes += os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        return {
+            "backend": "journal",
+            "directory": self.directory,
+            "sessions": sessions,
+            "files": len(files),
+            "journal_bytes": journal_bytes,
+            "pending_writes": self._pending,
+            "writes": self.writes,
+            "batches_written": self.batches_written,
+            "bytes_written": self.bytes_written,
+            "write_errors": self.write_errors,
+            "snapshots": self.snapshots,
+            "replayed_records": self.replayed_records,
+            "replay_seconds": round(self.replay_seconds, 4),
+        }
@@ -0,0 +1,234 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from services.session_backends import SessionBackend
+
+# Rough per-message overhead of the dict and deque slot, in bytes
+MESSAGE_OVERHEAD_BYTES = 64
+
+
+def message_size(message: Dict[str, str]) -> int:
+    """Approximate memory cost of a stored message in bytes"""
+    return len(message["role"]) + len(message["content"]) + MESSAGE_OVERHEAD_BYTES
+
+
+class Session:
+    """Conversation history for one session, kept in a fixed-size ring buffer"""
+    __slots__ = ("messages", "size_bytes", "last_access", "version")
+
+    def __init__(self, max_messages: int):
+        self.messages: Deque[Dict[str, str]] = deque(maxlen=max_messages)
+        self.size_bytes = 0
+        self.last_access = time.monotonic()
+        # Backend version this copy reflects, including local writes
+        self.version = 0
+
+
+class SessionManager:
+    """
+    Bounded in-memory session store for conversation history.
+    Sessions are kept in least-recently-used order and evicted when they
+    sit idle longer than the TTL, or when the store exceeds its session
+    count or memory budget.
+
+    With a backend, the in-memory store becomes a read-through cache:
+    writes are forwarded to the backend and a cached session is reloaded
+    whenever the backend reports a newer version, so several workers can
+    share conversation state. Backend reads run in a worker thread, so a
+    slow disk or a locked database does not stall the event loop.
+    """
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        max_messages: int = 20,
+        ttl_seconds: float = 3600.0,
+        max_total_bytes: int = 64 * 1024 * 1024,
+        backend: Optional[SessionBackend] = None,
+    ):
+        """
+        Initialize the session store.
+
+        Args:
+            max_sessions (int): Maximum number of sessions kept in memory
+            max_messages (int): Messages kept per session; older ones are dropped
+            ttl_seconds (float): Idle time after which a session expires
+            max_total_bytes (int): Approximate memory budget for all messages
+            backend (SessionBackend, optional): Shared storage behind the cache
+        """
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.max_total_bytes = max_total_bytes
+        self.backend = backend
+
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.total_bytes = 0
+
+        self.evicted_expired = 0
+        self.evicted_lru = 0
+        self.evicted_budget = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _touch(self, session_id: str) -> Optional[Session]:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_access = time.monotonic()
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def _remove(self, session_id: str) -> Optional[Session]:
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            self.total_bytes -= session.size_bytes
+        return session
+
+    def expire_idle(self) -> int:
+        """
+        Drop sessions idle longer than the TTL. Sessions are kept in
+        access order, so only the expired ones at the front are visited.
+
+        Returns:
+            int: Number of sessions expired
+        """
+        if self.ttl_seconds <= 0:
+            return 0
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = 0
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session.last_access > cutoff:
+                break
+            self._remove(session_id)
+            expired += 1
+        self.evicted_expired += expired
+        return expired
+
+    def _enforce_limits(self, keep: str):
+        while len(self.sessions) > self.max_sessions:
+            session_id = next(iter(self.sessions))
+            if session_id == keep:
+                break
+            self._remove(session_id)
+            self.evicted_lru += 1
+        while self.total_bytes > self.max_total_bytes and len(self.sessions) > 1:
+            session_id = next(iter(self.sessions))
+            if session_id == keep:
+                break
+            self._remove(session_id)
+            self.evicted_budget += 1
+
+    def _add_to_session(self, session: Session, message: Dict[str, str]):
+        # The ring buffer drops the oldest message when full
+        if len(session.messages) == session.messages.maxlen:
+            dropped = message_size(session.messages[0])
+            session.size_bytes -= dropped
+            self.total_bytes -= dropped
+
+        session.messages.append(message)
+        size = message_size(message)
+        session.size_bytes += size
+        self.total_bytes += size
+
+    async def _read_through(self, session_id: str) -> Optional[Session]:
+        """Return the cached session, reloading it if the backend has a newer version"""
+        version = await asyncio.to_thread(self.backend.get_version, session_id)
+        # Look the session up after the read; other requests may have changed it meanwhile
+        session = self._touch(session_id)
+        # A cached version ahead of the backend means local writes are still queued
+        if (session is not None and session.version >= version) or (session is None and version == 0):
+            self.cache_hits += 1
+            return session
+
+        self.cache_misses += 1
+        messages, version = await asyncio.to_thread(self.backend.load, session_id, self.max_messages)
+        session = self._touch(session_id)
+        if session is not None and session.version >= version:
+            # Written locally while the load ran
+            return session
+        self._remove(session_id)
+        session = Session(self.max_messages)
+        session.version = version
+        for message in messages:
+            self._add_to_session(session, message)
+        self.sessions[session_id] = session
+        self._enforce_limits(keep=session_id)
+        return session
+
+    async def get_conversation_history(self, session_id: str) -> List[Dict[str, str]]:
+        """Get conversation history for a session"""
+        self.expire_idle()
+        if self.backend is not None:
+            session = await self._read_through(session_id)
+        else:
+            session = self._touch(session_id)
+        if session is None:
+            return []
+        return list(session.messages)
+
+    async def add_message(self, session_id: str, role: str, content: str):
+        """Add a message to session history"""
+        self.expire_idle()
+        if self.backend is not None:
+            session = await self._read_through(session_id)
+        else:
+            session = self._touch(session_id)
+        if session is None:
+            session = Session(self.max_messages)
+            self.sessions[session_id] = session
+
+        message = {"role": role, "content": content}
+        self._add_to_session(session, message)
+        if self.backend is not None:
+            session.version += 1
+            self.backend.append(session_id, message)
+
+        self._enforce_limits(keep=session_id)
+
+    async def clear_session(self, session_id: str):
+        """Clear conversation history for a session"""
+        session = self._remove(session_id)
+        if self.backend is not None:
+            # Keep an empty copy one version ahead so reads before the clear
+            # is flushed do not reload the old history
+            if session is None:
+                version = await asyncio.to_thread(self.backend.get_version, session_id)
+                # Drop anything written while the version was read
+                session = self._remove(session_id)
+                if session is not None:
+                    version = max(version, session.version)
+            else:
+                version = session.version
+            cleared = Session(self.max_messages)
+            cleared.version = version + 1
+            self.sessions[session_id] = cleared
+            self.backend.clear(session_id)
+
+    def close(self):
+        """Flush pending writes and close the backend"""
+        if self.backend is not None:
+            self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get session store size and eviction counters.
+
+        Returns:
+            dict: Session store statistics
+        """
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "messages": sum(len(session.messages) for session in self.sessions.values()),
+            "total_bytes": self.total_bytes,
+            "max_total_bytes": self.max_total_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "evicted_expired": self.evicted_expired,
+            "evicted_lru": self.evicted_lru,
+            "evicted_budget": self.evicted_budget,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "backend": self.backend.stats() if self.backend is not None else {"backend": "memory"},
+        }
@@ -0,0 +1,117 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from services.metrics import MetricsRegistry
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical upstream calls.
+    The first caller for a key starts the call; callers that arrive with
+    the same key while it is outstanding await the same result instead of
+    issuing their own request.
+    """
+    def __init__(self, metrics: Optional[MetricsRegistry] = None):
+        """
+        Initialize the coalescer.
+
+        Args:
+            metrics (MetricsRegistry, optional): Registry for the in-flight and
+                waiter gauges and the leader/coalesced counter, labelled by
+                route rather than by key so label cardinality stays bounded
+        """
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        # Key -> route of the caller that started the call
+        self._routes: Dict[str, str] = {}
+
+        self.leaders = 0
+        self.coalesced = 0
+
+        self._requests_total = None
+        if metrics is not None:
+            self._requests_total = metrics.counter(
+                "single_flight_requests_total", "Upstream calls started (leader) or shared (coalesced)", ["route", "result"]
+            )
+            metrics.gauge("single_flight_in_flight", "Distinct upstream calls being shared", callback=lambda: len(self._calls))
+            metrics.gauge(
+                "single_flight_waiters", "Callers awaiting a shared upstream call", ["route"],
+                callback=lambda: {(route,): count for route, count in self.waiters_by_route().items()},
+            )
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], route: str = "default") -> Any:
+        """
+        Run fn once per key among concurrent callers.
+
+        The call runs in its own task, so a caller that is cancelled (for
+        example because its client disconnected) does not cancel the call
+        for the others.
+
+        Args:
+            key (str): Identity of the upstream request
+            fn (callable): Zero-argument coroutine function making the call
+            route (str): Route label for the metrics ("chat", "image_analysis", ...)
+
+        Returns:
+            The result of fn; exceptions are raised to every caller
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            self._routes[key] = route
+            task.add_done_callback(lambda _: self._forget(key, task))
+            result = "leader"
+        else:
+            self.coalesced += 1
+            result = "coalesced"
+        if self._requests_total is not None:
+            self._requests_total.inc(route=route, result=result)
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if key in self._waiters:
+                self._waiters[key] -= 1
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+            del self._routes[key]
+        # Mark the exception as retrieved when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def waiters_by_route(self) -> Dict[str, int]:
+        """
+        Count callers awaiting shared calls, by the route that started each call.
+
+        Returns:
+            dict: Route -> waiting callers
+        """
+        waiters: Dict[str, int] = {}
+        for key, count in self._waiters.items():
+            route = self._routes[key]
+            waiters[route] = waiters.get(route, 0) + count
+        return waiters
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get in-flight calls and waiter counts.
+
+        Returns:
+            dict: Single-flight statistics
+        """
+        busiest = sorted(self._waiters.items(), key=lambda item: item[1], reverse=True)[:20]
+        return {
+            "in_flight": len(self._calls),
+            "waiters": sum(self._waiters.values()),
+            "waiters_by_key": {key[:24]: count for key, count in busiest},
+            "waiters_by_route": self.waiters_by_route(),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,122 @@
+import asyncio
+import builtins
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Imports listed in the startup log
+REPORTED_IMPORTS = 5
+
+
+class StartupReport:
+    """
+    Timings of application startup and the readiness flag.
+
+    Records how long each module imported by the application took to load,
+    how long each initializer took, and how long each warm-up step took.
+    The application is ready once every warm-up step has finished; until
+    then it answers health checks but not readiness checks.
+    """
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self.initializers: Dict[str, float] = {}
+        self.warmup: Dict[str, float] = {}
+        self.warmup_errors: Dict[str, str] = {}
+        self.pending: List[str] = []
+        self.ready = False
+        self.ready_after: Optional[float] = None
+        self._original_import = None
+
+    def track_imports(self):
+        """
+        Start timing modules imported from here on (until stop_tracking_imports).
+        Only imports not loaded yet are timed, each including the modules it
+        pulls in.
+        """
+        original = self._original_import = builtins.__import__
+        depth = 0
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            nonlocal depth
+            if depth or level or name in sys.modules:
+                return original(name, globals, locals, fromlist, level)
+            depth += 1
+            started = time.perf_counter()
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                depth -= 1
+                self.imports[name] = self.imports.get(name, 0.0) + time.perf_counter() - started
+
+        builtins.__import__ = timed_import
+
+    def stop_tracking_imports(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    @contextmanager
+    def initializer(self, name: str):
+        """Time an initializer that runs while the application is imported"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.initializers[name] = time.perf_counter() - started
+
+    async def warm_up(self, steps: Dict[str, Callable[[], Awaitable[Any]]]):
+        """
+        Run the warm-up steps concurrently, then mark the application ready.
+        A failing step is logged and recorded but does not block readiness.
+
+        Args:
+            steps (dict): Step name to coroutine function
+        """
+        self.pending = list(steps)
+
+        async def run(name: str, step: Callable[[], Awaitable[Any]]):
+            started = time.perf_counter()
+            try:
+                await step()
+            except Exception as e:
+                logger.warning(f"Warm-up step {name} failed: {str(e)}")
+                self.warmup_errors[name] = str(e)
+            finally:
+                self.warmup[name] = time.perf_counter() - started
+                self.pending.remove(name)
+
+        await asyncio.gather(*(run(name, step) for name, step in steps.items()))
+        self.ready = True
+        self.ready_after = time.perf_counter() - self.started_at
+        slowest = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:REPORTED_IMPORTS]
+        logger.info(
+            f"Ready {self.ready_after:.3f}s after import started "
+            f"(imports {sum(self.imports.values()):.3f}s, initializers {sum(self.initializers.values()):.3f}s, "
+            f"warm-up {max(self.warmup.values(), default=0.0):.3f}s); slowest imports: "
+            + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in slowest)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the startup timings.
+
+        Returns:
+            dict: Readiness and per-import, per-initializer and per-warm-up-step seconds
+        """
+        def rounded(timings: Dict[str, float]) -> Dict[str, float]:
+            return {name: round(seconds, 4) for name, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True)}
+
+        return {
+            "ready": self.ready,
+            "ready_after_seconds": round(self.ready_after, 3) if self.ready_after is not None else None,
+            "pending": list(self.pending),
+            "imports": rounded(self.imports),
+            "initializers": rounded(self.initializers),
+            "warmup": rounded(self.warmup),
+            "warmup_errors": dict(self.warmup_errors),
+        }
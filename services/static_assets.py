@@ -0,0 +1,217 @@
+import asyncio
+import gzip
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+from typing import Any, Dict, Optional
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from services.image_upload import PILLOW_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip variants are still served
+    brotli = None
+
+# Compressible asset types
+TEXT_MEDIA_TYPES = ("text/css", "text/javascript", "application/javascript", "image/svg+xml", "application/json", "text/plain")
+
+# Images worth offering as WebP to browsers that accept it
+CONVERTIBLE_MEDIA_TYPES = ("image/png", "image/jpeg")
+
+FINGERPRINT_LENGTH = 12
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class Asset:
+    """One static file with its fingerprint and precomputed variants"""
+    def __init__(self, path: str, body: bytes, media_type: str):
+        self.path = path
+        self.body = body
+        self.media_type = media_type
+        self.digest = hashlib.sha256(body).hexdigest()[:FINGERPRINT_LENGTH]
+        base, extension = os.path.splitext(path)
+        self.fingerprinted_path = f"{base}.{self.digest}{extension}"
+        # Content coding ("br", "gzip") -> compressed body
+        self.encodings: Dict[str, bytes] = {}
+        self.webp: Optional[bytes] = None
+
+
+class StaticAssets:
+    """
+    Static file handler with fingerprinted, precompressed assets.
+
+    build() reads every file under the directory once, names it by a hash
+    of its content (css/styles.css -> css/styles.<hash>.css), and prepares
+    gzip and Brotli variants of text assets and WebP variants of PNG and
+    JPEG images. Fingerprinted URLs are served with immutable cache
+    headers; the plain URLs keep working with ETag revalidation, and files
+    that were not built are served from disk as before.
+    """
+    def __init__(self, directory: str, optimize: bool = True):
+        """
+        Initialize the handler.
+
+        Args:
+            directory (str): Static files directory
+            optimize (bool): Fingerprint and precompress assets in build();
+                when False every file is served from disk
+        """
+        self.directory = directory
+        self.optimize = optimize
+        self.files = StaticFiles(directory=directory)
+
+        self._assets: Dict[str, Asset] = {}
+        self._by_fingerprint: Dict[str, Asset] = {}
+        self.build_seconds = 0.0
+        # Bumped by every build, so pages embedding asset URLs know to re-render
+        self.generation = 0
+
+    def build(self):
+        """Fingerprint and precompress every file; CPU-bound, so run it off the event loop"""
+        if not self.optimize:
+            return
+        assets = {}
+        for root, _, names in os.walk(self.directory):
+            for name in sorted(names):
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                try:
+                    assets[path] = self._build_asset(path, full_path)
+                except Exception as e:
+                    logger.warning(f"Serving {path} unoptimized: {str(e)}")
+        self._assets = assets
+        self._by_fingerprint = {asset.fingerprinted_path: asset for asset in assets.values()}
+        self.generation += 1
+
+    def _build_asset(self, path: str, full_path: str) -> Asset:
+        with open(full_path, "rb") as f:
+            body = f.read()
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        asset = Asset(path, body, media_type)
+        if media_type in TEXT_MEDIA_TYPES or media_type.startswith("text/"):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                asset.encodings["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    asset.encodings["br"] = compressed
+        elif media_type in CONVERTIBLE_MEDIA_TYPES and PILLOW_AVAILABLE and body:
+            from PIL import Image
+
+            with Image.open(io.BytesIO(body)) as image:
+                output = io.BytesIO()
+                image.save(output, format="WEBP", quality=85, method=6)
+            if output.tell() < len(body):
+                asset.webp = output.getvalue()
+        return asset
+
+    async def start(self):
+        """Build the assets in a worker thread"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.to_thread(self.build)
+        self.build_seconds = loop.time() - started
+        if self._assets:
+            logger.info(f"Built {len(self._assets)} static assets in {self.build_seconds:.3f}s")
+
+    def url(self, path: str) -> str:
+        """
+        URL of a static file, fingerprinted once the assets are built.
+
+        Args:
+            path (str): Path relative to the static directory, e.g. "css/styles.css"
+
+        Returns:
+            str: URL path under /static
+        """
+        path = path.lstrip("/")
+        asset = self._assets.get(path)
+        return f"/static/{asset.fingerprinted_path if asset else path}"
+
+    def _response(self, asset: Asset, fingerprinted: bool, headers: Headers, method: str) -> Response:
+        body = asset.body
+        media_type = asset.media_type
+        variant = ""
+        response_headers = {
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if fingerprinted else REVALIDATE_CACHE_CONTROL,
+        }
+        if asset.encodings:
+            response_headers["Vary"] = "Accept-Encoding"
+            accepted = {coding.split(";")[0].strip() for coding in headers.get("accept-encoding", "").split(",")}
+            for coding in ("br", "gzip"):
+                if coding in asset.encodings and coding in accepted:
+                    body = asset.encodings[coding]
+                    response_headers["Content-Encoding"] = coding
+                    variant = f"-{coding}"
+                    break
+        elif asset.webp is not None:
+            response_headers["Vary"] = "Accept"
+            if "image/webp" in headers.get("accept", ""):
+                body = asset.webp
+                media_type = "image/webp"
+                variant = "-webp"
+
+        etag = f'"{asset.digest}{variant}"'
+        response_headers["ETag"] = etag
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=response_headers)
+        if method == "HEAD":
+            response_headers["Content-Length"] = str(len(body))
+            return Response(status_code=200, media_type=media_type, headers=response_headers)
+        return Response(body, media_type=media_type, headers=response_headers)
+
+    @staticmethod
+    def _route_path(scope) -> str:
+        """Path relative to the mount point, as StaticFiles.get_path resolves it"""
+        path = scope["path"]
+        # Starlette 0.27 strips the mount prefix from path; newer versions keep
+        # the full path and record the prefix in root_path
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path) and path[len(root_path):len(root_path) + 1] in ("", "/"):
+            return path[len(root_path):]
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            path = self._route_path(scope).lstrip("/")
+            asset = self._by_fingerprint.get(path)
+            fingerprinted = asset is not None
+            if asset is None:
+                asset = self._assets.get(path)
+            if asset is not None:
+                response = self._response(asset, fingerprinted, Headers(scope=scope), scope["method"])
+                await response(scope, receive, send)
+                return
+        await self.files(scope, receive, send)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get built assets and their compressed sizes.
+
+        Returns:
+            dict: Static asset statistics
+        """
+        assets: Dict[str, Dict[str, Any]] = {}
+        for path, asset in self._assets.items():
+            variants = {coding: len(body) for coding, body in asset.encodings.items()}
+            if asset.webp is not None:
+                variants["webp"] = len(asset.webp)
+            assets[path] = {"url": self.url(path), "bytes": len(asset.body), "variants": variants}
+        return {
+            "optimized": self.optimize,
+            "brotli": brotli is not None,
+            "build_seconds": round(self.build_seconds, 3),
+            "assets": assets,
+        }
@@ -0,0 +1,61 @@
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Average characters per token for English text with GPT tokenizers
+CHARS_PER_TOKEN = 4
+
+# Tokens charged for one high-detail image at the default downscaled
+# resolution (768 px short side: 85 base + 170 per 512 px tile)
+IMAGE_TOKENS_ESTIMATE = 765
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """Load the tiktoken encoding once, if tiktoken is installed"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.info(f"tiktoken unavailable ({str(e)}); using approximate token counts")
+            _encoding = None
+    return _encoding
+
+
+def load_encoding() -> bool:
+    """
+    Load the tiktoken encoding now rather than on first use. tiktoken
+    downloads the encoding file the first time unless it is cached (see
+    TIKTOKEN_CACHE_DIR), so call this off the event loop.
+
+    Returns:
+        bool: Whether token counts use tiktoken
+    """
+    return _get_encoding() is not None
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """
+    Count the tokens in a piece of text.
+
+    Uses tiktoken when it is installed and falls back to a
+    characters-per-token estimate otherwise.
+
+    Args:
+        text (str): Text to count
+
+    Returns:
+        int: Number of tokens
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
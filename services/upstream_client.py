@@ -0,0 +1,433 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+from services.endpoint_pool import Endpoint, EndpointPool, NoEndpointAvailable
+from services.metrics import MetricsRegistry
+from services.resilience import RETRYABLE_STATUSES, CircuitBreaker, RetryPolicy, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamClient:
+    """
+    Shared, app-lifetime HTTP client for all upstream LLM calls.
+    Keeps one pooled httpx.AsyncClient, created on first use, so TCP/TLS
+    connections to the endpoint are reused across requests instead of
+    re-established per call.
+    Each route is served by an endpoint pool; calls go through the chosen
+    endpoint's rate limiter and circuit breaker and are retried, on another
+    endpoint when one is available, on throttling and transient errors
+    within the route's deadline.
+    """
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        connect_timeout: float = 10.0,
+        pool_timeout: float = 10.0,
+        route_timeouts: Optional[Dict[str, float]] = None,
+        default_timeout: float = 30.0,
+        metrics: Optional[MetricsRegistry] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        pools: Optional[Dict[str, EndpointPool]] = None,
+    ):
+        """
+        Initialize the upstream client settings. The underlying connection
+        pool is created by start() (or lazily on first use).
+
+        Args:
+            max_connections (int): Maximum number of concurrent connections
+            max_keepalive_connections (int): Idle connections kept alive for reuse
+            keepalive_expiry (float): Seconds an idle connection is kept open
+            http2 (bool): Negotiate HTTP/2 when the h2 package is available
+            connect_timeout (float): Timeout for establishing a connection
+            pool_timeout (float): Timeout for waiting on a free pooled connection
+            route_timeouts (dict, optional): Read timeouts keyed by route name
+            default_timeout (float): Read timeout for routes not in route_timeouts
+            metrics (MetricsRegistry, optional): Registry for per-route connect,
+                time-to-first-byte and total latency and response status counts
+            retry_policy (RetryPolicy, optional): Retry and backoff settings
+            pools (dict, optional): Endpoint pools keyed by route name
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and self._http2_available()
+        self.connect_timeout = connect_timeout
+        self.pool_timeout = pool_timeout
+        self.route_timeouts = route_timeouts or {}
+        self.default_timeout = default_timeout
+
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.pools = pools or {}
+
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # Pool usage counters
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self.saturated_requests = 0
+        self.pool_timeouts = 0
+        self.errors = 0
+        self.retries = 0
+
+        self.metrics = metrics
+        if metrics is not None:
+            self._phase_seconds = metrics.histogram(
+                "upstream_request_phase_seconds",
+                "Upstream latency by route and phase (connect, ttfb, total)",
+                ["route", "phase"],
+            )
+            self._responses = metrics.counter(
+                "upstream_responses_total", "Upstream responses by route and status code", ["route", "status"]
+            )
+            self._connections_opened = metrics.counter(
+                "upstream_connections_opened_total", "New upstream connections (not reused from the pool)", ["route"]
+            )
+            self._retries = metrics.counter(
+                "upstream_retries_total", "Upstream retries by route and reason", ["route", "reason"]
+            )
+            metrics.gauge("upstream_requests_in_flight", "Upstream requests in flight", callback=lambda: self.in_flight)
+            metrics.gauge(
+                "upstream_circuit_open", "1 while an endpoint's circuit breaker rejects calls", ["pool", "endpoint"],
+                callback=lambda: self._per_endpoint(lambda endpoint: int(endpoint.circuit_breaker.state != CircuitBreaker.CLOSED)),
+            )
+            metrics.gauge(
+                "upstream_rate_limit_wait_seconds_total", "Time calls spent waiting for an endpoint's rate limiter", ["pool", "endpoint"],
+                callback=lambda: self._per_endpoint(lambda endpoint: endpoint.rate_limiter.total_wait_seconds),
+            )
+
+    def _per_endpoint(self, value) -> Dict[Tuple[str, str], float]:
+        return {
+            (pool.name, endpoint.name): value(endpoint)
+            for pool in self.pools.values()
+            for endpoint in pool.endpoints
+        }
+
+    @staticmethod
+    def _http2_available() -> bool:
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            logger.warning("h2 package not installed; upstream client will use HTTP/1.1")
+            return False
+
+    async def start(self):
+        """Create the pooled client if it does not exist yet"""
+        self._create_client()
+
+    def _create_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=self.timeout_for(None),
+            )
+            logger.info(
+                f"Upstream client started (max_connections={self.max_connections}, "
+                f"keepalive={self.max_keepalive_connections}, http2={self.http2})"
+            )
+
+    async def close(self):
+        """Close the pooled client and release all connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("Upstream client closed")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._create_client()
+        return self._client
+
+    async def warm_up(self, timeout: float = 5.0) -> int:
+        """
+        Open a pooled connection to every endpoint ahead of the first call,
+        so it does not pay for the TCP and TLS handshakes.
+
+        Args:
+            timeout (float): Seconds to wait for each endpoint
+
+        Returns:
+            int: Number of endpoints that answered
+        """
+        urls = list(dict.fromkeys(
+            endpoint.url for pool in self.pools.values() for endpoint in pool.endpoints if endpoint.url
+        ))
+
+        async def touch(url: str) -> bool:
+            try:
+                # Any status will do; only the connection is kept
+                await self.client.head(url, timeout=timeout)
+                return True
+            except httpx.HTTPError as e:
+                logger.warning(f"Could not pre-warm connection to {url}: {str(e)}")
+                return False
+
+        results = await asyncio.gather(*(touch(url) for url in urls))
+        return sum(results)
+
+    def timeout_for(self, route: Optional[str]) -> httpx.Timeout:
+        """
+        Build the timeout for a route.
+
+        Args:
+            route (str, optional): Route name such as "text" or "vision"
+
+        Returns:
+            httpx.Timeout: Timeout with the route's read timeout
+        """
+        read_timeout = self.route_timeouts.get(route, self.default_timeout)
+        return httpx.Timeout(
+            read_timeout,
+            connect=self.connect_timeout,
+            pool=self.pool_timeout,
+        )
+
+    def _acquire(self):
+        if self.in_flight >= self.max_connections:
+            self.saturated_requests += 1
+        self.in_flight += 1
+        self.total_requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _release(self, error: Optional[BaseException]):
+        self.in_flight -= 1
+        if isinstance(error, httpx.PoolTimeout):
+            self.pool_timeouts += 1
+        if error is not None:
+            self.errors += 1
+
+    def _trace(self, route: str, start: float):
+        """Build an httpcore trace hook recording connect time and TTFB"""
+        connect: Dict[str, float] = {}
+
+        async def trace(event: str, info: Dict[str, Any]):
+            if event == "connection.connect_tcp.started":
+                connect["start"] = time.perf_counter()
+            elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                connect["end"] = time.perf_counter()
+            elif event.endswith(".receive_response_headers.complete"):
+                if "start" in connect and "end" in connect:
+                    self._connections_opened.inc(route=route)
+                    self._phase_seconds.observe(connect["end"] - connect["start"], route=route, phase="connect")
+                self._phase_seconds.observe(time.perf_counter() - start, route=route, phase="ttfb")
+
+        return trace
+
+    def _attempt_timeout(self, remaining: float) -> httpx.Timeout:
+        remaining = max(remaining, 0.001)
+        return httpx.Timeout(
+            remaining,
+            connect=min(self.connect_timeout, remaining),
+            pool=min(self.pool_timeout, remaining),
+        )
+
+    async def _send(self, method: str, route: Optional[str], stream: bool, token_cost: int, kwargs: Dict[str, Any]) -> Tuple[httpx.Response, EndpointPool, Endpoint]:
+        """
+        Send a request to the route's endpoint pool with rate limiting,
+        circuit breaking and retries. A failed or throttled attempt is
+        retried on another endpoint right away when one is available. All
+        attempts share the route's deadline, so retrying never makes a
+        request wait longer than a single attempt was allowed to.
+
+        Returns:
+            tuple: The final response (unread when streaming), and the pool
+                and endpoint that served it; the caller must release it
+
+        Raises:
+            NoEndpointAvailable: If no endpoint can take the call before the deadline
+            RateLimitExceeded: If the quota has no room before the deadline
+            httpx.TransportError: If the last attempt failed to connect or timed out
+        """
+        route_label = route or "default"
+        pool = self.pools.get(route)
+        if pool is None:
+            raise NoEndpointAvailable(f"No endpoint pool for route {route_label}")
+        deadline = time.monotonic() + self.route_timeouts.get(route, self.default_timeout)
+        tried = set()
+        retry = 0
+        while True:
+            try:
+                endpoint = pool.select(token_cost, exclude=tried)
+            except NoEndpointAvailable:
+                # Wait out throttling if it ends in time; open circuits fail fast
+                wait = pool.next_available_in()
+                if wait is None or time.monotonic() + wait >= deadline:
+                    raise
+                await asyncio.sleep(wait)
+                continue
+
+            endpoint.circuit_breaker.before_call()
+            started = None
+            try:
+                await endpoint.rate_limiter.acquire(token_cost, deadline)
+                extensions = dict(kwargs.get("extensions") or {})
+                if self.metrics is not None:
+                    extensions["trace"] = self._trace(route_label, time.perf_counter())
+                headers = dict(kwargs.get("headers") or {})
+                if endpoint.api_key:
+                    headers["Authorization"] = f"Bearer {endpoint.api_key}"
+                request = self.client.build_request(
+                    method, endpoint.url,
+                    timeout=self._attempt_timeout(deadline - time.monotonic()),
+                    extensions=extensions,
+                    headers=headers,
+                    **{key: value for key, value in kwargs.items() if key not in ("extensions", "headers")},
+                )
+                started = pool.begin(endpoint)
+                response = await self.client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                pool.end(endpoint, started, "failure")
+                error, response, retry_after = e, None, None
+                reason = type(e).__name__
+            except BaseException:
+                if started is None:
+                    endpoint.circuit_breaker.abandon()
+                else:
+                    pool.end(endpoint, started, "cancelled")
+                raise
+            else:
+                status = response.status_code
+                retry_after = parse_retry_after(response.headers) if status in RETRYABLE_STATUSES else None
+                if status == 429:
+                    outcome = "throttled"
+                elif status >= 500 or status == 408:
+                    outcome = "failure"
+                else:
+                    outcome = "success"
+                pool.end(endpoint, started, outcome, retry_after, release=False)
+                if status not in RETRYABLE_STATUSES:
+                    return response, pool, endpoint
+                reason = str(status)
+
+            tried.add(endpoint.name)
+            retry += 1
+            if pool.can_fail_over(tried):
+                delay = 0.0
+            else:
+                delay = self.retry_policy.delay(retry, retry_after)
+            if retry > self.retry_policy.max_retries or time.monotonic() + delay >= deadline:
+                if response is None:
+                    raise error
+                return response, pool, endpoint
+            if response is not None:
+                pool.release(endpoint)
+                await response.aclose()
+            self.retries += 1
+            if self.metrics is not None:
+                self._retries.inc(route=route_label, reason=reason)
+            logger.warning(
+                f"Retrying upstream {route_label} call in {delay:.2f}s after {reason} "
+                f"from {endpoint.name} (retry {retry})"
+            )
+            await asyncio.sleep(delay)
+
+    def _observe_end(self, route: Optional[str], start: float, status: str):
+        if self.metrics is not None:
+            route = route or "default"
+            self._phase_seconds.observe(time.perf_counter() - start, route=route, phase="total")
+            self._responses.inc(route=route, status=status)
+
+    async def post(self, route: Optional[str] = None, token_cost: int = 0, **kwargs: Any) -> httpx.Response:
+        """
+        Send a POST request to the route's endpoint pool.
+
+        Args:
+            route (str, optional): Route name used to pick the endpoint pool and timeout
+            token_cost (int): Estimated tokens, charged to the TPM limit
+            **kwargs: Extra arguments passed to httpx.AsyncClient.build_request
+
+        Returns:
+            httpx.Response: The upstream response
+        """
+        await self.start()
+        self._acquire()
+        start = time.perf_counter()
+        error = None
+        status = "error"
+        try:
+            response, pool, endpoint = await self._send("POST", route, False, token_cost, kwargs)
+            pool.release(endpoint)
+            status = str(response.status_code)
+            return response
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._release(error)
+            self._observe_end(route, start, status)
+
+    @asynccontextmanager
+    async def stream(self, method: str, route: Optional[str] = None, token_cost: int = 0, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """
+        Open a streaming request to the route's endpoint pool. The connection
+        counts as in flight, and as outstanding on its endpoint, until the
+        context exits. Retries only happen before the response is handed
+        out, never mid-stream.
+
+        Args:
+            method (str): HTTP method
+            route (str, optional): Route name used to pick the endpoint pool and timeout
+            token_cost (int): Estimated tokens, charged to the TPM limit
+            **kwargs: Extra arguments passed to httpx.AsyncClient.build_request
+
+        Yields:
+            httpx.Response: The upstream response with an unread body
+        """
+        await self.start()
+        self._acquire()
+        start = time.perf_counter()
+        error = None
+        status = "error"
+        try:
+            response, pool, endpoint = await self._send(method, route, True, token_cost, kwargs)
+            status = str(response.status_code)
+            try:
+                yield response
+            finally:
+                pool.release(endpoint)
+                await response.aclose()
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._release(error)
+            self._observe_end(route, start, status)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get connection pool usage counters.
+
+        Returns:
+            dict: Pool limits and usage counters
+        """
+        return {
+            "started": self._client is not None,
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "utilization": round(self.in_flight / self.max_connections, 3) if self.max_connections else 0.0,
+            "total_requests": self.total_requests,
+            "saturated_requests": self.saturated_requests,
+            "pool_timeouts": self.pool_timeouts,
+            "errors": self.errors,
+            "retries": self.retries,
+            "pools": {route: pool.stats() for route, pool in self.pools.items()},
+        }
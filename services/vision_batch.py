@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PackedReplyError(ValueError):
+    """Raised when the reply to a packed call cannot be split into its answers"""
+
+
+class VisionTask:
+    """
+    One distinct (image, prompt) question in a batch. Items that upload the
+    same image bytes with the same prompt share a task, so it is asked once.
+    """
+    def __init__(self, image_hash: str, prompt: str):
+        self.image_hash = image_hash
+        self.prompt = prompt
+        self.items: List[int] = []
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.image_hash, self.prompt
+
+
+def group_tasks(items: List[Tuple[str, str]]) -> List[VisionTask]:
+    """
+    Deduplicate batch items into tasks.
+
+    Args:
+        items (list): (image hash, prompt) per item, in request order
+
+    Returns:
+        list: Tasks in order of first appearance, each listing its item indices
+    """
+    tasks: Dict[Tuple[str, str], VisionTask] = {}
+    for index, (image_hash, prompt) in enumerate(items):
+        task = tasks.get((image_hash, prompt))
+        if task is None:
+            task = tasks[(image_hash, prompt)] = VisionTask(image_hash, prompt)
+        task.items.append(index)
+    return list(tasks.values())
+
+
+def pack_tasks(tasks: List[VisionTask], max_images: int, max_tasks: int) -> List[List[VisionTask]]:
+    """
+    Pack tasks into as few upstream calls as the limits allow. Tasks about
+    the same image go into the same call where possible, so each image is
+    sent once per call.
+
+    Args:
+        tasks (list): Tasks to pack
+        max_images (int): Distinct images per call
+        max_tasks (int): Questions per call
+
+    Returns:
+        list: Calls, each a list of tasks
+    """
+    by_image: Dict[str, List[VisionTask]] = {}
+    for task in tasks:
+        by_image.setdefault(task.image_hash, []).append(task)
+
+    calls: List[List[VisionTask]] = []
+    current: List[VisionTask] = []
+    current_images = set()
+    for image_hash, image_tasks in by_image.items():
+        for task in image_tasks:
+            new_image = image_hash not in current_images
+            if current and (len(current) >= max_tasks or (new_image and len(current_images) >= max_images)):
+                calls.append(current)
+                current, current_images = [], set()
+            current.append(task)
+            current_images.add(image_hash)
+    if current:
+        calls.append(current)
+    return calls
+
+
+def build_packed_content(call: List[VisionTask], image_urls: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    Build the user message content asking several questions about several
+    images in one call, with the answers requested as a JSON array.
+
+    Args:
+        call (list): Tasks of the call
+        image_urls (dict): Image hash to data URL
+
+    Returns:
+        list: Content parts: numbered images followed by the numbered questions
+    """
+    image_numbers: Dict[str, int] = {}
+    for task in call:
+        image_numbers.setdefault(task.image_hash, len(image_numbers) + 1)
+
+    content: List[Dict[str, Any]] = []
+    for image_hash, number in image_numbers.items():
+        content.append({"type": "text", "text": f"Image {number}:"})
+        content.append({"type": "image_url", "image_url": {"url": image_urls[image_hash]}})
+    questions = "\n".join(
+        f"{number}. About image {image_numbers[task.image_hash]}: {task.prompt}"
+        for number, task in enumerate(call, start=1)
+    )
+    content.append({"type": "text", "text": (
+        f"Answer each of these {len(call)} requests separately, each on its own as if it were the only one:\n"
+        f"{questions}\n\n"
+        f'Reply with a JSON object {{"answers": [...]}} holding exactly {len(call)} strings, in order.'
+    )})
+    return content
+
+
+def parse_packed_reply(text: str, count: int) -> List[str]:
+    """
+    Parse the answers of a packed call.
+
+    Args:
+        text (str): Model reply
+        count (int): Number of questions asked
+
+    Returns:
+        list: One answer per question
+
+    Raises:
+        PackedReplyError: If the reply is not a JSON object with `count` string answers
+    """
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise PackedReplyError(f"Packed reply is not JSON: {str(e)}") from e
+    answers = data.get("answers") if isinstance(data, dict) else None
+    if not isinstance(answers, list) or len(answers) != count or not all(isinstance(a, str) for a in answers):
+        raise PackedReplyError(f"Expected {count} answers in the packed reply")
+    return answers
+
+
+async def run_calls(
+    calls: List[List[VisionTask]],
+    analyze: Callable[[List[VisionTask]], Awaitable[List[str]]],
+    max_concurrency: int,
+) -> AsyncIterator[Tuple[VisionTask, Optional[str], Optional[Exception]]]:
+    """
+    Run calls concurrently, at most max_concurrency at a time, yielding each
+    task's answer as soon as its call completes. A packed call whose reply
+    cannot be split (analyze raises PackedReplyError) is run again as one
+    call per task, each taking its own turn under the concurrency limit.
+    Pending calls are cancelled if the consumer stops early (e.g. the
+    client disconnected).
+
+    Args:
+        calls (list): Calls from pack_tasks()
+        analyze (callable): Coroutine function answering a call's tasks in order
+        max_concurrency (int): Calls in flight at once
+
+    Yields:
+        tuple: (task, answer, None) or (task, None, error)
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def run(call: List[VisionTask]):
+        async with semaphore:
+            try:
+                answers = await analyze(call)
+            except PackedReplyError as e:
+                if len(call) > 1:
+                    # The model did not keep the answers apart; ask each question on its own
+                    logger.warning(f"Could not split packed vision reply ({str(e)}); retrying {len(call)} tasks separately")
+                    workers.extend(asyncio.ensure_future(run([task])) for task in call)
+                    return
+                logger.error(f"Batch vision call failed: {str(e)}")
+                results.put_nowait((call[0], None, e))
+                return
+            except Exception as e:
+                logger.error(f"Batch vision call failed: {str(e)}")
+                for task in call:
+                    results.put_nowait((task, None, e))
+                return
+        for task, answer in zip(call, answers):
+            results.put_nowait((task, answer, None))
+
+    workers = [asyncio.ensure_future(run(call)) for call in calls]
+    try:
+        for _ in range(sum(len(call) for call in calls)):
+            yield await results.get()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from services.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to connections reaped for inactivity (1001 = going away)
+IDLE_CLOSE_CODE = 1001
+
+
+class WebSocketChatSession:
+    """
+    Serves chat over one WebSocket connection.
+
+    Messages are pipelined: the connection keeps reading while replies are
+    generated, with at most max_in_flight generations running at once. A
+    new message for a session cancels that session's unfinished reply (or,
+    with cancel_on_new_message off, waits for it so history stays in
+    order), and all generations are cancelled when the socket goes away.
+    A heartbeat pings the client and closes the socket when nothing has
+    been received for idle_timeout seconds.
+
+    Client frames:
+        {"message": str, "session_id"?: str, "request_id"?: str}
+        {"type": "cancel", "request_id": str}
+        {"type": "ping"} / {"type": "pong"}
+
+    Server frames:
+        {"type": "delta" | "done" | "cancelled" | "error" | "ping" | "pong", ...}
+    """
+    def __init__(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        reply_stream: Callable[[str, str], AsyncIterator[str]],
+        max_in_flight: int = 4,
+        cancel_on_new_message: bool = True,
+        heartbeat_interval: float = 20.0,
+        idle_timeout: float = 60.0,
+        metrics: Optional[MetricsRegistry] = None,
+        send_text: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        """
+        Initialize the session.
+
+        Args:
+            websocket (WebSocket): The accepted connection
+            client_id (str): Client ID from the URL, the default session ID
+            reply_stream (callable): Async generator function taking
+                (session_id, message) and yielding reply deltas
+            max_in_flight (int): Maximum concurrent generations on this connection
+            cancel_on_new_message (bool): Cancel a session's unfinished reply
+                when a new message for it arrives
+            heartbeat_interval (float): Seconds between server pings; 0 disables them
+            idle_timeout (float): Seconds without any client frame (and no
+                generation running) before the socket is closed; 0 disables it
+            metrics (MetricsRegistry, optional): Registry for request outcome counters
+            send_text (callable, optional): Coroutine function sending a text
+                frame, when other senders share the socket; defaults to a
+                locked websocket.send_text
+        """
+        self.websocket = websocket
+        self.client_id = client_id
+        self.reply_stream = reply_stream
+        self.max_in_flight = max_in_flight
+        self.cancel_on_new_message = cancel_on_new_message
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+
+        self.last_seen = time.monotonic()
+        self.closed_reason: Optional[str] = None
+        self._send_lock = asyncio.Lock()
+        self._send_text = send_text or self._locked_send_text
+        self._generations: Dict[str, asyncio.Task] = {}
+        self._latest_by_session: Dict[str, Tuple[str, asyncio.Task]] = {}
+
+        self._requests = None
+        if metrics is not None:
+            self._requests = metrics.get("websocket_requests_total") or metrics.counter(
+                "websocket_requests_total", "WebSocket chat requests by outcome", ["outcome"]
+            )
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._generations)
+
+    def _count(self, outcome: str):
+        if self._requests is not None:
+            self._requests.inc(outcome=outcome)
+
+    async def _locked_send_text(self, text: str):
+        async with self._send_lock:
+            await self.websocket.send_text(text)
+
+    async def send(self, frame: Dict[str, Any]):
+        """Send a JSON frame; generations and the heartbeat share the socket"""
+        await self._send_text(json.dumps(frame))
+
+    async def run(self) -> str:
+        """
+        Serve the connection until the client leaves or is reaped.
+
+        Returns:
+            str: Why the session ended ("disconnect", "idle" or "error")
+        """
+        receiver = asyncio.ensure_future(self._receive_loop())
+        heartbeat = asyncio.ensure_future(self._heartbeat())
+        try:
+            await asyncio.wait({receiver, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for _ in self._generations:
+                self._count("cancelled")
+            for task in (receiver, heartbeat, *self._generations.values()):
+                task.cancel()
+            await asyncio.gather(receiver, heartbeat, *self._generations.values(), return_exceptions=True)
+
+        if self.closed_reason == "idle":
+            try:
+                await self.websocket.close(code=IDLE_CLOSE_CODE)
+            except Exception:
+                pass
+        return self.closed_reason or "disconnect"
+
+    async def _receive_loop(self):
+        try:
+            while True:
+                data = await self.websocket.receive_text()
+                self.last_seen = time.monotonic()
+                await self._handle(data)
+        except WebSocketDisconnect:
+            self.closed_reason = self.closed_reason or "disconnect"
+        except Exception as e:
+            logger.warning(f"WebSocket {self.client_id} receive failed: {str(e)}")
+            self.closed_reason = self.closed_reason or "error"
+
+    async def _heartbeat(self):
+        if self.heartbeat_interval <= 0 and self.idle_timeout <= 0:
+            await asyncio.Event().wait()
+        interval = min(t for t in (self.heartbeat_interval, self.idle_timeout) if t > 0)
+        while True:
+            await asyncio.sleep(interval)
+            if self.in_flight:
+                # A reply is being streamed, so the connection is in use
+                self.last_seen = time.monotonic()
+            elif self.idle_timeout > 0 and time.monotonic() - self.last_seen >= self.idle_timeout:
+                logger.info(f"Closing idle WebSocket {self.client_id}")
+                self.closed_reason = "idle"
+                return
+            if self.heartbeat_interval > 0:
+                try:
+                    await asyncio.wait_for(self.send({"type": "ping"}), timeout=interval)
+                except Exception:
+                    logger.info(f"WebSocket {self.client_id} heartbeat failed; closing")
+                    self.closed_reason = "error"
+                    return
+
+    async def _handle(self, data: str):
+        try:
+            message_data = json.loads(data)
+            if not isinstance(message_data, dict):
+                raise json.JSONDecodeError("Expected an object", data, 0)
+        except json.JSONDecodeError:
+            await self.send({"type": "error", "error": "Invalid JSON format", "session_id": self.client_id})
+            return
+
+        frame_type = message_data.get("type", "message")
+        if frame_type == "ping":
+            await self.send({"type": "pong"})
+        elif frame_type == "pong":
+            pass
+        elif frame_type == "cancel":
+            await self._cancel(str(message_data.get("request_id")))
+        elif frame_type == "message":
+            await self._start_generation(message_data)
+        else:
+            await self.send({"type": "error", "error": f"Unknown frame type '{frame_type}'", "session_id": self.client_id})
+
+    async def _start_generation(self, message_data: Dict[str, Any]):
+        user_message = message_data.get("message", "")
+        session_id = message_data.get("session_id", self.client_id)
+        request_id = str(message_data.get("request_id") or uuid.uuid4().hex)
+
+        previous = None
+        if session_id in self._latest_by_session:
+            previous_id, previous = self._latest_by_session[session_id]
+            if self.cancel_on_new_message:
+                await self._cancel(previous_id)
+                previous = None
+        if self.in_flight >= self.max_in_flight or request_id in self._generations:
+            self._count("rejected")
+            error = "Duplicate request_id" if request_id in self._generations else "Too many requests in flight"
+            await self.send({"type": "error", "error": error, "request_id": request_id, "session_id": session_id})
+            return
+
+        task = asyncio.ensure_future(self._generate(request_id, session_id, user_message, previous))
+        self._generations[request_id] = task
+        self._latest_by_session[session_id] = (request_id, task)
+        task.add_done_callback(lambda _: self._forget(request_id, session_id, task))
+
+    async def _cancel(self, request_id: str):
+        """Cancel a generation, free its in-flight slot right away and tell the client"""
+        task = self._generations.pop(request_id, None)
+        if task is None:
+            return
+        task.cancel()
+        self._count("cancelled")
+        await self.send({"type": "cancelled", "request_id": request_id})
+
+    def _forget(self, request_id: str, session_id: str, task: asyncio.Task):
+        if self._generations.get(request_id) is task:
+            del self._generations[request_id]
+        if self._latest_by_session.get(session_id, (None, None))[1] is task:
+            del self._latest_by_session[session_id]
+        if not task.cancelled():
+            task.exception()
+
+    async def _generate(self, request_id: str, session_id: str, user_message: str, previous: Optional[asyncio.Task]):
+        """Stream one reply, after the session's previous reply when queued behind it"""
+        try:
+            if previous is not None:
+                # wait() rather than gather(), so cancelling this reply leaves the previous one running
+                await asyncio.wait({previous})
+            parts = []
+            async for delta in self.reply_stream(session_id, user_message):
+                parts.append(delta)
+                await self.send({"type": "delta", "delta": delta, "request_id": request_id, "session_id": session_id})
+            await self.send({"type": "done", "reply": "".join(parts), "request_id": request_id, "session_id": session_id})
+            self._count("completed")
+        except Exception as e:
+            self._count("error")
+            logger.error(f"WebSocket {self.client_id} generation failed: {str(e)}")
+            await self.send({"type": "error", "error": "Failed to generate a reply", "request_id": request_id, "session_id": session_id})
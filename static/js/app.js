@@ -37,6 +37,9 @@ document.addEventListener('DOMContentLoaded', () => {
     
     // State
     let sessionId = generateSessionId();
+    
+    // Assistant profile selected with ?profile=<id> (the server default if absent)
+    const profileId = new URLSearchParams(window.location.search).get('profile');
     let selectedFile = null;
     let animationEnabled = true;
     
@@ -254,37 +257,97 @@ document.addEventListener('DOMContentLoaded', () => {
         // Show loading indicator
         showLoading();
         
+        let textDiv = null;
+        let reply = '';
+        
         try {
-            // Send message to API
-            const response = await fetch('/api/chat', {
+            // Request a streamed reply so tokens render as they arrive
+            const response = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
                     message,
-                    session_id: sessionId
+                    session_id: sessionId,
+                    profile: profileId
                 })
             });
             
-            const data = await response.json();
-            
-            // Update session ID if provided
-            if (data.session_id) {
-                sessionId = data.session_id;
+            if (!response.ok || !response.body) {
+                throw new Error(`Streaming request failed with status ${response.status}`);
             }
             
-            // Add assistant response to chat
-            addMessage('assistant', data.reply);
+            await readEventStream(response, (event, data) => {
+                if (event === 'start' && data.session_id) {
+                    sessionId = data.session_id;
+                } else if (event === 'message' && data.delta) {
+                    // Hide loading indicator once the first token arrives
+                    if (!textDiv) {
+                        hideLoading();
+                        textDiv = addMessage('assistant', '');
+                    }
+                    reply += data.delta;
+                    setMessageText(textDiv, reply);
+                    chatMessages.scrollTop = chatMessages.scrollHeight;
+                } else if (event === 'done') {
+                    reply = data.reply;
+                    if (!textDiv) {
+                        textDiv = addMessage('assistant', reply);
+                    } else {
+                        setMessageText(textDiv, reply);
+                    }
+                }
+            });
         } catch (error) {
             console.error('Error sending message:', error);
-            addMessage('assistant', 'Sorry, I encountered an error while processing your message. Please try again.');
+            if (!textDiv) {
+                addMessage('assistant', 'Sorry, I encountered an error while processing your message. Please try again.');
+            }
         } finally {
             // Hide loading indicator
             hideLoading();
         }
     }
     
+    /**
+     * Read a server-sent event stream from a fetch response
+     * @param {Response} response - The streaming fetch response
+     * @param {Function} onEvent - Called with (event name, parsed data) for each event
+     */
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        data += line.slice(5).trim();
+                    }
+                });
+                
+                if (data) {
+                    onEvent(event, JSON.parse(data));
+                }
+            }
+        }
+    }
+    
     /**
      * Handle image upload
      * @param {File} file - The uploaded image file
@@ -327,6 +390,9 @@ document.addEventListener('DOMContentLoaded', () => {
         formData.append('file', selectedFile);
         formData.append('prompt', prompt);
         formData.append('session_id', sessionId);
+        if (profileId) {
+            formData.append('profile', profileId);
+        }
         
         try {
             // Send image to API
@@ -362,6 +428,7 @@ document.addEventListener('DOMContentLoaded', () => {
      * Add a message to the chat
      * @param {string} role - The role of the message sender ('user' or 'assistant')
      * @param {string} content - The message content
+     * @returns {HTMLElement} The message text container
      */
     function addMessage(role, content) {
         // Create message elements
@@ -376,8 +443,8 @@ document.addEventListener('DOMContentLoaded', () => {
         
         const avatarImg = document.createElement('img');
         avatarImg.src = role === 'user' 
-            ? '/static/images/user-avatar.png' 
-            : '/static/images/avatar.png';
+            ? (document.body.dataset.userAvatar || '/static/images/user-avatar.png') 
+            : (document.body.dataset.assistantAvatar || '/static/images/avatar.png');
         avatarImg.alt = role === 'user' ? 'User' : 'Assistant';
         
         const contentDiv = document.createElement('div');
@@ -385,14 +452,7 @@ document.addEventListener('DOMContentLoaded', () => {
         
         const textDiv = document.createElement('div');
         textDiv.className = 'message-text';
-        
-        // Split content by paragraphs and create paragraph elements
-        const paragraphs = content.split('\n').filter(p => p.trim());
-        paragraphs.forEach(paragraph => {
-            const p = document.createElement('p');
-            p.textContent = paragraph;
-            textDiv.appendChild(p);
-        });
+        setMessageText(textDiv, content);
         
         const timeDiv = document.createElement('div');
         timeDiv.className = 'message-time';
@@ -410,6 +470,25 @@ document.addEventListener('DOMContentLoaded', () => {
         
         // Scroll to bottom
         chatMessages.scrollTop = chatMessages.scrollHeight;
+        
+        return textDiv;
+    }
+    
+    /**
+     * Render message content as paragraphs
+     * @param {HTMLElement} textDiv - The message text container
+     * @param {string} content - The message content
+     */
+    function setMessageText(textDiv, content) {
+        textDiv.replaceChildren();
+        
+        // Split content by paragraphs and create paragraph elements
+        const paragraphs = content.split('\n').filter(p => p.trim());
+        paragraphs.forEach(paragraph => {
+            const p = document.createElement('p');
+            p.textContent = paragraph;
+            textDiv.appendChild(p);
+        });
     }
     
     /**
@@ -468,7 +547,7 @@ document.addEventListener('DOMContentLoaded', () => {
         resultsContent.innerHTML = '<div style="text-align: center; padding: 60px;"><i class="fas fa-spinner fa-spin" style="font-size: 2rem; color: var(--primary-color);"></i><p style="margin-top: 15px;">Generating your image...</p></div>';
         
         try {
-            const response = await fetch('/api/image-generation', {
+            const response = await fetch('/api/image-generation/jobs', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -478,13 +557,20 @@ document.addEventListener('DOMContentLoaded', () => {
                     style: imageStyle.value,
                     quality: imageQuality.value,
                     size: imageSize.value,
-                    session_id: sessionId
+                    session_id: sessionId,
+                    profile: profileId
                 })
             });
             
-            const data = await response.json();
+            const job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.detail || 'Failed to queue image generation');
+            }
+            
+            // The job runs in the background; long-poll until it finishes
+            const data = await waitForImageJob(job.status_url);
             
-            if (response.ok) {
+            if (data) {
                 // Show generated image
                 generatedImage.src = data.image_url;
                 generatedImage.alt = `Generated: ${data.prompt_used}`;
@@ -520,8 +606,6 @@ document.addEventListener('DOMContentLoaded', () => {
                     resultsContent.classList.add('fade-in');
                 }
                 
-            } else {
-                throw new Error(data.detail || 'Failed to generate image');
             }
             
         } catch (error) {
@@ -541,6 +625,25 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
+    /**
+     * Wait for a queued image generation job and return its result
+     */
+    async function waitForImageJob(statusUrl) {
+        while (true) {
+            const response = await fetch(`${statusUrl}?wait=25`);
+            const job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.detail || 'Image generation job was lost');
+            }
+            if (job.status === 'succeeded') {
+                return job.result;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Failed to generate image');
+            }
+        }
+    }
+    
     /**
      * Handle image regeneration
      */